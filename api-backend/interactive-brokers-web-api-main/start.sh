@@ -1,3 +1,8 @@
 cd gateway && sh bin/run.sh root/conf.yaml &
-cd webapp && python3 -m venv venv && . venv/bin/activate && venv/bin/pip install flask requests
-flask --app app run --debug -p 5056 -h 0.0.0.0
\ No newline at end of file
+cd webapp && python3 -m venv venv && . venv/bin/activate && venv/bin/pip install -r requirements.txt
+if [ "$WEBAPP_MODE" = "production" ]; then
+    # Multi-worker server; see gunicorn.conf.py for WEBAPP_WORKERS, WEBAPP_THREADS, WEBAPP_TIMEOUT
+    gunicorn -c gunicorn.conf.py app:app
+else
+    flask --app app run --debug -p 5056 -h 0.0.0.0
+fi
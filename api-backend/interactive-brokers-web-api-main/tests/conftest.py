@@ -0,0 +1,4 @@
+import os, sys
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'webapp')
+sys.path.insert(0, WEBAPP_DIR)
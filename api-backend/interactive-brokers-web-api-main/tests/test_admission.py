@@ -0,0 +1,51 @@
+import gzip, json
+import pytest
+from flask import Flask
+import admission
+from responses import json_response
+
+PAYLOAD = {"rows": [{"conid": i, "symbol": f"SYM{i}"} for i in range(200)]}
+
+
+@pytest.fixture
+def client_and_controller():
+    app = Flask(__name__)
+
+    @app.route("/api/report")
+    def report():
+        return json_response(PAYLOAD)
+
+    controller = admission.init_app(app, {"report": admission.LOW})
+    return app.test_client(), controller
+
+
+def test_shed_low_route_replays_compressed_body_with_its_headers(client_and_controller):
+    client, controller = client_and_controller
+    fresh = client.get("/api/report", headers={"Accept-Encoding": "gzip"})
+    assert fresh.headers["Content-Encoding"] == "gzip"
+
+    controller.low.limit = 0
+    stale = client.get("/api/report", headers={"Accept-Encoding": "gzip"})
+    assert stale.status_code == 200
+    assert stale.headers["Warning"].startswith("110")
+    assert stale.headers["Content-Encoding"] == "gzip"
+    assert stale.headers["ETag"] == fresh.headers["ETag"]
+    assert "Accept-Encoding" in stale.headers["Vary"]
+    assert json.loads(gzip.decompress(stale.get_data())) == PAYLOAD
+
+
+def test_shed_replay_never_sends_another_encoding(client_and_controller):
+    client, controller = client_and_controller
+    client.get("/api/report", headers={"Accept-Encoding": "gzip"})
+
+    controller.low.limit = 0
+    identity = client.get("/api/report", headers={"Accept-Encoding": "identity"})
+    assert identity.status_code == 503
+    assert "Content-Encoding" not in identity.headers
+
+    controller.low.limit = 10
+    client.get("/api/report", headers={"Accept-Encoding": "identity"})
+    controller.low.limit = 0
+    identity = client.get("/api/report", headers={"Accept-Encoding": "identity"})
+    assert identity.status_code == 200 and "Content-Encoding" not in identity.headers
+    assert identity.get_json() == PAYLOAD
@@ -0,0 +1,52 @@
+import alerts
+
+
+def test_sync_applies_other_workers_changes_incrementally(tmp_path):
+    path = str(tmp_path / "alerts.sqlite3")
+    # Two engines on one store stand in for two worker processes
+    worker_a = alerts.AlertEngine(path)
+    worker_b = alerts.AlertEngine(path)
+    created = worker_a.create([{"conid": "1", "kind": "above", "level": 110.0},
+                               {"conid": "1", "kind": "below", "level": 90.0},
+                               {"conid": "2", "kind": "move_pct", "pct": 10.0, "reference": 50.0}])
+    worker_b.sync()
+    assert len(worker_b.index) == 3
+    loaded = worker_b.index
+
+    # B claims the above alert and A deletes the move alert; each sees the other's change without a reload
+    assert [alert["id"] for alert in worker_b.evaluate({"1": 111.0})] == [created[0]["id"]]
+    assert worker_a.delete(created[2]["id"])
+    worker_a.sync()
+    worker_b.sync()
+    assert worker_b.index is loaded
+    for engine in (worker_a, worker_b):
+        assert sorted(engine.index.entries) == [created[1]["id"]]
+        assert engine.index.conids() == ["1"]
+
+    # New alerts from A reach B, and a claim by A of one B already dropped is harmless
+    more = worker_a.create([{"conid": "3", "kind": "below", "level": 10.0}])
+    worker_b.sync()
+    assert worker_b.index.evaluate("3", 9.0) == [more[0]["id"]]
+
+
+def test_sync_reloads_when_the_change_log_no_longer_reaches_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "alerts.sqlite3")
+    worker_a = alerts.AlertEngine(path)
+    worker_b = alerts.AlertEngine(path)
+    worker_b.sync()
+
+    monkeypatch.setattr(alerts, "ALERT_CHANGE_LOG", 2)
+    worker_a.create([{"conid": "1", "kind": "above", "level": float(level)} for level in range(100, 110)])
+    worker_b.sync()
+    assert len(worker_b.index) == 10
+
+
+def test_add_many_matches_one_by_one_adds():
+    bulk, single = alerts.AlertIndex(), alerts.AlertIndex()
+    definitions = [(alert_id, "1", 100.0 + alert_id % 7, 90.0 - alert_id % 5) for alert_id in range(200)]
+    bulk.add_many(definitions)
+    for definition in definitions:
+        single.add(*definition)
+    assert list(bulk.above["1"][0]) == list(single.above["1"][0])
+    assert sorted(bulk.evaluate("1", 103.0)) == sorted(single.evaluate("1", 103.0))
+    assert len(bulk) == len(single)
@@ -0,0 +1,118 @@
+import threading
+import pytest
+import change_feed
+import order_tracker
+import position_tracker
+
+
+@pytest.fixture(autouse=True)
+def feed_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, "FEED_PATH", str(tmp_path / "feeds.sqlite3"))
+    monkeypatch.setattr(change_feed, "_local", threading.local())
+
+
+def order(order_id, status="Submitted", filled=0):
+    return {"orderId": order_id, "status": status, "filledQuantity": filled}
+
+
+def test_cursor_survives_a_change_of_worker():
+    # Two trackers on the same feed stand in for two worker processes
+    worker_a = order_tracker.OrderTracker("orders:gw", lambda: (None, None))
+    worker_b = order_tracker.OrderTracker("orders:gw", lambda: (None, None))
+
+    worker_a.apply([order(1), order(2)])
+    feed = worker_a.changes_since(None)
+    assert feed["reset"] and len(feed["orders"]) == 2
+
+    worker_b.apply([order(1, "Filled", 10), order(2)])
+    feed = worker_a.changes_since(feed["cursor"])
+    assert not feed["reset"]
+    assert [(event["type"], event["orderId"]) for event in feed["events"]] == [("filled", 1)]
+
+    # Re-applying the same list from the other worker records nothing new
+    worker_a.apply([order(1, "Filled", 10), order(2)])
+    assert worker_b.changes_since(feed["cursor"])["events"] == []
+
+
+def test_unknown_or_expired_cursor_resets():
+    tracker = order_tracker.OrderTracker("orders:gw", lambda: (None, None))
+    tracker.buffer = 2
+    tracker.apply([order(1)])
+    cursor = tracker.changes_since(None)["cursor"]
+    for status in ("PreSubmitted", "Submitted", "Cancelled"):
+        tracker.apply([order(1, status)])
+
+    assert tracker.changes_since(cursor)["reset"]
+    assert tracker.changes_since("other:1")["reset"]
+
+
+def test_poke_invalidates_and_polls_past_the_claim():
+    calls = []
+    responses = [[order(1)], [order(1), order(2)]]
+    tracker = order_tracker.OrderTracker("orders:gw", lambda: (responses.pop(0), None),
+                                         invalidate=lambda: calls.append("invalidate"))
+    assert tracker.poll() is not None
+    # Within the interval no worker claims another poll
+    assert tracker.poll() is None
+
+    tracker.poke()
+    assert calls == ["invalidate"] and tracker.forced
+    # The poll thread wakes and polls with force set
+    assert [event["type"] for event in tracker.poll(force=True)] == ["new"]
+
+
+def test_position_price_moves_use_shared_reference_prices():
+    worker_a = position_tracker.PositionTracker("positions:gw|U1", lambda: (None, None), move_pct=1)
+    worker_b = position_tracker.PositionTracker("positions:gw|U1", lambda: (None, None), move_pct=1)
+
+    worker_a.apply([{"conid": 1, "position": 10, "mktPrice": 100.0}])
+    cursor = worker_a.changes_since(None)["cursor"]
+    worker_b.apply([{"conid": 1, "position": 10, "mktPrice": 100.5}])
+    worker_a.apply([{"conid": 1, "position": 10, "mktPrice": 101.0}])
+
+    events = worker_b.changes_since(cursor, {"price_moved"})["events"]
+    assert [(event["previousPrice"], event["price"]) for event in events] == [(100.0, 101.0)]
+
+
+def test_subscriber_receives_position_events_from_any_worker():
+    worker_a = position_tracker.PositionTracker("positions:gw|U1", lambda: (None, None), move_pct=1)
+    worker_b = position_tracker.PositionTracker("positions:gw|U1", lambda: (None, None), move_pct=1)
+    # Drive delivery by hand instead of the poll thread
+    worker_a.start = lambda: None
+
+    worker_a.apply([{"conid": 1, "position": 10, "mktPrice": 100.0}])
+    subscription = worker_a.subscribe()
+    first = subscription.get(timeout=0)
+    assert first["reset"] and [p["conid"] for p in first["positions"]] == [1]
+
+    # Events recorded by the other worker reach this worker's subscriber on its next delivery
+    worker_b.apply([{"conid": 1, "position": 15, "mktPrice": 102.0}, {"conid": 2, "position": 5, "mktPrice": 10.0}])
+    worker_b.apply([{"conid": 2, "position": 5, "mktPrice": 10.0}])
+    worker_a.deliver()
+
+    batch = subscription.get(timeout=0)
+    assert not batch["reset"]
+    assert [(event["type"], event["conid"]) for event in batch["events"]] == [
+        ("quantity_changed", "1"), ("price_moved", "1"), ("opened", "2"), ("closed", "1")]
+    assert batch["cursor"] == worker_b.changes_since(None)["cursor"]
+
+    # Nothing new, nothing pushed; after unsubscribing nothing more arrives
+    worker_a.deliver()
+    assert subscription.get(timeout=0) is None
+    worker_a.unsubscribe(subscription)
+    worker_b.apply([])
+    worker_a.deliver()
+    assert subscription.get(timeout=0) is None
+
+
+def test_event_stream_sends_batches_with_their_cursor_and_unsubscribes():
+    tracker = position_tracker.PositionTracker("positions:gw|U1", lambda: (None, None))
+    tracker.start = lambda: None
+    tracker.apply([{"conid": 1, "position": 10, "mktPrice": 100.0}])
+    subscription = tracker.subscribe()
+
+    stream = change_feed.event_stream(tracker, subscription, seconds=0.05)
+    message = next(stream)
+    assert message.startswith(f"id: {subscription.cursor}\nevent: reset\ndata: ")
+    assert list(stream) in ([], [": keepalive\n\n"])
+    assert tracker.subscribers == []
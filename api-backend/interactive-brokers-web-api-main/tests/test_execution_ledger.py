@@ -0,0 +1,75 @@
+import threading, time
+import pytest
+import execution_ledger
+
+
+@pytest.fixture(autouse=True)
+def store_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(execution_ledger, "LEDGER_STORE_PATH", str(tmp_path / "ledger.sqlite3"))
+    monkeypatch.setattr(execution_ledger, "_local", threading.local())
+
+
+NOW = int(time.time() * 1000)
+
+
+def execution(execution_id, side, size, price, time_ms, conid=265598):
+    return {"execution_id": execution_id, "conid": conid, "symbol": "AAPL", "side": side, "size": size,
+            "price": price, "net_amount": size * price, "commission": 1, "trade_time_r": time_ms, "account": "U1"}
+
+
+def realized(conid="265598"):
+    return next(row for row in execution_ledger.realized("U1") if row["conid"] == conid)
+
+
+def test_selling_a_position_held_before_the_first_pull_closes_the_seeded_lot():
+    # 100 shares held now; 20 of them were bought inside the fetched window
+    positions = [{"conid": 265598, "position": 100, "avgCost": 150.0, "avgPrice": 150.0}]
+    fetch_positions = lambda: (positions, None)
+    fetch = lambda days: ([execution("E1", "B", 20, 160.0, NOW - 60000)], None)
+    execution_ledger.refresh("U1", fetch, fetch_positions, min_interval=0)
+
+    row = realized()
+    assert row["complete"]
+    assert [(lot["quantity"], lot["price"]) for lot in row["lots"]] == [(80, 150.0), (20, 160.0)]
+
+    # Later sale of 90 closes the 80 opening shares first, then 10 of the new ones
+    execution_ledger.refresh("U1", lambda days: ([execution("E2", "S", 90, 170.0, NOW + 60000)], None), fetch_positions, min_interval=0)
+    row = realized()
+    assert row["realizedPnl"] == pytest.approx(80 * 20 + 10 * 10)
+    assert row["openQuantity"] == 10
+
+
+def test_out_of_order_rebuild_keeps_the_opening_lot():
+    fetch_positions = lambda: ([{"conid": 265598, "position": 50, "avgCost": 100.0}], None)
+    execution_ledger.refresh("U1", lambda days: ([execution("E2", "S", 10, 110.0, NOW - 60000)], None), fetch_positions, min_interval=0)
+    assert realized()["openQuantity"] == 50
+
+    # A buy from before the seed shows up late: it was already in the position, so the total stays 50
+    execution_ledger.ingest([execution("E1", "B", 5, 105.0, NOW - 120000)], "U1")
+    row = realized()
+    assert row["openQuantity"] == 50
+    # Opening lot 55 at 100, then the late buy of 5 at 105; the sale of 10 closes opening shares
+    assert row["realizedPnl"] == pytest.approx(10 * 10)
+    assert [(lot["quantity"], lot["price"]) for lot in row["lots"]] == [(45, 100.0), (5, 105.0)]
+
+
+def test_unseeded_ledger_is_flagged_incomplete():
+    execution_ledger.ingest([execution("E1", "S", 10, 110.0, 1000)], "U1")
+    assert not realized()["complete"]
+
+
+def test_failed_pull_is_retried_after_the_backoff_only():
+    calls = []
+
+    def failing(days):
+        calls.append(days)
+        return None, "request_failed"
+
+    execution_ledger.refresh("U1", failing, min_interval=60)
+    # Within the retry delay no worker or request pulls again
+    execution_ledger.refresh("U1", failing, min_interval=60)
+    assert len(calls) == 1 and not execution_ledger.ingested("U1")
+
+    execution_ledger.release_refresh("U1", min_interval=60, retry_after=0)
+    execution_ledger.refresh("U1", lambda days: ([], None), lambda: ([], None), min_interval=60)
+    assert execution_ledger.ingested("U1")
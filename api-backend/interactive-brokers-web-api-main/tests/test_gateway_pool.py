@@ -0,0 +1,63 @@
+import gateway_pool
+
+
+def make_pool():
+    statuses = {
+        "https://gw1/v1/api": ({"authenticated": True, "competing": False}, None),
+        "https://gw2/v1/api": ({"authenticated": True, "competing": True}, None),
+    }
+    pool = gateway_pool.GatewayPool(list(statuses), lambda base: statuses[base])
+    pool.check_all()
+    return pool
+
+
+def test_session_paths_stay_on_the_session_instance():
+    pool = make_pool()
+    owner = pool.instances[0]
+    # Keep the owner busy so least-outstanding routing would pick the other instance
+    owner.outstanding = 10
+    for path in ("/iserver/account/orders", "/iserver/reply/abc", "/iserver/marketdata/snapshot?conids=1&fields=31",
+                 "/iserver/account/trades", "/iserver/account/pnl/partitioned", "/iserver/account/U1/order/1"):
+        assert pool.acquire(path) is owner
+
+
+def test_portal_reads_use_the_least_busy_instance():
+    pool = make_pool()
+    pool.instances[0].outstanding = 10
+    for path in ("/portfolio/U1/positions/0", "/iserver/marketdata/history?conid=1&period=1m&bar=1d",
+                 "/iserver/scanner/params", "/iserver/secdef/info?conid=1"):
+        assert pool.acquire(path) is pool.instances[1]
+
+
+def test_session_request_is_not_retried_elsewhere():
+    pool = make_pool()
+    sent = []
+
+    def send(url):
+        sent.append(url)
+        return None, "request_failed"
+
+    assert pool.request(pool.base + "/iserver/marketdata/snapshot?conids=1", "get", send) == (None, "request_failed")
+    assert sent == ["https://gw1/v1/api/iserver/marketdata/snapshot?conids=1"]
+
+
+def test_unmatched_order_instance_falls_back_to_automatic_selection(caplog):
+    statuses = {
+        "https://gw1/v1/api": ({"authenticated": True, "competing": False}, None),
+        "https://gw2/v1/api": ({"authenticated": True, "competing": False}, None),
+    }
+    pool = gateway_pool.GatewayPool(list(statuses), lambda base: statuses[base], order_instance="https://gw3/v1/api")
+    assert "not in GATEWAY_POOL" in caplog.text
+    pool.check_all()
+    assert pool.owner is pool.instances[0]
+    assert pool.acquire("/iserver/account/orders") is pool.instances[0]
+
+
+def test_order_instance_may_name_the_gateway_root():
+    statuses = {
+        "https://gw1/v1/api": ({"authenticated": True, "competing": False}, None),
+        "https://gw2/v1/api": ({"authenticated": True, "competing": False}, None),
+    }
+    pool = gateway_pool.GatewayPool(list(statuses), lambda base: statuses[base], order_instance="https://gw2/")
+    pool.check_all()
+    assert pool.owner is pool.instances[1]
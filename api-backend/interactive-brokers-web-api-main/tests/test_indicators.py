@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+import indicators
+
+
+def bars(closes):
+    return [{"t": i, "o": c, "h": c, "l": c, "c": c, "v": 100} for i, c in enumerate(closes)]
+
+
+def test_sma_and_bbands_on_padded_series():
+    conids, fields, columns = indicators.compute({"1": bars([1, 2, 3, 4]), "2": bars([5, 6])}, ["sma:2", "bbands:2:1"])
+    assert conids == ["1", "2"]
+    np.testing.assert_allclose(columns["sma_2"][0], [np.nan, 1.5, 2.5, 3.5])
+    np.testing.assert_allclose(columns["sma_2"][1], [np.nan, np.nan, np.nan, 5.5])
+    np.testing.assert_allclose(columns["bb_upper"][0, 1:], [2.0, 3.0, 4.0])
+
+
+@pytest.mark.parametrize("spec", ["sma:0", "ema:-3", "rsi:1.5", "bbands:20:0", "bbands:20:nan", "macd:12:26:x", "atr:14:2"])
+def test_out_of_range_parameters_name_the_spec(spec):
+    with pytest.raises(ValueError, match=spec):
+        indicators.compute({"1": bars([1, 2, 3])}, [spec])
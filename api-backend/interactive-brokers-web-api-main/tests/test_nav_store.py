@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+import threading
+import pytest
+import nav_store
+
+
+@pytest.fixture(autouse=True)
+def store_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(nav_store, "NAV_STORE_PATH", str(tmp_path / "nav.sqlite3"))
+    monkeypatch.setattr(nav_store, "_local", threading.local())
+
+
+def test_claim_blocks_other_workers_until_the_interval_passes():
+    assert nav_store.claim_refresh("U1", min_interval=900)
+    assert not nav_store.claim_refresh("U1", min_interval=900)
+    assert nav_store.claim_refresh("U2", min_interval=900)
+
+
+def test_released_claim_is_retried_after_the_retry_delay():
+    assert nav_store.claim_refresh("U1", min_interval=900)
+    nav_store.release_refresh("U1", min_interval=900, retry_after=0)
+    assert nav_store.claim_refresh("U1", min_interval=900)
+
+    nav_store.release_refresh("U1", min_interval=900, retry_after=60)
+    assert not nav_store.claim_refresh("U1", min_interval=900)
+
+
+def test_first_fill_and_long_gaps_use_the_backfill_period():
+    assert nav_store.gap_period(None) == nav_store.BACKFILL_PERIOD == "5Y"
+    recent = (datetime.now() - timedelta(days=3)).strftime("%Y%m%d")
+    assert nav_store.gap_period(recent) == "1W"
+    stale = (datetime.now() - timedelta(days=400)).strftime("%Y%m%d")
+    assert nav_store.gap_period(stale) == "5Y"
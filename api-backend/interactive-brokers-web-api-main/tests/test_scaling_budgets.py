@@ -0,0 +1,27 @@
+import importlib.util
+import logging
+import os
+
+SUITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'scripts', 'scaling_suite.py')
+
+
+def load_suite():
+    # Imported on use: the suite points the app at a scratch cache and turns warm-up off when loaded
+    spec = importlib.util.spec_from_file_location("scaling_suite", SUITE_PATH)
+    suite = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(suite)
+    return suite
+
+
+def test_small_accounts_stay_within_the_scaling_budgets(monkeypatch):
+    suite = load_suite()
+    # run() swaps the gateway for a fake one; put the real functions back afterwards
+    monkeypatch.setattr(suite.webapp, "safe_api_request", suite.webapp.safe_api_request)
+    monkeypatch.setattr(suite.app_fixed, "extract_positions_data", suite.app_fixed.extract_positions_data)
+
+    try:
+        results = suite.run([10, 1000], repeat=3)
+    finally:
+        logging.disable(logging.NOTSET)
+    assert set(results) <= set(suite.load_budgets())
+    assert suite.check(results, suite.load_budgets()) == []
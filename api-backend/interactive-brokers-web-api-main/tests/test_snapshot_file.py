@@ -0,0 +1,44 @@
+import snapshot_file
+
+
+def positions(price):
+    return [
+        {"conid": 1, "ticker": "AAA", "sector": None, "details": {"exchange": "NASDAQ"}, "mktPrice": price},
+        {"conid": 2, "ticker": None, "sector": "Energy", "details": None, "mktPrice": price * 2},
+        {"conid": 3, "ticker": "CCC", "sector": None, "details": [1, 2], "mktPrice": None},
+    ]
+
+
+def test_null_string_and_json_columns_round_trip(tmp_path):
+    snap = snapshot_file.SnapshotFile(str(tmp_path / "a.snap"))
+    snapshot = {"positions": positions(10.0), "summary": {"cash": {"amount": 5.0, "note": None}, "other": None}}
+    snap.write(snapshot)
+
+    assert snap.read().get("positions") == snapshot["positions"]
+    assert snap.read().get("summary") == snapshot["summary"]
+
+
+def test_delta_over_snapshot_with_nulls(tmp_path):
+    snap = snapshot_file.SnapshotFile(str(tmp_path / "a.snap"))
+    snap.write({"positions": positions(10.0)})
+
+    changed = positions(11.0)
+    changed[1]["details"] = {"exchange": None}
+    changed[2]["ticker"] = None
+    snap.write({"positions": changed})
+    assert snap.read().get("positions") == changed
+
+    # A column that is entirely null
+    cleared = [dict(row, sector=None, details=None) for row in changed]
+    snap.write({"positions": cleared})
+    assert snap.read().get("positions") == cleared
+
+
+def test_unchanged_write_touches_the_file(tmp_path):
+    import os
+    path = str(tmp_path / "U1.snap")
+    snapshot = snapshot_file.SnapshotFile(path)
+    snapshot.write({"summary": {"a": 1}}, timestamp=1000.0)
+    assert snapshot.write({"summary": {"a": 1}}, timestamp=2000.0) == 0
+    assert os.path.getmtime(path) == 2000.0
+    assert snapshot.read().timestamp == 1000.0
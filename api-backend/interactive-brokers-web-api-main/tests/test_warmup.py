@@ -0,0 +1,68 @@
+import threading
+import pytest
+import shared_cache
+import warmup
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "_local", threading.local())
+    monkeypatch.setattr(warmup, "tasks", {})
+    monkeypatch.setattr(warmup, "refresh_tasks", set())
+
+
+def test_only_the_lease_holder_warms_and_every_worker_sees_it():
+    calls = []
+    warmup.task("accounts", refresh=True)(lambda base: calls.append(base))
+
+    # Two warmers on the same gateway stand in for two worker processes
+    worker_a = warmup.Warmer("https://gw/v1/api", lambda base: True)
+    worker_b = warmup.Warmer("https://gw/v1/api", lambda base: True)
+    assert not worker_b.ready
+
+    worker_a.tick()
+    worker_b.tick()
+    assert calls == ["https://gw/v1/api"]
+    assert worker_a.ready and worker_b.ready
+
+    # The holder renews its lease; the other worker still stays idle
+    worker_a.tick()
+    worker_b.tick()
+    assert calls == ["https://gw/v1/api"]
+    assert worker_b.lease is None
+
+
+def test_refresh_steps_rerun_and_another_worker_takes_over(monkeypatch):
+    calls = []
+    warmup.task("accounts", refresh=True)(lambda base: calls.append("accounts"))
+    warmup.task("contracts")(lambda base: calls.append("contracts"))
+
+    worker_a = warmup.Warmer("https://gw/v1/api", lambda base: True)
+    worker_a.tick()
+    assert sorted(calls) == ["accounts", "contracts"]
+
+    worker_a.refreshed_at -= warmup.WARMUP_REFRESH_SECONDS
+    worker_a.tick()
+    assert calls[2:] == ["accounts"]
+
+    # worker_a stops renewing; once its lease lapses worker_b warms from scratch
+    worker_b = warmup.Warmer("https://gw/v1/api", lambda base: True)
+    shared_cache._connect().execute("UPDATE leases SET expires_at = 0")
+    worker_b.tick()
+    assert sorted(calls[3:]) == ["accounts", "contracts"]
+    assert worker_b.lease is not None and worker_b.ready
+
+
+def test_lost_session_drops_readiness_everywhere():
+    authenticated = [True]
+    warmup.task("accounts")(lambda base: None)
+    worker_a = warmup.Warmer("https://gw/v1/api", lambda base: authenticated[0])
+    worker_b = warmup.Warmer("https://gw/v1/api", lambda base: True)
+
+    worker_a.tick()
+    assert worker_b.ready
+    authenticated[0] = False
+    worker_a.tick()
+    assert not worker_b.ready
+    assert worker_b.status()["state"] == "waiting_for_gateway"
@@ -0,0 +1,230 @@
+import logging, os, threading, time
+from collections import OrderedDict
+from flask import Response, g, render_template, request
+from responses import json_response, negotiate_encoding, wants_json
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+
+# Budgets are per worker process; keep one gthread thread free for order entry by default
+_threads = int(os.environ.get('WEBAPP_THREADS', '4'))
+ADMISSION_LIMIT_NORMAL = int(os.environ.get('ADMISSION_LIMIT_NORMAL', max(1, _threads - 1)))
+ADMISSION_LIMIT_LOW = int(os.environ.get('ADMISSION_LIMIT_LOW', max(1, _threads // 4)))
+# How long a normal request may wait for a slot before it is shed; low-priority requests never wait
+ADMISSION_QUEUE_SECONDS = float(os.environ.get('ADMISSION_QUEUE_SECONDS', '1'))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))
+
+# Last good low-priority responses, served stale while the class is shed
+STALE_MAX_ENTRIES = 64
+STALE_MAX_BYTES = 1024 * 1024
+# Headers a stale replay must carry to describe its body; the rest belong to the original exchange
+STALE_HEADERS = ('Content-Type', 'Content-Encoding', 'Vary', 'ETag', 'Cache-Control', 'Content-Disposition')
+
+CRITICAL, NORMAL, LOW = "critical", "normal", "low"
+
+
+class Budget:
+    """Bounded number of in-flight requests with a short wait queue and counters"""
+
+    def __init__(self, name, limit, wait_seconds=0.0):
+        self.name = name
+        self.limit = limit
+        self.wait_seconds = wait_seconds
+        self.inflight = 0
+        self.waiting = 0
+        self.peak = 0
+        self.admitted = 0
+        self.shed = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, wait=True):
+        deadline = time.monotonic() + (self.wait_seconds if wait else 0)
+        with self.condition:
+            if self.inflight >= self.limit and wait and self.wait_seconds > 0:
+                self.waiting += 1
+                try:
+                    while self.inflight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self.condition.wait(remaining):
+                            break
+                finally:
+                    self.waiting -= 1
+
+            if self.inflight >= self.limit:
+                self.shed += 1
+                return False
+            self.inflight += 1
+            self.admitted += 1
+            self.peak = max(self.peak, self.inflight)
+            return True
+
+    def release(self):
+        with self.condition:
+            self.inflight -= 1
+            self.condition.notify()
+
+    def cancel(self):
+        """Give back a slot that was acquired but never used"""
+        with self.condition:
+            self.inflight -= 1
+            self.admitted -= 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "inflight": self.inflight,
+                "queueDepth": self.waiting,
+                "peakInflight": self.peak,
+                "admitted": self.admitted,
+                "shed": self.shed
+            }
+
+
+class Controller:
+    """
+    Admission per route class.
+
+    Critical routes (order entry, cancels, health) are always admitted and
+    only counted. Normal routes take a slot from the normal budget and may
+    wait briefly for one. Low-priority routes need a slot in both their own
+    budget and the normal one without waiting, so they are the first to go
+    when the gateway slows down; a shed low-priority GET gets its last good
+    response back marked stale, or a fast 503.
+    """
+
+    def __init__(self, route_classes):
+        self.route_classes = route_classes
+        self.normal = Budget(NORMAL, ADMISSION_LIMIT_NORMAL, ADMISSION_QUEUE_SECONDS)
+        self.low = Budget(LOW, ADMISSION_LIMIT_LOW)
+        self.critical_inflight = 0
+        self.critical_admitted = 0
+        self.stale_served = 0
+        self.lock = threading.Lock()
+        self._stale = OrderedDict()
+
+    def route_class(self, endpoint):
+        return self.route_classes.get(endpoint, NORMAL)
+
+    def admit(self, route_class):
+        """Return the budgets taken for the request, or None when it is shed"""
+        if route_class == CRITICAL:
+            with self.lock:
+                self.critical_inflight += 1
+                self.critical_admitted += 1
+            return []
+
+        if route_class == LOW:
+            if not self.low.acquire(wait=False):
+                return None
+            if not self.normal.acquire(wait=False):
+                # Counted as shed by the normal budget; the low slot was never used
+                self.low.cancel()
+                return None
+            return [self.low, self.normal]
+
+        return [self.normal] if self.normal.acquire() else None
+
+    def release(self, route_class, budgets):
+        if route_class == CRITICAL:
+            with self.lock:
+                self.critical_inflight -= 1
+        for budget in budgets:
+            budget.release()
+
+    def remember(self, key, response):
+        if response.status_code != 200 or response.is_streamed:
+            return
+        body = response.get_data()
+        if len(body) > STALE_MAX_BYTES:
+            return
+        headers = [(name, value) for name, value in response.headers.items() if name in STALE_HEADERS]
+        with self.lock:
+            self._stale[key] = (body, headers, time.time())
+            self._stale.move_to_end(key)
+            while len(self._stale) > STALE_MAX_ENTRIES:
+                self._stale.popitem(last=False)
+
+    def stale(self, key):
+        with self.lock:
+            entry = self._stale.get(key)
+            if entry is not None:
+                self.stale_served += 1
+            return entry
+
+    def stats(self):
+        with self.lock:
+            critical = {"inflight": self.critical_inflight, "admitted": self.critical_admitted}
+            stale_served = self.stale_served
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "classes": {CRITICAL: critical, NORMAL: self.normal.stats(), LOW: self.low.stats()},
+            "staleServed": stale_served
+        }
+
+
+_controller = None
+
+
+def get_controller():
+    return _controller
+
+
+def _stale_key():
+    # Page routes answer in HTML or JSON depending on Accept and bodies are compressed
+    # per Accept-Encoding, so each negotiated form is kept apart
+    return (request.full_path, wants_json(), negotiate_encoding())
+
+
+def _shed_response(controller, route_class):
+    if route_class == LOW and request.method == 'GET':
+        entry = controller.stale(_stale_key())
+        if entry is not None:
+            body, headers, stored_at = entry
+            response = Response(body, headers=headers)
+            response.headers['Age'] = str(int(time.time() - stored_at))
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            return response
+
+    if request.path.startswith('/api/') or wants_json():
+        response = json_response({"error": "Server busy, try again shortly", "routeClass": route_class}, 503)
+    else:
+        response = Response(render_template("error.html", error="The server is busy, please try again in a few seconds."),
+                            status=503, mimetype='text/html')
+    response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+    return response
+
+
+def init_app(app, route_classes):
+    """Install admission control; route_classes maps endpoint names to CRITICAL or LOW (default NORMAL)"""
+    global _controller
+    _controller = controller = Controller(route_classes)
+
+    if not ADMISSION_ENABLED:
+        return controller
+
+    @app.before_request
+    def admit_request():
+        route_class = controller.route_class(request.endpoint)
+        budgets = controller.admit(route_class)
+        if budgets is None:
+            logger.warning(f"Shedding {route_class} request {request.path}")
+            return _shed_response(controller, route_class)
+        g.admission = (route_class, budgets)
+
+    @app.after_request
+    def remember_response(response):
+        admitted = g.get('admission')
+        if admitted and admitted[0] == LOW and request.method == 'GET':
+            controller.remember(_stale_key(), response)
+        return response
+
+    @app.teardown_request
+    def release_request(exc=None):
+        admitted = g.pop('admission', None)
+        if admitted:
+            controller.release(*admitted)
+
+    return controller
@@ -0,0 +1,471 @@
+import logging, os, queue, sqlite3, threading, time
+from array import array
+from bisect import bisect_left, bisect_right
+
+logger = logging.getLogger(__name__)
+
+ALERT_STORE_PATH = os.environ.get('ALERT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'alerts.sqlite3'))
+# How often the conids with active alerts are quoted when nothing else requests them
+ALERT_POLL_SECONDS = float(os.environ.get('ALERT_POLL_SECONDS', '5'))
+# Triggered alerts waiting for an in-process consumer; the oldest are dropped beyond this
+ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE', '10000'))
+
+KINDS = ('above', 'below', 'move_pct')
+# Above this many ids to add to or drop from one array, rebuild it once instead of one by one
+DISCARD_BATCH = 32
+# Store changes kept for workers to catch up from; a worker further behind rebuilds its index
+ALERT_CHANGE_LOG = int(os.environ.get('ALERT_CHANGE_LOG', '200000'))
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class AlertIndex:
+    """
+    Alert thresholds per conid in sorted arrays.
+
+    "above" levels trigger when the price reaches them from below, "below"
+    levels when it falls to them. A price update bisects each side once and
+    takes the crossed prefix (above) or suffix (below), so the cost depends
+    on the number of alerts triggered, not on the number registered.
+    """
+
+    def __init__(self):
+        # conid -> (levels ascending, alert ids in the same order)
+        self.above = {}
+        self.below = {}
+        # alert id -> [(side, conid, level)] so both sides of a move alert can be dropped together
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def conids(self):
+        return list(set(self.above) | set(self.below))
+
+    def add(self, alert_id, conid, above=None, below=None):
+        entries = self.entries.setdefault(alert_id, [])
+        for side, level in ((self.above, above), (self.below, below)):
+            if level is None:
+                continue
+            levels, ids = side.setdefault(conid, (array('d'), array('q')))
+            i = bisect_right(levels, level)
+            levels.insert(i, level)
+            ids.insert(i, alert_id)
+            entries.append((side, conid, level))
+
+    def add_many(self, alerts):
+        """
+        Index many (alert_id, conid, above, below) at once. An array getting
+        many new levels is merged and sorted once instead of taking one
+        insert per alert, so loading the whole store stays O(n log n).
+        """
+        pending = {}
+        for alert_id, conid, above, below in alerts:
+            if alert_id in self.entries:
+                continue
+            entries = self.entries[alert_id] = []
+            for side, level in ((self.above, above), (self.below, below)):
+                if level is None:
+                    continue
+                pending.setdefault((id(side), conid), (side, conid, []))[2].append((level, alert_id))
+                entries.append((side, conid, level))
+
+        for side, conid, added in pending.values():
+            if conid in side and len(added) <= DISCARD_BATCH:
+                levels, ids = side[conid]
+                for level, alert_id in added:
+                    i = bisect_right(levels, level)
+                    levels.insert(i, level)
+                    ids.insert(i, alert_id)
+                continue
+            if conid in side:
+                added.extend(zip(*side[conid]))
+            added.sort()
+            side[conid] = (array('d', (level for level, _ in added)), array('q', (alert_id for _, alert_id in added)))
+
+    def remove(self, alert_id):
+        for side, conid, level in self.entries.pop(alert_id, ()):
+            self._discard(side, conid, level, alert_id)
+
+    def remove_many(self, alert_ids):
+        """Drop many alerts, one pass per array when many of them share it"""
+        pending = {}
+        for alert_id in alert_ids:
+            for side, conid, level in self.entries.pop(alert_id, ()):
+                pending.setdefault((id(side), conid), (side, conid, []))[2].append((level, alert_id))
+        self._discard_pending(pending)
+
+    def _discard_pending(self, pending):
+        """Drop {key: (side, conid, [(level, alert_id)])} from the arrays"""
+        for side, conid, dropped in pending.values():
+            if len(dropped) > DISCARD_BATCH:
+                self._discard_many(side, conid, {alert_id for _, alert_id in dropped})
+            else:
+                for level, alert_id in dropped:
+                    self._discard(side, conid, level, alert_id)
+
+    def _discard(self, side, conid, level, alert_id):
+        if conid not in side:
+            return
+        levels, ids = side[conid]
+        # Only the run of equal levels can hold the id; it is gone if the crossed slice took it
+        i = bisect_left(levels, level)
+        while i < len(ids) and levels[i] == level and ids[i] != alert_id:
+            i += 1
+        if i < len(ids) and ids[i] == alert_id:
+            del levels[i]
+            del ids[i]
+        if not ids:
+            del side[conid]
+
+    def _discard_many(self, side, conid, alert_ids):
+        """Drop many ids from one side of a conid in a single pass over its arrays"""
+        if conid not in side:
+            return
+        levels, ids = side[conid]
+        keep = [i for i, alert_id in enumerate(ids) if alert_id not in alert_ids]
+        if not keep:
+            del side[conid]
+            return
+        side[conid] = (array('d', (levels[i] for i in keep)), array('q', (ids[i] for i in keep)))
+
+    def evaluate(self, conid, price):
+        """Remove and return the ids of every alert on conid crossed by price"""
+        crossed = []
+        sides = []
+        above = self.above.get(conid)
+        if above is not None:
+            i = bisect_right(above[0], price)
+            if i:
+                crossed.extend(above[1][:i])
+                sides.extend([self.above] * i)
+                del above[0][:i]
+                del above[1][:i]
+                if not above[1]:
+                    del self.above[conid]
+
+        below = self.below.get(conid)
+        if below is not None:
+            i = bisect_left(below[0], price)
+            if i < len(below[1]):
+                sides.extend([self.below] * (len(below[1]) - i))
+                crossed.extend(below[1][i:])
+                del below[0][i:]
+                del below[1][i:]
+                if not below[1]:
+                    del self.below[conid]
+
+        # The crossed sides are already gone; drop the other side of move alerts,
+        # one pass per array when many cross at once so a big move stays linear
+        others = {}
+        for alert_id, crossed_side in zip(crossed, sides):
+            for side, other_conid, level in self.entries.pop(alert_id, ()):
+                if side is crossed_side and other_conid == conid:
+                    continue
+                others.setdefault((id(side), other_conid), (side, other_conid, []))[2].append((level, alert_id))
+        self._discard_pending(others)
+        return crossed
+
+
+def thresholds(kind, level=None, pct=None, reference=None):
+    """(above, below) levels for an alert definition"""
+    if kind == 'above':
+        return level, None
+    if kind == 'below':
+        return None, level
+    return reference * (1 + pct / 100), reference * (1 - pct / 100)
+
+
+class AlertEngine:
+    """
+    Price alerts stored in SQLite and evaluated in memory.
+
+    Every worker process keeps its own index. Triggers on the alerts table
+    log every insert, claim and delete, and when another process changed
+    the store a worker applies just the logged changes since its last sync.
+    Quotes reach evaluate() through the quote
+    cache listener, so any snapshot request (watchlists, the alert poller)
+    checks alerts. A triggered alert is claimed in the store before it is
+    published, so it fires once even if several workers see the same tick.
+    """
+
+    def __init__(self, path=ALERT_STORE_PATH):
+        self.path = path
+        self.index = AlertIndex()
+        self.triggered = queue.Queue(ALERT_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.data_version = None
+        # Last alert_changes entry applied to the index
+        self.change_seq = None
+        self.fetch_quotes = None
+        self.thread = None
+        self.evaluated_ticks = 0
+        self.dropped = 0
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conid TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                level REAL,
+                pct REAL,
+                reference REAL,
+                note TEXT,
+                created_at REAL NOT NULL,
+                triggered_at REAL,
+                trigger_price REAL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS alerts_active ON alerts (triggered_at)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS alert_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                alert_id INTEGER NOT NULL,
+                removed INTEGER NOT NULL
+            )""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS alerts_added AFTER INSERT ON alerts BEGIN
+                INSERT INTO alert_changes (alert_id, removed) VALUES (new.id, 0); END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS alerts_claimed AFTER UPDATE OF triggered_at ON alerts
+                WHEN old.triggered_at IS NULL AND new.triggered_at IS NOT NULL BEGIN
+                INSERT INTO alert_changes (alert_id, removed) VALUES (new.id, 1); END""")
+            conn.execute("""CREATE TRIGGER IF NOT EXISTS alerts_deleted AFTER DELETE ON alerts BEGIN
+                INSERT INTO alert_changes (alert_id, removed) VALUES (old.id, 1); END""")
+            self.conn = conn
+        return self.conn
+
+    def sync(self):
+        """
+        Bring the index up to date when another process changed the store:
+        apply the logged changes since the last sync, or load the whole
+        store on the first sync and when the log no longer reaches back.
+        Changes this process made itself are already indexed and skipped.
+        """
+        with self.lock:
+            conn = self._connect()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version:
+                return
+            conn.execute("BEGIN")
+            try:
+                oldest = conn.execute("SELECT MIN(seq) FROM alert_changes").fetchone()[0]
+                if self.change_seq is None or (oldest is not None and oldest > self.change_seq + 1):
+                    self._load(conn)
+                else:
+                    self._apply_changes(conn)
+            finally:
+                conn.execute("COMMIT")
+            self.data_version = version
+
+    def _load(self, conn):
+        index = AlertIndex()
+        self.change_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alert_changes").fetchone()[0]
+        index.add_many((alert_id, conid, *thresholds(kind, level, pct, reference)) for alert_id, conid, kind, level, pct, reference
+                       in conn.execute("SELECT id, conid, kind, level, pct, reference FROM alerts WHERE triggered_at IS NULL"))
+        self.index = index
+
+    def _apply_changes(self, conn):
+        added, removed = [], set()
+        for seq, alert_id, was_removed in conn.execute(
+                "SELECT seq, alert_id, removed FROM alert_changes WHERE seq > ? ORDER BY seq", (self.change_seq,)):
+            if was_removed:
+                removed.add(alert_id)
+            elif alert_id not in self.index.entries:
+                added.append(alert_id)
+            self.change_seq = seq
+
+        self.index.remove_many(removed)
+        added = [alert_id for alert_id in added if alert_id not in removed]
+        rows = []
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(added), 500):
+            chunk = added[i:i + 500]
+            rows.extend(conn.execute(f"""SELECT id, conid, kind, level, pct, reference FROM alerts
+                WHERE triggered_at IS NULL AND id IN ({','.join('?' * len(chunk))})""", chunk))
+        self.index.add_many((alert_id, conid, *thresholds(kind, level, pct, reference))
+                            for alert_id, conid, kind, level, pct, reference in rows)
+
+    def _trim_changes(self, conn):
+        conn.execute("DELETE FROM alert_changes WHERE seq <= (SELECT MAX(seq) FROM alert_changes) - ?", (ALERT_CHANGE_LOG,))
+
+    def create(self, definitions):
+        """Store and index alerts; definitions are dicts already validated by validate()"""
+        self.sync()
+        now = time.time()
+        created = []
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                for alert in definitions:
+                    cursor = conn.execute(
+                        "INSERT INTO alerts (conid, kind, level, pct, reference, note, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (alert['conid'], alert['kind'], alert.get('level'), alert.get('pct'), alert.get('reference'),
+                         alert.get('note'), now))
+                    created.append(dict(alert, id=cursor.lastrowid, createdAt=now))
+                self._trim_changes(conn)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            self.index.add_many((alert['id'], alert['conid'], *thresholds(alert['kind'], alert.get('level'), alert.get('pct'), alert.get('reference')))
+                                for alert in created)
+        return created
+
+    def delete(self, alert_id):
+        self.sync()
+        with self.lock:
+            cursor = self._connect().execute("DELETE FROM alerts WHERE id = ? AND triggered_at IS NULL", (alert_id,))
+            self.index.remove(alert_id)
+            return cursor.rowcount == 1
+
+    def active(self, conid=None, limit=1000):
+        query = "SELECT id, conid, kind, level, pct, reference, note, created_at FROM alerts WHERE triggered_at IS NULL"
+        params = []
+        if conid:
+            query += " AND conid = ?"
+            params.append(str(conid))
+        with self.lock:
+            rows = self._connect().execute(query + " ORDER BY id LIMIT ?", params + [limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def triggered_since(self, since=0, limit=1000):
+        with self.lock:
+            rows = self._connect().execute(
+                """SELECT id, conid, kind, level, pct, reference, note, created_at, triggered_at, trigger_price
+                   FROM alerts WHERE triggered_at > ? ORDER BY triggered_at LIMIT ?""", (since, limit)).fetchall()
+        return [self._row(row) for row in rows]
+
+    @staticmethod
+    def _row(row):
+        names = ("id", "conid", "kind", "level", "pct", "reference", "note", "createdAt", "triggeredAt", "triggerPrice")
+        return dict(zip(names, row))
+
+    def evaluate(self, prices):
+        """Check {conid: price} against the index; returns the alerts this process triggered"""
+        if not len(self.index):
+            return []
+
+        now = time.time()
+        fired = []
+        with self.lock:
+            crossed = []
+            for conid, price in prices.items():
+                if price is not None:
+                    crossed.extend((alert_id, conid, price) for alert_id in self.index.evaluate(conid, price))
+            self.evaluated_ticks += len(prices)
+            if not crossed:
+                return []
+
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                for alert_id, conid, price in crossed:
+                    cursor = conn.execute("UPDATE alerts SET triggered_at = ?, trigger_price = ? WHERE id = ? AND triggered_at IS NULL",
+                                          (now, price, alert_id))
+                    # Another worker may have claimed it on the same tick
+                    if cursor.rowcount == 1:
+                        fired.append({"id": alert_id, "conid": conid, "price": price, "triggeredAt": now})
+                self._trim_changes(conn)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+        dropped = sum(self._publish(alert) for alert in fired)
+        if dropped:
+            self.dropped += dropped
+            logger.warning(f"Triggered alert queue full, dropped the {dropped} oldest alerts")
+        return fired
+
+    def _publish(self, alert):
+        """Queue alert, evicting the oldest queued ones if full; returns how many were evicted"""
+        dropped = 0
+        while True:
+            try:
+                self.triggered.put_nowait(alert)
+                return dropped
+            except queue.Full:
+                try:
+                    self.triggered.get_nowait()
+                    dropped += 1
+                except queue.Empty:
+                    pass
+
+    def on_quotes(self, quotes):
+        """Quote cache listener"""
+        self.sync()
+        self.evaluate({conid: quote.get('last') for conid, quote in quotes.items()})
+
+    def start(self, fetch_quotes):
+        """Quote the conids with active alerts every ALERT_POLL_SECONDS until none are left"""
+        self.fetch_quotes = fetch_quotes
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="alert-poller", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+                conids = self.index.conids()
+                if not conids:
+                    break
+                # Results arrive through on_quotes
+                self.fetch_quotes(conids)
+            except Exception:
+                logger.exception("Alert poll failed")
+            time.sleep(ALERT_POLL_SECONDS)
+        logger.info("No active alerts, alert poller stopping")
+
+    def stats(self):
+        return {
+            "active": len(self.index),
+            "conids": len(self.index.above.keys() | self.index.below.keys()),
+            "queued": self.triggered.qsize(),
+            "dropped": self.dropped,
+            "evaluatedTicks": self.evaluated_ticks,
+            "polling": self.thread is not None and self.thread.is_alive()
+        }
+
+
+def validate(item):
+    """Return (alert, error) for one alert definition from a request"""
+    if not isinstance(item, dict):
+        return None, "alert must be an object"
+
+    conid = str(item.get('conid') or '')
+    kind = item.get('kind')
+    if not conid:
+        return None, "conid is required"
+    if kind not in KINDS:
+        return None, f"kind must be one of {', '.join(KINDS)}"
+
+    alert = {"conid": conid, "kind": kind, "note": item.get('note')}
+    try:
+        if kind == 'move_pct':
+            alert['pct'] = float(item['pct'])
+            if alert['pct'] <= 0:
+                return None, "pct must be positive"
+            if item.get('reference') is not None:
+                alert['reference'] = float(item['reference'])
+        else:
+            alert['level'] = float(item['level'])
+    except (KeyError, TypeError, ValueError):
+        return None, "pct is required for move_pct alerts" if kind == 'move_pct' else "level is required"
+    return alert, None
+
+
+def get_engine():
+    """The process-wide alert engine, hooked into the quote cache"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            import quotes
+            _engine = AlertEngine()
+            quotes.add_listener(_engine.on_quotes)
+        return _engine
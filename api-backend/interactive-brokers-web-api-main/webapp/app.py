@@ -1,6 +1,31 @@
 import requests, time, os, random, json, logging
-from flask import Flask, render_template, request, redirect, jsonify
+from flask import Flask, Response, request, redirect, jsonify, has_request_context
 from datetime import datetime, timedelta
+import shared_cache
+from responses import json_response, render_page
+import fragments
+from pacing import paced_map
+import change_feed
+import order_tracker
+import position_tracker
+import household
+import nav_store
+import snapshots
+import warmup
+import contract_cache
+import indicators
+import risk
+import quotes
+import exports
+import admission
+import snapshot_file
+from summary_values import extract_cash_value
+import alerts
+import gateway_pool
+import position_index
+import attribution
+import execution_ledger
+import rebalance
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,6 +37,15 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 # Dinamik API URL - host'a göre ayarlanır
 def get_base_api_url(request):
+    pool = get_gateway_pool()
+    if pool is not None:
+        # Requests are built on the pool's base URL and routed per request in safe_api_request
+        return pool.base
+
+    if GATEWAY_API_URL:
+        # A configured gateway serves every request, so cache keys do not depend on the host the browser used
+        return GATEWAY_API_URL
+
     host = request.host.split(':')[0]  # Port'u çıkar
     
     if host == 'localhost' or host == '127.0.0.1':
@@ -22,6 +56,10 @@ def get_base_api_url(request):
 
 # Gateway URL'i almak için yardımcı fonksiyon
 def get_gateway_url(request):
+    pool = get_gateway_pool()
+    if pool is not None:
+        return pool.login_url()
+
     host = request.host.split(':')[0]  # Port'u çıkar
     
     if host == 'localhost' or host == '127.0.0.1':
@@ -32,6 +70,27 @@ def get_gateway_url(request):
 
 ACCOUNT_ID = os.environ.get('IBKR_ACCOUNT_ID', '')
 
+# Gateway API the webapp talks to (start.sh runs one next to it); unset, it is derived from the request host
+GATEWAY_API_URL = os.environ.get('IBKR_API_URL', '').rstrip('/')
+
+# Seconds a gateway request may take before it fails (shared_cache leases outlast it)
+GATEWAY_REQUEST_TIMEOUT = float(os.environ.get('GATEWAY_REQUEST_TIMEOUT', '30'))
+
+# Seconds that gateway reads (accounts, summary, positions) are shared between workers
+GATEWAY_CACHE_TTL = float(os.environ.get('GATEWAY_CACHE_TTL', '10'))
+
+# The scanner catalogue changes rarely
+SCANNER_PARAMS_TTL = float(os.environ.get('SCANNER_PARAMS_TTL', '3600'))
+
+# Price history bars are shared by the contract page and the indicator engine
+HISTORY_CACHE_TTL = float(os.environ.get('HISTORY_CACHE_TTL', '300'))
+
+# Orders per POST to /iserver/account/{id}/orders; orders in one chunk share any reply prompt
+ORDER_BATCH_SIZE = int(os.environ.get('ORDER_BATCH_SIZE', '5'))
+
+# Raw summary/positions/allocation of each account, kept as compact binary snapshots (see snapshot_file.py)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshots'))
+
 logger.info(f"Starting with ACCOUNT_ID: {ACCOUNT_ID}")
 
 os.environ['PYTHONHTTPSVERIFY'] = '0'
@@ -49,8 +108,24 @@ def after_request(response):
 # Güvenli API istekleri için yardımcı fonksiyon
 def safe_api_request(url, method='get', **kwargs):
     """API isteklerini güvenli şekilde yap ve hataları yönet"""
+    pool = get_gateway_pool()
+    if pool is not None and pool.owns(url):
+        return pool.request(url, method, lambda target: gateway_request(target, method, **kwargs))
+    return gateway_request(url, method, **kwargs)
+
+def gateway_status(base_api_url):
+    """Auth status of one gateway instance, bypassing pool routing"""
+    return gateway_request(f"{base_api_url}/iserver/auth/status", method='post', timeout=gateway_pool.GATEWAY_HEALTH_TIMEOUT)
+
+def get_gateway_pool():
+    """The GATEWAY_POOL instances, or None for one gateway per request host"""
+    return gateway_pool.get_pool(gateway_status)
+
+def gateway_request(url, method='get', **kwargs):
+    """One request to exactly the gateway in url"""
     try:
         logger.info(f"Making {method.upper()} request to: {url}")
+        kwargs.setdefault('timeout', GATEWAY_REQUEST_TIMEOUT)
         
         if method.lower() == 'get':
             response = requests.get(url, verify=False, **kwargs)
@@ -81,6 +156,169 @@ def safe_api_request(url, method='get', **kwargs):
         logger.error(f"Request error for {url}: {e}")
         return None, str(e)
 
+def cached_api_request(url, ttl=None):
+    """GET a gateway URL through the cross-process shared cache"""
+    return shared_cache.get_or_fetch(f"api:{url}", GATEWAY_CACHE_TTL if ttl is None else ttl,
+                                     lambda: safe_api_request(url))
+
+def select_account(accounts):
+    """Pick the account named by ?account=, falling back to the default account"""
+    requested = request.args.get('account') if has_request_context() else None
+    if requested:
+        for account in accounts:
+            if requested in (account.get('id'), account.get('accountId')):
+                return account
+        logger.warning(f"Requested account {requested} not found, using default account")
+
+    # Try the second account if available, otherwise use the first one
+    return accounts[1] if len(accounts) > 1 else accounts[0]
+
+def cached_api_request_many(urls, ttl=None):
+    """Cached GETs for many URLs; only cache misses go to the gateway, concurrently and paced"""
+    results = [None] * len(urls)
+    misses = []
+    for i, url in enumerate(urls):
+        value = shared_cache.get(f"api:{url}")
+        if value is not None:
+            results[i] = (value, None)
+        else:
+            misses.append(i)
+
+    for i, result in zip(misses, paced_map(lambda i: cached_api_request(urls[i], ttl), misses)):
+        results[i] = result
+    return results
+
+def normalize_positions(positions_data):
+    """Return portfolio2 positions as a list, whether the API sent a list or a single position"""
+    # Check if positions_data is a list of positions or a single position object
+    if isinstance(positions_data, list):
+        return positions_data
+    if isinstance(positions_data, dict) and 'conid' in positions_data:
+        # Single position returned as an object
+        return [positions_data]
+    return []
+
+def resolve_contracts(BASE_API_URL, conids):
+    """{conid: secdef} from the contract cache; misses go to /trsrv/secdef in bulk"""
+    return contract_cache.resolve(conids, lambda batch: safe_api_request(f"{BASE_API_URL}/trsrv/secdef", method='post', json={"conids": batch}))
+
+def prefetch_contracts(BASE_API_URL, conids):
+    """Resolve contract metadata in the background so later pages find it cached"""
+    contract_cache.prefetch(conids, lambda batch: safe_api_request(f"{BASE_API_URL}/trsrv/secdef", method='post', json={"conids": batch}))
+
+def get_quotes(BASE_API_URL, conids):
+    """{conid: quote} from the short-lived quote cache; misses go to one batched snapshot call"""
+    return quotes.get_quotes(conids, lambda batch, fields: safe_api_request(
+        f"{BASE_API_URL}/iserver/marketdata/snapshot?conids={','.join(batch)}&fields={','.join(fields)}"))
+
+def history_url(BASE_API_URL, conid, period, bar):
+    return f"{BASE_API_URL}/iserver/marketdata/history?conid={conid}&period={period}&bar={bar}"
+
+def get_default_account(BASE_API_URL):
+    """Return (account, error) for the account the webapp trades with"""
+    accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
+
+    if error:
+        return None, error
+
+    if not accounts:
+        return None, "no_accounts"
+
+    return select_account(accounts), None
+
+def get_order_tracker(BASE_API_URL):
+    """Background order tracker for this gateway; all workers share its feed and take turns polling"""
+    url = f"{BASE_API_URL}/iserver/account/orders"
+    return order_tracker.get_tracker(BASE_API_URL, lambda: cached_api_request(url, ttl=order_tracker.ORDER_POLL_SECONDS),
+                                     lambda: shared_cache.delete(f"api:{url}"))
+
+def get_position_tracker(BASE_API_URL, account_id):
+    """Background position change tracker for one account; polls go through the shared cache"""
+    url = f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position"
+
+    def fetch():
+        positions_data, error = cached_api_request(url)
+        return normalize_positions(positions_data), error
+
+    return position_tracker.get_tracker(f"{BASE_API_URL}|{account_id}", fetch)
+
+def get_execution_ledger(BASE_API_URL, account_id):
+    """
+    Start the background execution pull for one account; True once it has
+    been ingested. Requests never pull themselves, so a failing gateway is
+    only asked again by the worker, after LEDGER_RETRY_SECONDS.
+    """
+    fetch = lambda days: safe_api_request(f"{BASE_API_URL}/iserver/account/trades?days={days}")
+
+    def fetch_positions():
+        positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position")
+        return normalize_positions(positions_data), error
+
+    execution_ledger.start_worker(f"{BASE_API_URL}|{account_id}", account_id, fetch, fetch_positions)
+    return execution_ledger.ingested(account_id)
+
+def get_alert_engine(BASE_API_URL):
+    """Price alert engine for this process, polling quotes for alerted conids through this gateway"""
+    engine = alerts.get_engine()
+    engine.start(lambda conids: get_quotes(BASE_API_URL, conids))
+    return engine
+
+def account_snapshot_file(account_id):
+    return snapshot_file.SnapshotFile(os.path.join(SNAPSHOT_DIR, f"{account_id}.snap"))
+
+def persist_account_snapshot(account_id, sections):
+    """Append what changed since the last refresh to the account's snapshot file"""
+    try:
+        account_snapshot_file(account_id).write(sections)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not write snapshot for {account_id}: {e}")
+
+def build_dashboard_snapshot(BASE_API_URL, account):
+    """Fetch summary, positions and allocation together and reduce them to dashboard figures"""
+    account_id = account["id"]
+    (summary, error), (positions_data, positions_error), (allocation, allocation_error) = cached_api_request_many([
+        f"{BASE_API_URL}/portfolio/{account_id}/summary",
+        f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position",
+        f"{BASE_API_URL}/portfolio/{account_id}/allocation"
+    ])
+
+    if error:
+        return None, error
+
+    positions_list = normalize_positions(positions_data)
+    persist_account_snapshot(account_id, {
+        "summary": summary if isinstance(summary, dict) else {},
+        "positions": positions_list,
+        "allocation": allocation if isinstance(allocation, dict) else {}
+    })
+
+    positions_totals = {
+        "count": len(positions_list),
+        "marketValue": sum(float(p.get('marketValue') or 0) for p in positions_list),
+        "costBasis": sum(float(p.get('avgCost') or 0) * float(p.get('position') or 0) for p in positions_list),
+        "unrealizedPnl": sum(float(p.get('unrealizedPnl') or 0) for p in positions_list)
+    }
+
+    allocation_breakdown = {}
+    for category in ('assetClass', 'sector', 'group'):
+        if isinstance(allocation, dict) and category in allocation:
+            allocation_breakdown[category] = {name: float(value) for name, value in allocation[category].get('long', {}).items()}
+
+    return {
+        "account": account,
+        "summary": summary if isinstance(summary, dict) else {},
+        "cash": extract_cash_value(summary),
+        "positions": positions_totals,
+        "allocation": allocation_breakdown,
+        "errors": {name: err for name, err in (("positions", positions_error), ("allocation", allocation_error)) if err}
+    }, None
+
+def get_dashboard_snapshot(BASE_API_URL, account):
+    """Return (snapshot, age_seconds, error) from the account's background refresher"""
+    refresher = snapshots.get_refresher(f"{BASE_API_URL}|{account['id']}",
+                                        lambda: build_dashboard_snapshot(BASE_API_URL, account))
+    return refresher.get()
+
 @app.template_filter('ctime')
 def timectime(s):
     return time.ctime(s/1000)
@@ -90,6 +328,26 @@ def format_json(value, indent=None):
     """Convert a value to JSON with indentation option"""
     return json.dumps(value, indent=indent)
 
+# Filtreler kayıtlı olmalı: şablonları önceden derle ve fragment önbelleğini aç
+fragments.init_app(app)
+
+# Order entry and cancels are always admitted; slow informational pages are shed first
+admission.init_app(app, {
+    "place_order": admission.CRITICAL,
+    "cancel_order": admission.CRITICAL,
+    "api_place_orders": admission.CRITICAL,
+    "api_order_reply": admission.CRITICAL,
+    "api_cancel_orders": admission.CRITICAL,
+    "health": admission.CRITICAL,
+    "ready": admission.CRITICAL,
+    "api_admission": admission.CRITICAL,
+    "api_gateways": admission.CRITICAL,
+    "static": admission.CRITICAL,
+    "scanner": admission.LOW,
+    "performance": admission.LOW,
+    "lookup": admission.LOW
+})
+
 @app.route("/")
 def dashboard():
     try:
@@ -97,66 +355,48 @@ def dashboard():
         logger.info("Getting accounts...")
         
         # Güvenli API isteği yap
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             # Yetkilendirme hatası
             if error == "unauthorized":
                 gateway_url = get_gateway_url(request)
-                return render_template("auth_required.html", 
-                                     message="Please log in to Interactive Brokers Gateway first.",
-                                     gateway_url=gateway_url)
+                return render_page("auth_required.html", 
+                                 message="Please log in to Interactive Brokers Gateway first.",
+                                 gateway_url=gateway_url)
             # Diğer hatalar
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
             
         if not accounts:
             gateway_url = get_gateway_url(request)
-            return render_template("auth_required.html", 
-                                 message="No accounts found. Please log in to Interactive Brokers Gateway.",
-                                 gateway_url=gateway_url)
+            return render_page("auth_required.html", 
+                             message="No accounts found. Please log in to Interactive Brokers Gateway.",
+                             gateway_url=gateway_url)
         
         logger.info(f"Accounts response: {accounts}")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         logger.info(f"Using account: {account}")
 
         account_id = account["id"]
-        logger.info(f"Getting summary for account {account_id}...")
-        
-        # Güvenli API isteği yap
-        summary, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/summary")
+        snapshot, age, error = get_dashboard_snapshot(BASE_API_URL, account)
         
         if error:
-            return render_template("error.html", error=f"Failed to get account summary: {error}")
-            
-        logger.info(f"Summary response: {json.dumps(summary, indent=2)}")
-        
-        # Process the summary data to extract cash values
-        if isinstance(summary, dict):
-            # Check for nested cash values in the response
-            if 'settledcash' in summary and isinstance(summary['settledcash'], dict) and 'amount' in summary['settledcash']:
-                summary['totalCashValue'] = float(summary['settledcash']['amount'])
-            elif 'settledcash-s' in summary and isinstance(summary['settledcash-s'], dict) and 'amount' in summary['settledcash-s']:
-                summary['totalCashValue'] = float(summary['settledcash-s']['amount'])
-            # Check traditional format
-            elif 'totalcashvalue' in summary and isinstance(summary['totalcashvalue'], dict) and 'amount' in summary['totalcashvalue']:
-                summary['totalCashValue'] = float(summary['totalcashvalue']['amount'])
-            elif 'totalCashValue' not in summary:
-                logger.warning("Could not find cash value in summary response")
-                if 'AvailableFunds' in summary:
-                    summary['totalCashValue'] = summary['AvailableFunds']
-                else:
-                    summary['totalCashValue'] = 0
-        else:
-            logger.error(f"Unexpected summary format: {type(summary)}")
-            summary = {'totalCashValue': 0}
+            if error == "unauthorized":
+                gateway_url = get_gateway_url(request)
+                return render_page("auth_required.html", 
+                                 message="Please log in to Interactive Brokers Gateway first.",
+                                 gateway_url=gateway_url)
+            return render_page("error.html", error=f"Failed to get account summary: {error}")
         
-        return render_template("dashboard.html", account=account, summary=summary)
+        summary = dict(snapshot["summary"], totalCashValue=snapshot["cash"])
+        
+        return render_page("dashboard.html", account=account, accounts=accounts, summary=summary,
+                           snapshot=snapshot, snapshot_age=age)
         
     except Exception as e:
         logger.exception("Error in dashboard route")
-        return render_template("error.html", error=str(e))
+        return render_page("error.html", error=str(e))
 
 
 @app.route("/lookup")
@@ -169,38 +409,30 @@ def lookup():
         stocks, error = safe_api_request(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true")
         
         if error:
-            return render_template("error.html", error=f"Failed to lookup symbol: {error}")
+            return render_page("error.html", error=f"Failed to lookup symbol: {error}")
 
-    return render_template("lookup.html", stocks=stocks or [])
+    return render_page("lookup.html", stocks=stocks or [])
 
 
 @app.route("/contract/<contract_id>/<period>")
 def contract(contract_id, period='5d', bar='1d'):
     BASE_API_URL = get_base_api_url(request)
-    data = {
-        "conids": [
-            contract_id
-        ]
-    }
+    contract = resolve_contracts(BASE_API_URL, [contract_id]).get(str(contract_id))
     
-    # Güvenli API isteği
-    contract_data, error = safe_api_request(f"{BASE_API_URL}/trsrv/secdef", method='post', json=data)
-    
-    if error:
-        return render_template("error.html", error=f"Failed to get contract details: {error}")
-        
-    if not contract_data or 'secdef' not in contract_data or not contract_data['secdef']:
-        return render_template("error.html", error="Invalid contract data response")
-        
-    contract = contract_data['secdef'][0]
+    if contract is None:
+        return render_page("error.html", error="Failed to get contract details")
 
     # Güvenli API isteği
-    price_history, error = safe_api_request(f"{BASE_API_URL}/iserver/marketdata/history?conid={contract_id}&period={period}&bar={bar}")
+    price_history, error = cached_api_request(history_url(BASE_API_URL, contract_id, period, bar), ttl=HISTORY_CACHE_TTL)
     
     if error:
-        return render_template("error.html", error=f"Failed to get price history: {error}")
+        return render_page("error.html", error=f"Failed to get price history: {error}")
+
+    price_history = price_history or {}
+    conids, fields, columns = indicators.compute({contract_id: price_history.get('data', [])}, ["sma:20", "rsi:14"])
+    indicator_series = indicators.columnar(conids, fields, columns)[contract_id]
 
-    return render_template("contract.html", price_history=price_history or {}, contract=contract)
+    return render_page("contract.html", price_history=price_history, contract=contract, indicators=indicator_series)
 
 
 @app.route("/orders")
@@ -208,16 +440,23 @@ def orders():
     try:
         BASE_API_URL = get_base_api_url(request)
         # Güvenli API isteği
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view orders.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view orders.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
+        tracker = get_order_tracker(BASE_API_URL)
+
+        if tracker.ready:
+            # Arka planda takip edilen emir tablosunu kullan
+            orders, _ = tracker.snapshot()
+            return render_page("orders.html", orders=orders)
+
         # Güvenli API isteği
         response_data, error = safe_api_request(f"{BASE_API_URL}/iserver/account/orders")
         
@@ -227,23 +466,18 @@ def orders():
                 logger.warning("Empty or invalid orders response, using empty list")
                 response_data = []
             else:
-                return render_template("error.html", error=f"Failed to get orders: {error}")
+                return render_page("error.html", error=f"Failed to get orders: {error}")
         
         # Yanıt içeriğini logla
         logger.info(f"Orders API response: {response_data}")
         
-        # 'orders' anahtarı var mı kontrol et, yoksa boş liste kullan
-        orders = []
-        if isinstance(response_data, dict) and 'orders' in response_data:
-            orders = response_data['orders']
-        elif isinstance(response_data, list):
-            # Bazı durumlarda API doğrudan emirleri liste olarak döndürebilir
-            orders = response_data
+        orders = order_tracker.extract_orders(response_data)
+        tracker.apply(orders)
         
-        return render_template("orders.html", orders=orders)
+        return render_page("orders.html", orders=orders)
     except Exception as e:
         logger.exception("Error fetching orders")
-        return render_template("error.html", error=str(e))
+        return render_page("error.html", error=str(e))
 
 
 @app.route("/order", methods=['POST'])
@@ -253,17 +487,14 @@ def place_order():
         
         print("== placing order ==")
 
-        # Güvenli API isteği
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
-        
+        account, error = get_default_account(BASE_API_URL)
+
+        if error == "no_accounts":
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+
         if error:
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
-        
-        if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
-        
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
+
         account_id = account["id"]
 
         data = {
@@ -283,29 +514,27 @@ def place_order():
         result, error = safe_api_request(f"{BASE_API_URL}/iserver/account/{account_id}/orders", method='post', json=data)
         
         if error:
-            return render_template("error.html", error=f"Failed to place order: {error}")
+            return render_page("error.html", error=f"Failed to place order: {error}")
 
+        get_order_tracker(BASE_API_URL).poke()
         return redirect("/orders")
     except Exception as e:
         logger.exception("Error placing order")
-        return render_template("error.html", error=f"Error placing order: {str(e)}")
+        return render_page("error.html", error=f"Error placing order: {str(e)}")
 
 @app.route("/orders/<order_id>/cancel")
 def cancel_order(order_id):
     try:
         BASE_API_URL = get_base_api_url(request)
         
-        # Güvenli API isteği
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
-        
+        account, error = get_default_account(BASE_API_URL)
+
+        if error == "no_accounts":
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+
         if error:
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
-        
-        if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
-        
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
+
         account_id = account["id"]
         
         cancel_url = f"{BASE_API_URL}/iserver/account/{account_id}/order/{order_id}" 
@@ -314,13 +543,318 @@ def cancel_order(order_id):
         result, error = safe_api_request(cancel_url, method='delete')
         
         if error:
-            return render_template("error.html", error=f"Failed to cancel order: {error}")
+            return render_page("error.html", error=f"Failed to cancel order: {error}")
 
+        get_order_tracker(BASE_API_URL).poke()
         return redirect("/orders")
     except Exception as e:
         logger.exception("Error canceling order")
-        return render_template("error.html", error=f"Error canceling order: {str(e)}")
+        return render_page("error.html", error=f"Error canceling order: {str(e)}")
+
+
+def build_gateway_order(item):
+    """Validate one batch order entry and convert it to the gateway order format"""
+    order = {
+        "conid": int(item['conid']),
+        "orderType": item.get('orderType', 'LMT'),
+        "quantity": float(item['quantity']),
+        "side": str(item['side']).upper(),
+        "tif": item.get('tif', 'GTC')
+    }
+
+    if order["side"] not in ("BUY", "SELL"):
+        raise ValueError(f"Invalid side: {item['side']}")
+
+    if order["quantity"] <= 0:
+        raise ValueError("Quantity must be positive")
+
+    if order["quantity"].is_integer():
+        order["quantity"] = int(order["quantity"])
+
+    if order["orderType"] in ("LMT", "STOP_LIMIT"):
+        order["price"] = float(item['price'])
+
+    for key in ("auxPrice", "cOID", "outsideRTH", "listingExchange"):
+        if key in item:
+            order[key] = item[key]
+
+    return order
+
+def order_results_from_reply(reply, count):
+    """Split a gateway order/reply response into one result per submitted order"""
+    if isinstance(reply, dict):
+        return [{"status": "rejected", "error": reply.get('error', reply)}] * count
+
+    reply = reply or []
+
+    # Confirmation prompt: the whole chunk waits on the same reply id
+    if reply and 'id' in reply[0] and 'message' in reply[0]:
+        prompt = {
+            "status": "confirmation_required",
+            "replyId": reply[0]['id'],
+            "messages": reply[0].get('message', [])
+        }
+        return [dict(prompt) for _ in range(count)]
+
+    results = []
+    for i in range(count):
+        if i < len(reply):
+            item = reply[i]
+            results.append({
+                "status": "submitted",
+                "orderId": item.get('order_id'),
+                "orderStatus": item.get('order_status')
+            })
+        else:
+            results.append({"status": "unknown", "error": "No gateway result for this order"})
+    return results
+
+@app.route("/api/orders/batch", methods=['POST'])
+def api_place_orders():
+    """Place many orders at once; returns one result per submitted order"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        payload = request.get_json(silent=True) or {}
+        items = payload.get('orders')
+
+        if not isinstance(items, list) or not items:
+            return json_response({"error": "Request body must contain a non-empty 'orders' list"}, 400)
+
+        account_id = payload.get('accountId')
+        if not account_id:
+            account, error = get_default_account(BASE_API_URL)
+            if error:
+                return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+            account_id = account["id"]
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, build_gateway_order(item)))
+            except (KeyError, TypeError, ValueError) as e:
+                results[index] = {"index": index, "status": "invalid", "error": str(e)}
+
+        chunks = [valid[i:i + ORDER_BATCH_SIZE] for i in range(0, len(valid), ORDER_BATCH_SIZE)]
+
+        def submit(chunk):
+            data = {"orders": [order for _, order in chunk]}
+            return safe_api_request(f"{BASE_API_URL}/iserver/account/{account_id}/orders", method='post', json=data)
+
+        for chunk, (reply, error) in zip(chunks, paced_map(submit, chunks)):
+            if error:
+                chunk_results = [{"status": "error", "error": error}] * len(chunk)
+            else:
+                chunk_results = order_results_from_reply(reply, len(chunk))
+
+            for (index, order), result in zip(chunk, chunk_results):
+                results[index] = dict(result, index=index, conid=order["conid"])
+
+        get_order_tracker(BASE_API_URL).poke()
+        return json_response({"accountId": account_id, "results": results})
+    except Exception as e:
+        logger.exception("Error in batch order route")
+        return json_response({"error": f"Error placing orders: {str(e)}"}, 500)
+
+@app.route("/api/orders/reply/<reply_id>", methods=['POST'])
+def api_order_reply(reply_id):
+    """Answer an order confirmation prompt returned by /api/orders/batch"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        payload = request.get_json(silent=True) or {}
+        confirmed = bool(payload.get('confirmed', True))
+
+        reply, error = safe_api_request(f"{BASE_API_URL}/iserver/reply/{reply_id}", method='post', json={"confirmed": confirmed})
+
+        if error:
+            return json_response({"error": f"Failed to reply to {reply_id}: {error}"}, 500)
+
+        count = len(reply) if isinstance(reply, list) and reply else 1
+        return json_response({"replyId": reply_id, "results": order_results_from_reply(reply, count)})
+    except Exception as e:
+        logger.exception("Error in order reply route")
+        return json_response({"error": f"Error replying to order prompt: {str(e)}"}, 500)
+
+@app.route("/api/orders/cancel", methods=['POST'])
+def api_cancel_orders():
+    """Cancel many orders concurrently under the gateway pacing limit"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        payload = request.get_json(silent=True) or {}
+        order_ids = payload.get('orderIds')
+
+        if not isinstance(order_ids, list) or not order_ids:
+            return json_response({"error": "Request body must contain a non-empty 'orderIds' list"}, 400)
 
+        account_id = payload.get('accountId')
+        if not account_id:
+            account, error = get_default_account(BASE_API_URL)
+            if error:
+                return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+            account_id = account["id"]
+
+        def cancel(order_id):
+            return safe_api_request(f"{BASE_API_URL}/iserver/account/{account_id}/order/{order_id}", method='delete')
+
+        results = []
+        for order_id, (reply, error) in zip(order_ids, paced_map(cancel, order_ids)):
+            if error:
+                results.append({"orderId": order_id, "status": "error", "error": error})
+            elif isinstance(reply, dict) and 'error' in reply:
+                results.append({"orderId": order_id, "status": "rejected", "error": reply['error']})
+            else:
+                results.append({"orderId": order_id, "status": "cancel_requested",
+                                "message": reply.get('msg') if isinstance(reply, dict) else None})
+
+        get_order_tracker(BASE_API_URL).poke()
+        return json_response({"accountId": account_id, "results": results})
+    except Exception as e:
+        logger.exception("Error in batch cancel route")
+        return json_response({"error": f"Error canceling orders: {str(e)}"}, 500)
+
+@app.route("/api/orders/changes")
+def api_order_changes():
+    """Order delta feed: events since ?cursor=, or a full reset when the cursor is unknown"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        tracker = get_order_tracker(BASE_API_URL)
+
+        if not tracker.ready:
+            tracker.poll(force=True)
+
+        if not tracker.ready:
+            return json_response({"error": f"Failed to get orders: {tracker.last_error}"}, 502)
+
+        feed = tracker.changes_since(request.args.get('cursor'))
+        feed["age"] = tracker.age()
+        return json_response(feed)
+    except Exception as e:
+        logger.exception("Error in order changes route")
+        return json_response({"error": f"Error retrieving order changes: {str(e)}"}, 500)
+
+@app.route("/api/positions/changes")
+def api_position_changes():
+    """
+    Position delta feed: opened, closed, quantity_changed and price_moved
+    events since ?cursor=, or a full reset when the cursor is unknown.
+    ?types=opened,closed limits the event types returned.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        tracker = get_position_tracker(BASE_API_URL, account["id"])
+
+        if not tracker.ready:
+            tracker.poll(force=True)
+
+        if not tracker.ready:
+            return json_response({"error": f"Failed to get positions data: {tracker.last_error}"}, 502)
+
+        types = {name for name in request.args.get('types', '').split(',') if name}
+        feed = tracker.changes_since(request.args.get('cursor'), types)
+        feed["age"] = tracker.age()
+        return json_response(feed)
+    except Exception as e:
+        logger.exception("Error in position changes route")
+        return json_response({"error": f"Error retrieving position changes: {str(e)}"}, 500)
+
+@app.route("/api/positions/stream")
+def api_position_stream():
+    """
+    The position feed as server-sent events: a reset, then one message per
+    batch of events, with the cursor as the message id. ?cursor= (or the
+    Last-Event-ID of a reconnecting EventSource) and ?types= work as for
+    /api/positions/changes.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        tracker = get_position_tracker(BASE_API_URL, account["id"])
+
+        if not tracker.ready:
+            tracker.poll(force=True)
+
+        if not tracker.ready:
+            return json_response({"error": f"Failed to get positions data: {tracker.last_error}"}, 502)
+
+        types = {name for name in request.args.get('types', '').split(',') if name}
+        subscription = tracker.subscribe(request.headers.get('Last-Event-ID') or request.args.get('cursor'), types)
+        return Response(change_feed.event_stream(tracker, subscription, position_tracker.POSITION_STREAM_SECONDS),
+                        mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except Exception as e:
+        logger.exception("Error in position stream route")
+        return json_response({"error": f"Error streaming position changes: {str(e)}"}, 500)
+
+@app.route("/api/alerts", methods=['GET', 'POST'])
+def api_alerts():
+    """
+    GET lists active price alerts (?conid=, ?limit=). POST creates one alert
+    or a list of them: {"conid", "kind": "above"|"below"|"move_pct", "level"
+    or "pct", "reference", "note"}. A move_pct alert without a reference is
+    measured from the current last price.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        engine = get_alert_engine(BASE_API_URL)
+
+        if request.method == 'GET':
+            limit = request.args.get('limit', 1000, type=int)
+            return json_response({"alerts": engine.active(request.args.get('conid'), limit), "stats": engine.stats()})
+
+        payload = request.get_json(silent=True)
+        items = payload if isinstance(payload, list) else [payload]
+        definitions = []
+        for item in items:
+            alert, error = alerts.validate(item)
+            if error:
+                return json_response({"error": error}, 400)
+            definitions.append(alert)
+
+        unreferenced = [alert['conid'] for alert in definitions if alert['kind'] == 'move_pct' and 'reference' not in alert]
+        if unreferenced:
+            quotes_by_conid = get_quotes(BASE_API_URL, unreferenced)
+            for alert in definitions:
+                if alert['kind'] == 'move_pct' and 'reference' not in alert:
+                    last = (quotes_by_conid.get(alert['conid']) or {}).get('last')
+                    if last is None:
+                        return json_response({"error": f"No last price for {alert['conid']} yet; pass a reference"}, 409)
+                    alert['reference'] = last
+
+        created = engine.create(definitions)
+        # The poller exits when no alerts are left; restart it for the new ones
+        get_alert_engine(BASE_API_URL)
+        return json_response({"alerts": created}, 201)
+    except Exception as e:
+        logger.exception("Error in alerts route")
+        return json_response({"error": f"Error handling alerts: {str(e)}"}, 500)
+
+@app.route("/api/alerts/<int:alert_id>", methods=['DELETE'])
+def api_delete_alert(alert_id):
+    try:
+        if not alerts.get_engine().delete(alert_id):
+            return json_response({"error": "Alert not found or already triggered"}, 404)
+        return json_response({"deleted": alert_id})
+    except Exception as e:
+        logger.exception("Error in delete alert route")
+        return json_response({"error": f"Error deleting alert: {str(e)}"}, 500)
+
+@app.route("/api/alerts/triggered")
+def api_triggered_alerts():
+    """Alerts triggered after ?since= (epoch seconds), oldest first; use the last triggeredAt as the next since"""
+    try:
+        engine = get_alert_engine(get_base_api_url(request))
+        since = request.args.get('since', 0, type=float)
+        limit = request.args.get('limit', 1000, type=int)
+        return json_response({"alerts": engine.triggered_since(since, limit)})
+    except Exception as e:
+        logger.exception("Error in triggered alerts route")
+        return json_response({"error": f"Error retrieving triggered alerts: {str(e)}"}, 500)
 
 @app.route("/portfolio")
 def portfolio():
@@ -328,33 +862,32 @@ def portfolio():
         BASE_API_URL = get_base_api_url(request)
         
         # Güvenli API isteği
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view portfolio.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view portfolio.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Güvenli API isteği
-        positions, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/positions/0")
+        positions, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/positions/0")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Authentication error. Please log in to Interactive Brokers Gateway.")
-            return render_template("error.html", error=f"Failed to get positions: {error}")
+                return render_page("auth_required.html", message="Authentication error. Please log in to Interactive Brokers Gateway.")
+            return render_page("error.html", error=f"Failed to get positions: {error}")
 
         # return my positions, how much cash i have in this account
-        return render_template("portfolio.html", positions=positions or [])
+        return render_page("portfolio.html", positions=positions or [])
     except Exception as e:
         logger.exception("Error in portfolio route")
-        return render_template("error.html", error=f"Error retrieving portfolio: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving portfolio: {str(e)}")
 
 @app.route("/watchlists")
 def watchlists():
@@ -366,55 +899,93 @@ def watchlists():
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view watchlists.")
-            return render_template("error.html", error=f"Failed to get watchlists: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view watchlists.")
+            return render_page("error.html", error=f"Failed to get watchlists: {error}")
             
         if not watchlist_response or 'data' not in watchlist_response:
-            return render_template("error.html", error="Invalid watchlists response format")
+            return render_page("error.html", error="Invalid watchlists response format")
 
         watchlist_data = watchlist_response["data"]
         watchlists = []
         if "user_lists" in watchlist_data:
             watchlists = watchlist_data["user_lists"]
             
-        return render_template("watchlists.html", watchlists=watchlists)
+        return render_page("watchlists.html", watchlists=watchlists)
     except Exception as e:
         logger.exception("Error in watchlists route")
-        return render_template("error.html", error=f"Error retrieving watchlists: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving watchlists: {str(e)}")
+
+
+def build_watchlist(BASE_API_URL, id):
+    """Watchlist rows enriched with contract metadata and live quotes; returns (watchlist, error)"""
+    # Güvenli API isteği
+    watchlist, error = safe_api_request(f"{BASE_API_URL}/iserver/watchlist?id={id}")
+
+    if error:
+        return None, error
 
+    watchlist = watchlist or {}
+    instruments = watchlist.get('instruments', [])
+    conids = [instrument.get('conid') for instrument in instruments]
+    contracts = resolve_contracts(BASE_API_URL, conids)
+    quotes_by_conid = get_quotes(BASE_API_URL, conids)
+    for instrument in instruments:
+        instrument['contract'] = contracts.get(str(instrument.get('conid')), {})
+        instrument['quote'] = quotes_by_conid.get(str(instrument.get('conid')), {})
+
+    return watchlist, None
 
 @app.route("/watchlists/<int:id>")
 def watchlist_detail(id):
     try:
-        # Güvenli API isteği
-        watchlist, error = safe_api_request(f"{BASE_API_URL}/iserver/watchlist?id={id}")
+        BASE_API_URL = get_base_api_url(request)
+        watchlist, error = build_watchlist(BASE_API_URL, id)
         
         if error:
-            return render_template("error.html", error=f"Failed to get watchlist details: {error}")
+            return render_page("error.html", error=f"Failed to get watchlist details: {error}")
 
-        return render_template("watchlist.html", watchlist=watchlist or {})
+        return render_page("watchlist.html", watchlist=watchlist)
     except Exception as e:
         logger.exception("Error in watchlist_detail route")
-        return render_template("error.html", error=f"Error retrieving watchlist details: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving watchlist details: {str(e)}")
+
+@app.route("/api/watchlists/<int:id>")
+def api_watchlist(id):
+    """JSON API endpoint for a watchlist with last/bid/ask/change per row"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        watchlist, error = build_watchlist(BASE_API_URL, id)
+
+        if error:
+            return json_response({"error": f"Failed to get watchlist details: {error}"}, 500)
+
+        return json_response(watchlist)
+    except Exception as e:
+        logger.exception("Error in API watchlist route")
+        return json_response({"error": f"Error retrieving watchlist details: {str(e)}"}, 500)
 
 
 @app.route("/watchlists/<int:id>/delete")
 def watchlist_delete(id):
     try:
+        BASE_API_URL = get_base_api_url(request)
+        
         # Güvenli API isteği
         result, error = safe_api_request(f"{BASE_API_URL}/iserver/watchlist?id={id}", method='delete')
         
         if error:
-            return render_template("error.html", error=f"Failed to delete watchlist: {error}")
+            return render_page("error.html", error=f"Failed to delete watchlist: {error}")
 
         return redirect("/watchlists")
     except Exception as e:
         logger.exception("Error in watchlist_delete route")
-        return render_template("error.html", error=f"Error deleting watchlist: {str(e)}")
+        return render_page("error.html", error=f"Error deleting watchlist: {str(e)}")
 
 @app.route("/watchlists/create", methods=['POST'])
 def create_watchlist():
     try:
+        BASE_API_URL = get_base_api_url(request)
+        
         data = request.get_json()
         name = data['name']
 
@@ -428,10 +999,10 @@ def create_watchlist():
                 contract_response, error = safe_api_request(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true&secType=STK")
                 
                 if error:
-                    return render_template("error.html", error=f"Failed to get contract ID for {symbol}: {error}")
+                    return render_page("error.html", error=f"Failed to get contract ID for {symbol}: {error}")
                     
                 if not contract_response or not contract_response[0] or 'conid' not in contract_response[0]:
-                    return render_template("error.html", error=f"Invalid contract response for {symbol}")
+                    return render_page("error.html", error=f"Invalid contract response for {symbol}")
                     
                 contract_id = contract_response[0]['conid']
                 rows.append({"C": contract_id})
@@ -446,12 +1017,12 @@ def create_watchlist():
         result, error = safe_api_request(f"{BASE_API_URL}/iserver/watchlist", method='post', json=watchlist_data)
         
         if error:
-            return render_template("error.html", error=f"Failed to create watchlist: {error}")
+            return render_page("error.html", error=f"Failed to create watchlist: {error}")
 
         return redirect("/watchlists")
     except Exception as e:
         logger.exception("Error in create_watchlist route")
-        return render_template("error.html", error=f"Error creating watchlist: {str(e)}")
+        return render_page("error.html", error=f"Error creating watchlist: {str(e)}")
 
 @app.route("/scanner")
 def scanner():
@@ -459,12 +1030,12 @@ def scanner():
         BASE_API_URL = get_base_api_url(request)
         
         # Güvenli API isteği
-        params_response, error = safe_api_request(f"{BASE_API_URL}/iserver/scanner/params")
+        params_response, error = cached_api_request(f"{BASE_API_URL}/iserver/scanner/params", ttl=SCANNER_PARAMS_TTL)
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to use scanner.")
-            return render_template("error.html", error=f"Failed to get scanner parameters: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to use scanner.")
+            return render_page("error.html", error=f"Failed to get scanner parameters: {error}")
             
         params = params_response
 
@@ -521,28 +1092,75 @@ def scanner():
             scan_response, error = safe_api_request(f"{BASE_API_URL}/iserver/scanner/run", method='post', json=data)
             
             if error:
-                return render_template("error.html", error=f"Failed to run scanner: {error}")
+                return render_page("error.html", error=f"Failed to run scanner: {error}")
                 
             scan_results = scan_response
 
-        return render_template("scanner.html", params=params, scanner_map=scanner_map, filter_map=filter_map, scan_results=scan_results or [])
+        return render_page("scanner.html", params=params, scanner_map=scanner_map, filter_map=filter_map, scan_results=scan_results or [])
     except Exception as e:
         logger.exception("Error in scanner route")
-        return render_template("error.html", error=f"Error using scanner: {str(e)}")
+        return render_page("error.html", error=f"Error using scanner: {str(e)}")
 
 # Yetkilendirme sayfası
 @app.route("/auth")
 def auth():
     gateway_url = get_gateway_url(request)
-    return render_template("auth_required.html", 
-                         message="Please log in to Interactive Brokers Gateway first.",
-                         gateway_url=gateway_url)
+    return render_page("auth_required.html", 
+                     message="Please log in to Interactive Brokers Gateway first.",
+                     gateway_url=gateway_url)
 
 # Hata sayfası
 @app.route("/error")
 def error():
     error_message = request.args.get('message', 'An unknown error occurred')
-    return render_template("error.html", error=error_message)
+    return render_page("error.html", error=error_message)
+
+def refresh_nav_store(BASE_API_URL, account_id):
+    """Fetch only the /pa/performance window missing from the NAV store and append it; True if stored"""
+    api_period = nav_store.gap_period(nav_store.last_date(account_id))
+
+    # Prepare request JSON payload
+    json_content = {
+        "acctIds": [account_id],
+        "period": api_period
+    }
+
+    # Make POST request to get performance data
+    logger.info(f"Refreshing NAV store for {account_id} with period {api_period}")
+    performance_data, error = safe_api_request(f"{BASE_API_URL}/pa/performance", method='post', json=json_content)
+
+    if error:
+        logger.error(f"Failed to get performance data: {error}")
+        return False
+
+    # Check if we have valid nav data
+    if not (isinstance(performance_data, dict) and 'nav' in performance_data and
+            'data' in performance_data['nav'] and performance_data['nav']['data'] and
+            'dates' in performance_data['nav'] and performance_data['nav']['dates']):
+        logger.warning("Invalid performance data response format, NAV store not updated")
+        return False
+
+    dates = performance_data['nav']['dates']
+    navs = performance_data['nav']['data'][0].get('navs', [])
+
+    returns = None
+    if 'cps' in performance_data and 'data' in performance_data['cps'] and performance_data['cps']['data']:
+        returns = performance_data['cps']['data'][0].get('returns', [])
+
+    count = nav_store.append(account_id, dates, navs, returns)
+    logger.info(f"Stored {count} NAV points for {account_id}")
+    return True
+
+def refresh_nav_store_if_due(BASE_API_URL, account_id):
+    """Refresh the NAV store if this worker claims the refresh, releasing the claim when it fails"""
+    if not nav_store.claim_refresh(account_id):
+        return
+    stored = False
+    try:
+        stored = refresh_nav_store(BASE_API_URL, account_id)
+    finally:
+        if not stored:
+            nav_store.release_refresh(account_id)
 
 # Performans bilgileri
 @app.route("/performance")
@@ -553,104 +1171,67 @@ def performance():
         period = request.args.get('period', '1m')
         
         # Hesapları kontrol et
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view performance.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view performance.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
-        # Period mapping for API
-        period_map = {
-            '1d': '1D',
-            '1w': '1W',
-            '1m': '1M',
-            '3m': '3M',
-            '6m': '6M',
-            '1y': '1Y',
-            'all': 'YTD'
-        }
-        
-        api_period = period_map.get(period, '1M')  # Default to monthly if period not recognized
-        
-        # New performance API endpoint
-        request_url = f"{BASE_API_URL}/pa/performance"
-        
-        # Prepare request JSON payload
-        json_content = {
-            "acctIds": [account_id],
-            "period": api_period
-        }
-        
-        # Make POST request to get performance data
-        logger.info(f"Getting performance data from {request_url} with payload: {json_content}")
-        performance_data, error = safe_api_request(request_url, method='post', json=json_content)
-        
-        if error:
-            logger.error(f"Failed to get performance data: {error}")
-            # Return mock data as fallback
-            return json.dumps(generate_mock_performance_data(period, 10000))
-        
-        logger.info(f"Performance data response: {json.dumps(performance_data, indent=2)}")
-        
+        # Eksik günleri gateway'den çek, sonra her periyodu yerel depodan dilimle
+        refresh_nav_store_if_due(BASE_API_URL, account_id)
+
+        start = request.args.get('start')
+        end = request.args.get('end')
+        if not start and not end:
+            start = nav_store.period_start(period)
+
+        rows = nav_store.series(account_id, start, end)
+
+        if not rows:
+            logger.warning("NAV store is empty for this range, using mock data")
+            return json_response(generate_mock_performance_data(period, 10000))
+
         # Process the performance data
         processed_data = {
             "data": [],
-            "startValue": 0,
-            "endValue": 0,
-            "percentChange": 0
+            "startValue": rows[0][1],
+            "endValue": rows[-1][1],
+            "percentChange": 0,
+            "source": "nav_store",
+            # The range actually covered; 'all' only reaches back as far as the store's backfill
+            "range": {"start": rows[0][0], "end": rows[-1][0]}
         }
-        
-        # Check if we have valid nav data
-        if (isinstance(performance_data, dict) and 'nav' in performance_data and 
-            'data' in performance_data['nav'] and performance_data['nav']['data'] and
-            'dates' in performance_data['nav'] and performance_data['nav']['dates']):
-            
-            nav_data = performance_data['nav']['data'][0]
-            dates = performance_data['nav']['dates']
-            navs = nav_data.get('navs', [])
-            
-            # Create data points from dates and navs
-            for i, (date, nav) in enumerate(zip(dates, navs)):
-                processed_data['data'].append({
-                    "date": date,
-                    "value": float(nav)
-                })
-            
-            # Set start and end values
-            if processed_data['data']:
-                processed_data['startValue'] = processed_data['data'][0]['value']
-                processed_data['endValue'] = processed_data['data'][-1]['value']
-                
-                # Calculate percent change
-                if processed_data['startValue'] > 0:
-                    processed_data['percentChange'] = round(
-                        ((processed_data['endValue'] - processed_data['startValue']) / 
-                         processed_data['startValue']) * 100, 
-                        2
-                    )
-                
-                # Add percentage returns if available
-                if 'cps' in performance_data and 'data' in performance_data['cps'] and performance_data['cps']['data']:
-                    returns = performance_data['cps']['data'][0].get('returns', [])
-                    for i, ret in enumerate(returns):
-                        if i < len(processed_data['data']):
-                            processed_data['data'][i]['return'] = float(ret)
-        else:
-            logger.warning("Invalid performance data response format, using mock data")
-            return json.dumps(generate_mock_performance_data(period, 10000))
-        
-        return json.dumps(processed_data)
+
+        # Chain daily returns into a cumulative return from the start of the range
+        growth = 1.0
+        for i, (date, nav, daily_return) in enumerate(rows):
+            if i > 0 and daily_return is not None:
+                growth *= 1 + daily_return
+            processed_data['data'].append({
+                "date": date,
+                "value": nav,
+                "return": growth - 1
+            })
+
+        # Calculate percent change
+        if processed_data['startValue'] > 0:
+            processed_data['percentChange'] = round(
+                ((processed_data['endValue'] - processed_data['startValue']) /
+                 processed_data['startValue']) * 100,
+                2
+            )
+
+        return json_response(processed_data)
     except Exception as e:
         logger.exception("Error in performance route")
-        return json.dumps({
+        return json_response({
             "error": str(e),
             "data": [],
             "startValue": 0,
@@ -720,25 +1301,24 @@ def account_summary():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view account summary.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view account summary.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch account summary from IBKR API
-        summary_data, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/summary")
+        summary_data, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/summary")
         
         if error:
-            return render_template("error.html", error=f"Failed to get account summary: {error}")
+            return render_page("error.html", error=f"Failed to get account summary: {error}")
             
         logger.info(f"Summary data response: {json.dumps(summary_data, indent=2)}")
         
@@ -767,10 +1347,10 @@ def account_summary():
                 # Other account info
                 processed_summary["account_info"][key] = value
         
-        return render_template("summary.html", summary=summary_data, processed=processed_summary, account=account)
+        return render_page("summary.html", summary=summary_data, processed=processed_summary, account=account)
     except Exception as e:
         logger.exception("Error in account summary route")
-        return render_template("error.html", error=f"Error retrieving account summary: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving account summary: {str(e)}")
 
 @app.route("/ledger")
 def portfolio_ledger():
@@ -778,32 +1358,31 @@ def portfolio_ledger():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view ledger information.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view ledger information.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch ledger data from IBKR API
-        ledger_data, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/ledger")
+        ledger_data, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/ledger")
         
         if error:
-            return render_template("error.html", error=f"Failed to get ledger data: {error}")
+            return render_page("error.html", error=f"Failed to get ledger data: {error}")
             
         logger.info(f"Ledger data response: {json.dumps(ledger_data, indent=2)}")
         
-        return render_template("ledger.html", ledger=ledger_data, account=account)
+        return render_page("ledger.html", ledger=ledger_data, account=account)
     except Exception as e:
         logger.exception("Error in portfolio ledger route")
-        return render_template("error.html", error=f"Error retrieving portfolio ledger: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving portfolio ledger: {str(e)}")
 
 @app.route("/positions")
 def positions():
@@ -811,42 +1390,36 @@ def positions():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view positions.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view positions.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch positions data from IBKR API using portfolio2 endpoint
         # Sort by position and display in ascending order
-        positions_data, error = safe_api_request(f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position")
+        positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position")
         
         if error:
-            return render_template("error.html", error=f"Failed to get positions data: {error}")
+            return render_page("error.html", error=f"Failed to get positions data: {error}")
             
         logger.info(f"Positions data response: {json.dumps(positions_data, indent=2)}")
         
+        prefetch_contracts(BASE_API_URL, [p.get('conid') for p in normalize_positions(positions_data)])
+        
         # Process positions data
-        positions_list = []
+        positions_list = normalize_positions(positions_data)
         total_market_value = 0
         total_cost_basis = 0
         total_unrealized_pnl = 0
         
-        # Check if positions_data is a list of positions or a single position object
-        if isinstance(positions_data, list):
-            positions_list = positions_data
-        elif isinstance(positions_data, dict) and 'conid' in positions_data:
-            # Single position returned as an object
-            positions_list = [positions_data]
-        
         # Calculate totals
         for position in positions_list:
             if 'marketValue' in position:
@@ -867,10 +1440,48 @@ def positions():
             'totalPositions': len(positions_list)
         }
         
-        return render_template("positions.html", positions=positions_list, account=account, summary=summary)
+        return render_page("positions.html", positions=positions_list, account=account, summary=summary)
     except Exception as e:
         logger.exception("Error in positions route")
-        return render_template("error.html", error=f"Error retrieving positions: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving positions: {str(e)}")
+
+def allocation_breakdown(allocation_data, key):
+    """Chart data for one allocation breakdown: labels with aligned long and (positive) short values"""
+    data = {
+        'labels': [],
+        'long_values': [],
+        'short_values': [],
+        'total_long': 0,
+        'total_short': 0
+    }
+    if key not in allocation_data:
+        return data
+
+    # label -> index, so matching shorts to longs stays linear for accounts with many categories
+    index = {}
+    if 'long' in allocation_data[key]:
+        for label, value in allocation_data[key]['long'].items():
+            index[label] = len(data['labels'])
+            data['labels'].append(label)
+            data['long_values'].append(float(value))
+            data['total_long'] += float(value)
+
+    if 'short' in allocation_data[key]:
+        for label, value in allocation_data[key]['short'].items():
+            idx = index.get(label)
+            if idx is None:
+                # Add 0 for the long side if this label has no long position
+                idx = index[label] = len(data['labels'])
+                data['labels'].append(label)
+                data['long_values'].append(0)
+
+            if len(data['short_values']) <= idx:
+                data['short_values'].extend([0] * (idx + 1 - len(data['short_values'])))
+
+            # Short values are shown as positive numbers
+            data['short_values'][idx] = abs(float(value))
+            data['total_short'] += abs(float(value))
+    return data
 
 @app.route("/allocation")
 def portfolio_allocation():
@@ -878,141 +1489,33 @@ def portfolio_allocation():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view portfolio allocation.")
-            return render_template("error.html", error=f"Failed to get accounts: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view portfolio allocation.")
+            return render_page("error.html", error=f"Failed to get accounts: {error}")
         
         if not accounts:
-            return render_template("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
+            return render_page("auth_required.html", message="No accounts found. Please log in to Interactive Brokers Gateway.")
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch allocation data from IBKR API
-        allocation_data, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/allocation")
+        allocation_data, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/allocation")
         
         if error:
-            return render_template("error.html", error=f"Failed to get allocation data: {error}")
+            return render_page("error.html", error=f"Failed to get allocation data: {error}")
             
         logger.info(f"Allocation data response: {json.dumps(allocation_data, indent=2)}")
         
         # Process allocation data for visualization
-        # Extract asset class data
-        asset_class_data = {
-            'labels': [],
-            'long_values': [],
-            'short_values': [],
-            'total_long': 0,
-            'total_short': 0
-        }
+        asset_class_data = allocation_breakdown(allocation_data, 'assetClass')
+        sector_data = allocation_breakdown(allocation_data, 'sector')
+        group_data = allocation_breakdown(allocation_data, 'group')
         
-        if 'assetClass' in allocation_data:
-            # Process long positions
-            if 'long' in allocation_data['assetClass']:
-                for asset_class, value in allocation_data['assetClass']['long'].items():
-                    asset_class_data['labels'].append(asset_class)
-                    asset_class_data['long_values'].append(float(value))
-                    asset_class_data['total_long'] += float(value)
-                    
-            # Process short positions
-            if 'short' in allocation_data['assetClass']:
-                # For short positions, ensure we have matching labels with longs
-                for asset_class, value in allocation_data['assetClass']['short'].items():
-                    if asset_class not in asset_class_data['labels']:
-                        asset_class_data['labels'].append(asset_class)
-                        # Add 0 for long position if this asset class doesn't exist there
-                        asset_class_data['long_values'].append(0)
-                    
-                    # Find the index of this asset class
-                    idx = asset_class_data['labels'].index(asset_class)
-                    
-                    # Extend short_values list if needed
-                    while len(asset_class_data['short_values']) <= idx:
-                        asset_class_data['short_values'].append(0)
-                    
-                    # Set the short value (convert to positive for visualization)
-                    asset_class_data['short_values'][idx] = abs(float(value))
-                    asset_class_data['total_short'] += abs(float(value))
-        
-        # Extract sector data
-        sector_data = {
-            'labels': [],
-            'long_values': [],
-            'short_values': [],
-            'total_long': 0,
-            'total_short': 0
-        }
-        
-        if 'sector' in allocation_data:
-            # Process long positions
-            if 'long' in allocation_data['sector']:
-                for sector, value in allocation_data['sector']['long'].items():
-                    sector_data['labels'].append(sector)
-                    sector_data['long_values'].append(float(value))
-                    sector_data['total_long'] += float(value)
-                    
-            # Process short positions
-            if 'short' in allocation_data['sector']:
-                # For short positions, ensure we have matching labels with longs
-                for sector, value in allocation_data['sector']['short'].items():
-                    if sector not in sector_data['labels']:
-                        sector_data['labels'].append(sector)
-                        # Add 0 for long position if this sector doesn't exist there
-                        sector_data['long_values'].append(0)
-                    
-                    # Find the index of this sector
-                    idx = sector_data['labels'].index(sector)
-                    
-                    # Extend short_values list if needed
-                    while len(sector_data['short_values']) <= idx:
-                        sector_data['short_values'].append(0)
-                    
-                    # Set the short value (convert to positive for visualization)
-                    sector_data['short_values'][idx] = abs(float(value))
-                    sector_data['total_short'] += abs(float(value))
-        
-        # Extract group data
-        group_data = {
-            'labels': [],
-            'long_values': [],
-            'short_values': [],
-            'total_long': 0,
-            'total_short': 0
-        }
-        
-        if 'group' in allocation_data:
-            # Process long positions
-            if 'long' in allocation_data['group']:
-                for group, value in allocation_data['group']['long'].items():
-                    group_data['labels'].append(group)
-                    group_data['long_values'].append(float(value))
-                    group_data['total_long'] += float(value)
-                    
-            # Process short positions
-            if 'short' in allocation_data['group']:
-                # For short positions, ensure we have matching labels with longs
-                for group, value in allocation_data['group']['short'].items():
-                    if group not in group_data['labels']:
-                        group_data['labels'].append(group)
-                        # Add 0 for long position if this group doesn't exist there
-                        group_data['long_values'].append(0)
-                    
-                    # Find the index of this group
-                    idx = group_data['labels'].index(group)
-                    
-                    # Extend short_values list if needed
-                    while len(group_data['short_values']) <= idx:
-                        group_data['short_values'].append(0)
-                    
-                    # Set the short value (convert to positive for visualization)
-                    group_data['short_values'][idx] = abs(float(value))
-                    group_data['total_short'] += abs(float(value))
-        
-        return render_template(
+        return render_page(
             "allocation.html", 
             allocation=allocation_data,
             asset_class_data=asset_class_data,
@@ -1022,7 +1525,7 @@ def portfolio_allocation():
         )
     except Exception as e:
         logger.exception("Error in portfolio allocation route")
-        return render_template("error.html", error=f"Error retrieving portfolio allocation: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving portfolio allocation: {str(e)}")
 
 @app.route("/api/allocation")
 def api_allocation():
@@ -1031,23 +1534,22 @@ def api_allocation():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
-            return jsonify({"error": f"Failed to get accounts: {error}"}), 500
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
         
         if not accounts:
-            return jsonify({"error": "No accounts found"}), 404
+            return json_response({"error": "No accounts found"}, 404)
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch allocation data from IBKR API
-        allocation_data, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/allocation")
+        allocation_data, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/allocation")
         
         if error:
-            return jsonify({"error": f"Failed to get allocation data: {error}"}), 500
+            return json_response({"error": f"Failed to get allocation data: {error}"}, 500)
             
         logger.info(f"API Allocation data response: {json.dumps(allocation_data, indent=2)}")
         
@@ -1090,11 +1592,11 @@ def api_allocation():
                     "color": industry_colors[i % len(industry_colors)]
                 })
         
-        return jsonify(result)
+        return json_response(result)
     
     except Exception as e:
         logger.exception("Error in API allocation route")
-        return jsonify({"error": f"Error retrieving portfolio allocation: {str(e)}"}), 500
+        return json_response({"error": f"Error retrieving portfolio allocation: {str(e)}"}, 500)
 
 @app.route("/api/summary")
 def api_summary():
@@ -1103,31 +1605,80 @@ def api_summary():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
-            return jsonify({"error": f"Failed to get accounts: {error}"}), 500
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
         
         if not accounts:
-            return jsonify({"error": "No accounts found"}), 404
+            return json_response({"error": "No accounts found"}, 404)
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
-        account_id = account["id"]
+        account = select_account(accounts)
         
-        # Fetch account summary from IBKR API
-        summary_data, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/summary")
+        snapshot, age, error = get_dashboard_snapshot(BASE_API_URL, account)
         
         if error:
-            return jsonify({"error": f"Failed to get summary data: {error}"}), 500
-            
-        logger.info(f"API Summary data response: {json.dumps(summary_data, indent=2)}")
+            return json_response({"error": f"Failed to get summary data: {error}"}, 500)
         
-        return jsonify(summary_data)
+        response = json_response(snapshot["summary"])
+        response.headers['X-Snapshot-Age'] = str(age)
+        return response
     
     except Exception as e:
         logger.exception("Error in API summary route")
-        return jsonify({"error": f"Error retrieving account summary: {str(e)}"}), 500
+        return json_response({"error": f"Error retrieving account summary: {str(e)}"}, 500)
+
+# Any of these switches /api/positions from the full payload to a page from the position index
+POSITION_QUERY_PARAMS = ('sort', 'order', 'q', 'limit', 'cursor', 'pnl') + tuple(position_index.FACETS)
+
+def api_positions_page(BASE_API_URL, account_id, positions_url):
+    """
+    One page of positions answered from the in-memory position index:
+    ?sort=<field>&order=asc|desc, ?sector=, ?assetClass=, ?currency= (comma-separated
+    values), ?pnl=positive|negative|zero, ?q= text search, ?limit= and ?cursor=
+    (the nextCursor of the previous page).
+    """
+    def fetch():
+        positions_data, error = cached_api_request(positions_url)
+        return normalize_positions(positions_data), error
+
+    index, error = position_index.get_index(f"{BASE_API_URL}|{account_id}", fetch)
+    if error:
+        return json_response({"error": f"Failed to get positions data: {error}"}, 500)
+
+    order = request.args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        return json_response({"error": "order must be asc or desc"}, 400)
+
+    filters = {}
+    for param in position_index.FACETS:
+        if request.args.get(param):
+            filters[param] = request.args[param].split(',')
+    if request.args.get('pnl'):
+        filters['pnl'] = request.args['pnl'].split(',')
+        if not set(value.lower() for value in filters['pnl']) <= {'positive', 'negative', 'zero'}:
+            return json_response({"error": "pnl must be positive, negative or zero"}, 400)
+
+    limit = min(max(request.args.get('limit', position_index.POSITION_PAGE_LIMIT, type=int), 1), position_index.POSITION_PAGE_MAX)
+    sort = request.args.get('sort') or 'conid'
+
+    try:
+        rows, total, next_cursor = index.page(sort, order == 'desc', filters, request.args.get('q'),
+                                              request.args.get('cursor'), limit)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+
+    prefetch_contracts(BASE_API_URL, [p.get('conid') for p in rows])
+
+    return json_response({
+        "positions": rows,
+        "total": total,
+        "count": len(rows),
+        "sort": sort,
+        "order": order,
+        "nextCursor": next_cursor,
+        "age": round(time.time() - index.built_at, 3)
+    })
 
 @app.route("/api/positions")
 def api_positions():
@@ -1136,31 +1687,573 @@ def api_positions():
         BASE_API_URL = get_base_api_url(request)
         
         # Get accounts
-        accounts, error = safe_api_request(f"{BASE_API_URL}/portfolio/accounts")
+        accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
         
         if error:
-            return jsonify({"error": f"Failed to get accounts: {error}"}), 500
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
         
         if not accounts:
-            return jsonify({"error": "No accounts found"}), 404
+            return json_response({"error": "No accounts found"}, 404)
         
-        # Try the second account if available, otherwise use the first one
-        account = accounts[1] if len(accounts) > 1 else accounts[0]
+        account = select_account(accounts)
         account_id = account["id"]
         
         # Fetch positions data from IBKR API using portfolio2 endpoint
-        positions_data, error = safe_api_request(f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position")
+        positions_url = f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position"
+
+        if any(param in request.args for param in POSITION_QUERY_PARAMS):
+            return api_positions_page(BASE_API_URL, account_id, positions_url)
+
+        positions_data, error = cached_api_request(positions_url)
         
         if error:
-            return jsonify({"error": f"Failed to get positions data: {error}"}), 500
+            return json_response({"error": f"Failed to get positions data: {error}"}, 500)
             
         logger.info(f"API Positions data response: {json.dumps(positions_data, indent=2)}")
         
-        return jsonify(positions_data)
+        prefetch_contracts(BASE_API_URL, [p.get('conid') for p in normalize_positions(positions_data)])
+        
+        return json_response(positions_data)
     
     except Exception as e:
         logger.exception("Error in API positions route")
-        return jsonify({"error": f"Error retrieving positions: {str(e)}"}), 500
+        return json_response({"error": f"Error retrieving positions: {str(e)}"}, 500)
+
+
+# Per-account endpoints merged by the household view; each one is cached per account
+HOUSEHOLD_ENDPOINTS = {
+    "summary": "/portfolio/{account_id}/summary",
+    "positions": "/portfolio2/{account_id}/positions?direction=a&sort=position",
+    "ledger": "/portfolio/{account_id}/ledger",
+    "allocation": "/portfolio/{account_id}/allocation"
+}
+
+def build_household(BASE_API_URL):
+    """Fetch every account's data concurrently and merge it; returns (household, error)"""
+    accounts, error = cached_api_request(f"{BASE_API_URL}/portfolio/accounts")
+
+    if error:
+        return None, error
+
+    if not accounts:
+        return None, "no_accounts"
+
+    jobs = [(account["id"], name, f"{BASE_API_URL}{path.format(account_id=account['id'])}")
+            for account in accounts for name, path in HOUSEHOLD_ENDPOINTS.items()]
+    results = cached_api_request_many([url for _, _, url in jobs])
+
+    per_account = {account["id"]: {"account": account, "errors": {}} for account in accounts}
+    for (account_id, name, _), (data, error) in zip(jobs, results):
+        if error:
+            per_account[account_id]["errors"][name] = error
+        else:
+            per_account[account_id][name] = normalize_positions(data) if name == "positions" else data
+
+    entries = list(per_account.values())
+    combined = {
+        "summary": household.merge_summaries([entry.get("summary") for entry in entries]),
+        "positions": household.merge_positions({entry["account"]["id"]: entry.get("positions") for entry in entries}),
+        "ledger": household.merge_ledgers([entry.get("ledger") for entry in entries]),
+        "allocation": household.merge_allocations([entry.get("allocation") for entry in entries])
+    }
+
+    # Per-account totals for the overview table
+    for entry in entries:
+        summary = entry.get("summary") or {}
+        entry["totals"] = {
+            "netLiquidation": (summary.get("netliquidation") or {}).get("amount"),
+            "totalCash": (summary.get("totalcashvalue") or {}).get("amount"),
+            "positions": len(entry.get("positions") or []),
+            "marketValue": sum(float(p.get("marketValue") or 0) for p in entry.get("positions") or [])
+        }
+
+    return {"accounts": entries, "combined": combined}, None
+
+@app.route("/household")
+def household_view():
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        data, error = build_household(BASE_API_URL)
+
+        if error:
+            if error in ("unauthorized", "no_accounts"):
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view the household.")
+            return render_page("error.html", error=f"Failed to build household view: {error}")
+
+        return render_page("household.html", accounts=data["accounts"], combined=data["combined"])
+    except Exception as e:
+        logger.exception("Error in household route")
+        return render_page("error.html", error=f"Error retrieving household view: {str(e)}")
+
+
+@app.route("/api/indicators")
+def api_indicators():
+    """
+    Technical indicators for many conids in one call.
+
+    ?conids=1,2,3 (default: every held conid), ?period=1y, ?bar=1d,
+    ?indicators=sma:20,rsi:14,... and ?view=latest for screening (last
+    value per conid) instead of full columnar series.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        period = request.args.get('period', '1y')
+        bar = request.args.get('bar', '1d')
+        view = request.args.get('view', 'series')
+        specs = [spec for spec in request.args.get('indicators', '').split(',') if spec] or indicators.DEFAULT_INDICATORS
+
+        conids = [conid for conid in request.args.get('conids', '').split(',') if conid]
+        if not conids:
+            account, error = get_default_account(BASE_API_URL)
+            if error:
+                return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+            positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account['id']}/positions?direction=a&sort=position")
+            if error:
+                return json_response({"error": f"Failed to get positions data: {error}"}, 500)
+            conids = [str(p['conid']) for p in normalize_positions(positions_data) if p.get('conid')]
+
+        results = cached_api_request_many([history_url(BASE_API_URL, conid, period, bar) for conid in conids], ttl=HISTORY_CACHE_TTL)
+
+        bars_by_conid = {}
+        errors = {}
+        for conid, (history, error) in zip(conids, results):
+            if error:
+                errors[conid] = error
+            else:
+                bars_by_conid[conid] = (history or {}).get('data', [])
+
+        try:
+            computed = indicators.compute(bars_by_conid, specs)
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+
+        result = {"period": period, "bar": bar, "indicators": specs, "errors": errors}
+        if view == 'latest':
+            result["latest"] = indicators.latest(*computed)
+        else:
+            result["series"] = indicators.columnar(*computed)
+        return json_response(result)
+    except Exception as e:
+        logger.exception("Error in API indicators route")
+        return json_response({"error": f"Error computing indicators: {str(e)}"}, 500)
+
+@app.route("/api/risk")
+def api_risk():
+    """
+    Portfolio risk for the selected account's holdings.
+
+    ?period=1y and ?bar=1d pick the history used, ?benchmark=<conid> the
+    beta benchmark and ?confidence=0.95 the VaR/CVaR level. Reports are
+    cached until positions or the latest bars change.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        period = request.args.get('period', '1y')
+        bar = request.args.get('bar', '1d')
+        benchmark = request.args.get('benchmark', risk.RISK_BENCHMARK_CONID)
+        try:
+            confidence = float(request.args.get('confidence', risk.RISK_CONFIDENCE))
+        except ValueError:
+            confidence = None
+        if confidence is None or not 0.5 <= confidence < 1:
+            return json_response({"error": "confidence must be between 0.5 and 1"}, 400)
+
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account['id']}/positions?direction=a&sort=position")
+        if error:
+            return json_response({"error": f"Failed to get positions data: {error}"}, 500)
+
+        exposures = {}
+        quantities = {}
+        for p in normalize_positions(positions_data):
+            if p.get('conid') and p.get('position'):
+                conid = str(p['conid'])
+                exposures[conid] = exposures.get(conid, 0) + float(p.get('marketValue') or 0)
+                quantities[conid] = quantities.get(conid, 0) + float(p['position'])
+
+        conids = list(dict.fromkeys(list(exposures) + ([str(benchmark)] if benchmark else [])))
+        results = cached_api_request_many([history_url(BASE_API_URL, conid, period, bar) for conid in conids], ttl=HISTORY_CACHE_TTL)
+
+        bars_by_conid = {}
+        errors = {}
+        for conid, (history, error) in zip(conids, results):
+            if error:
+                errors[conid] = error
+            else:
+                bars_by_conid[conid] = (history or {}).get('data', [])
+
+        key = risk.fingerprint(account['id'], period, bar, benchmark, confidence, sorted(quantities.items()),
+                               sorted((conid, bars[-1].get('t'), len(bars)) for conid, bars in bars_by_conid.items() if bars))
+        report = risk.cached_report(key, lambda: risk.compute(exposures, bars_by_conid, benchmark, confidence, bar))
+
+        return json_response(dict(report, account=account['id'], period=period, errors=errors))
+    except Exception as e:
+        logger.exception("Error in API risk route")
+        return json_response({"error": f"Error computing portfolio risk: {str(e)}"}, 500)
+
+@app.route("/api/attribution")
+def api_attribution():
+    """
+    Daily P&L attribution of the selected account's holdings by position,
+    sector and total. ?period=1m picks how many daily bars are used. Reports
+    are cached per trading day (and holdings) for every worker.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        period = request.args.get('period', '1m')
+
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account['id']}/positions?direction=a&sort=position")
+        if error:
+            return json_response({"error": f"Failed to get positions data: {error}"}, 500)
+
+        held = attribution.holdings(normalize_positions(positions_data))
+        day = attribution.trading_day()
+        key = f"attribution:{account['id']}:{period}:{day}:{risk.fingerprint(sorted(held.items()))}"
+
+        def build():
+            conids = list(held)
+            # Every holding's bars in one concurrent batch, paced by the gateway rate limiter all workers share
+            results = cached_api_request_many([history_url(BASE_API_URL, conid, period, '1d') for conid in conids], ttl=HISTORY_CACHE_TTL)
+            bars_by_conid = {}
+            errors = {}
+            for conid, (history, error) in zip(conids, results):
+                if error:
+                    errors[conid] = error
+                else:
+                    bars_by_conid[conid] = (history or {}).get('data', [])
+
+            report = attribution.compute(held, bars_by_conid)
+            report = dict(report, account=account['id'], period=period, tradingDay=day, errors=errors, computedAt=time.time())
+            # Only complete reports are cached for the day; missing history is retried on the next request
+            return report, "incomplete_history" if errors else None
+
+        report, error = shared_cache.get_or_fetch(key, attribution.ATTRIBUTION_CACHE_TTL, build)
+        if report is None:
+            return json_response({"error": f"Failed to compute attribution: {error}"}, 500)
+        return json_response(report)
+    except Exception as e:
+        logger.exception("Error in API attribution route")
+        return json_response({"error": f"Error computing P&L attribution: {str(e)}"}, 500)
+
+@app.route("/api/rebalance", methods=['POST'])
+def api_rebalance():
+    """
+    Preview the orders that move the selected account to target weights.
+    Body: {"targets": {"conid"|"sector"|"assetClass": {name: weight}},
+    "lotSize", "minTradeValue", "cashBuffer", "unlisted": "hold"|"close",
+    "orderType": "MKT"|"LMT", "tif"}. Nothing is submitted; post the
+    returned orders to /api/orders/batch to place them.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        options, error = rebalance.validate(request.get_json(silent=True))
+        if error:
+            return json_response({"error": error}, 400)
+
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+        account_id = account["id"]
+
+        (summary, error), (positions_data, positions_error) = cached_api_request_many([
+            f"{BASE_API_URL}/portfolio/{account_id}/summary",
+            f"{BASE_API_URL}/portfolio2/{account_id}/positions?direction=a&sort=position"
+        ])
+        if error:
+            return json_response({"error": f"Failed to get account summary: {error}"}, 500)
+        if positions_error:
+            return json_response({"error": f"Failed to get positions data: {positions_error}"}, 500)
+
+        positions_list = normalize_positions(positions_data)
+        held = {str(p.get('conid')) for p in positions_list}
+        new_conids = [conid for conid in options["targets"].get('conid', {}) if conid not in held]
+        rows = rebalance.instruments(positions_list, options["targets"], resolve_contracts(BASE_API_URL, new_conids) if new_conids else {})
+
+        preview = rebalance.plan(rows, extract_cash_value(summary), get_quotes(BASE_API_URL, [row["conid"] for row in rows]), options)
+        return json_response(dict(preview, accountId=account_id))
+    except Exception as e:
+        logger.exception("Error in API rebalance route")
+        return json_response({"error": f"Error computing rebalance: {str(e)}"}, 500)
+
+@app.route("/api/trades")
+def api_trades():
+    """
+    Execution history of the selected account from the local ledger, newest
+    first: ?conid=, ?side=B|S, ?start= and ?end= (epoch ms), ?limit= and
+    ?cursor= (nextCursor of the previous page). A background worker pulls
+    new executions from the gateway, so history goes back beyond its 7 days.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        ingested = get_execution_ledger(BASE_API_URL, account["id"])
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        try:
+            executions, next_cursor = execution_ledger.trades(
+                account["id"], request.args.get('conid'), request.args.get('side'), request.args.get('start', type=int),
+                request.args.get('end', type=int), request.args.get('cursor'), limit)
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+
+        return json_response({"account": account["id"], "ingested": ingested, "executions": executions, "nextCursor": next_cursor})
+    except Exception as e:
+        logger.exception("Error in API trades route")
+        return json_response({"error": f"Error retrieving trades: {str(e)}"}, 500)
+
+@app.route("/api/trades/realized")
+def api_realized_pnl():
+    """Realized P&L (FIFO), commissions and open lots per conid from the local ledger; ?conid= for one"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        ingested = get_execution_ledger(BASE_API_URL, account["id"])
+        rows = execution_ledger.realized(account["id"], request.args.get('conid'))
+        return json_response({
+            "account": account["id"],
+            "realizedPnl": sum(row["realizedPnl"] for row in rows),
+            "commissions": sum(row["commissions"] for row in rows),
+            "ingested": ingested,
+            "complete": execution_ledger.seeded(account["id"]),
+            "positions": rows
+        })
+    except Exception as e:
+        logger.exception("Error in API realized P&L route")
+        return json_response({"error": f"Error retrieving realized P&L: {str(e)}"}, 500)
+
+@app.route("/api/household")
+def api_household():
+    """JSON API endpoint for the consolidated view of all accounts"""
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        data, error = build_household(BASE_API_URL)
+
+        if error == "no_accounts":
+            return json_response({"error": "No accounts found"}, 404)
+
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        # Only per-account totals here; the merged data carries the detail
+        return json_response({
+            "accounts": [{"account": entry["account"], "totals": entry["totals"], "errors": entry["errors"]}
+                         for entry in data["accounts"]],
+            "combined": data["combined"]
+        })
+    except Exception as e:
+        logger.exception("Error in API household route")
+        return json_response({"error": f"Error retrieving household view: {str(e)}"}, 500)
+
+
+# /portfolio/{id}/positions/{page} returns at most this many positions per page
+POSITIONS_PAGE_SIZE = 100
+
+def iter_position_pages(BASE_API_URL, account_id, first_page):
+    """Yield positions page by page so an export never holds more than one page"""
+    page_number, page = 0, first_page
+    while page:
+        yield from page
+        if len(page) < POSITIONS_PAGE_SIZE:
+            return
+        page_number += 1
+        page, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/positions/{page_number}")
+        if error:
+            logger.error(f"Positions export stopped at page {page_number}: {error}")
+            return
+
+def export_rows(BASE_API_URL, dataset, account_id):
+    """Return (rows, error) for an export; the first request runs before streaming starts so errors get a status code"""
+    if dataset == "positions":
+        first_page, error = safe_api_request(f"{BASE_API_URL}/portfolio/{account_id}/positions/0")
+        if error:
+            return None, error
+        return iter_position_pages(BASE_API_URL, account_id, first_page if isinstance(first_page, list) else []), None
+
+    if dataset == "ledger":
+        ledger, error = cached_api_request(f"{BASE_API_URL}/portfolio/{account_id}/ledger")
+        if error:
+            return None, error
+        return (dict(values, currency=currency) for currency, values in (ledger or {}).items()
+                if isinstance(values, dict)), None
+
+    if dataset == "orders":
+        orders, error = cached_api_request(f"{BASE_API_URL}/iserver/account/orders")
+        if error:
+            return None, error
+        return iter(order_tracker.extract_orders(orders)), None
+
+    # NAV history comes from the local store, refreshed first like /performance
+    refresh_nav_store_if_due(BASE_API_URL, account_id)
+    start = request.args.get('start')
+    end = request.args.get('end')
+    if not start and not end and request.args.get('period'):
+        start = nav_store.period_start(request.args['period'])
+    return nav_store.iter_series(account_id, start, end), None
+
+@app.route("/export/<dataset>")
+def export(dataset):
+    """
+    Stream positions, ledger, orders or nav history as ?format=csv (default)
+    or parquet. Rows are generated while the response is sent, so memory use
+    does not grow with the size of the export.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        fmt = request.args.get('format', 'csv')
+
+        if dataset not in exports.SCHEMAS:
+            return json_response({"error": f"Unknown dataset: {dataset}", "datasets": list(exports.SCHEMAS)}, 404)
+
+        if fmt not in exports.available_formats():
+            message = "Parquet exports need pyarrow, which is not installed" if fmt == "parquet" else f"Unsupported format: {fmt}"
+            return json_response({"error": message, "formats": exports.available_formats()}, 406)
+
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        rows, error = export_rows(BASE_API_URL, dataset, account["id"])
+        if error:
+            return json_response({"error": f"Failed to get {dataset} data: {error}"}, 500)
+
+        filename = f"{dataset}-{account['id']}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+        return Response(exports.stream(rows, dataset, fmt), mimetype=exports.FORMATS[fmt],
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+    except Exception as e:
+        logger.exception("Error in export route")
+        return json_response({"error": f"Error exporting {dataset}: {str(e)}"}, 500)
+
+def gateway_authenticated(BASE_API_URL):
+    """True when the gateway has an authenticated brokerage session"""
+    status, error = safe_api_request(f"{BASE_API_URL}/iserver/auth/status", method='post')
+    return not error and isinstance(status, dict) and bool(status.get('authenticated'))
+
+@warmup.task("accounts", refresh=True)
+def warm_accounts(BASE_API_URL):
+    """Keep the account list, read by almost every page, cached until the next refresh"""
+    url = f"{BASE_API_URL}/portfolio/accounts"
+    accounts, error = safe_api_request(url)
+    if error:
+        return error
+    if not accounts:
+        return "no_accounts"
+    shared_cache.put(f"api:{url}", accounts, warmup.WARMUP_REFRESH_SECONDS + warmup.WARMUP_LEASE_SECONDS)
+    return None
+
+@warmup.task("scanner_params")
+def warm_scanner_params(BASE_API_URL):
+    _, error = cached_api_request(f"{BASE_API_URL}/iserver/scanner/params", ttl=SCANNER_PARAMS_TTL)
+    return error
+
+@warmup.task("contracts")
+def warm_contracts(BASE_API_URL):
+    """Load secdef metadata for every held and watched conid in bulk"""
+    account, error = get_default_account(BASE_API_URL)
+    if error:
+        return error
+
+    positions_data, error = cached_api_request(f"{BASE_API_URL}/portfolio2/{account['id']}/positions?direction=a&sort=position")
+    if error:
+        return error
+
+    conids = [p.get('conid') for p in normalize_positions(positions_data)]
+
+    watchlist_response, error = safe_api_request(f"{BASE_API_URL}/iserver/watchlists")
+    user_lists = ((watchlist_response or {}).get('data') or {}).get('user_lists', []) if not error else []
+    watchlist_urls = [f"{BASE_API_URL}/iserver/watchlist?id={item['id']}" for item in user_lists if 'id' in item]
+    for watchlist, error in paced_map(safe_api_request, watchlist_urls):
+        if not error and isinstance(watchlist, dict):
+            conids.extend(instrument.get('conid') for instrument in watchlist.get('instruments', []))
+
+    resolve_contracts(BASE_API_URL, conids)
+    return None
+
+@warmup.task("alerts")
+def warm_alerts(BASE_API_URL):
+    """Resume polling quotes for alerts stored before a restart"""
+    engine = alerts.get_engine()
+    engine.sync()
+    if len(engine.index):
+        get_alert_engine(BASE_API_URL)
+    return None
+
+@warmup.task("execution_ledger")
+def warm_execution_ledger(BASE_API_URL):
+    """Start pulling executions so the ledger keeps history while nobody looks at trades"""
+    account, error = get_default_account(BASE_API_URL)
+    if error:
+        return error
+    get_execution_ledger(BASE_API_URL, account["id"])
+    return None
+
+def warmup_api_url():
+    """The base URL request handlers use for the gateway, so warmed cache keys are the ones they read"""
+    pool = get_gateway_pool()
+    if pool is not None:
+        return pool.base
+    return GATEWAY_API_URL or "https://localhost:5055/v1/api"
+
+@app.route("/health")
+def health():
+    """Liveness: the webapp process is up"""
+    return json_response({"status": "ok"})
+
+@app.route("/ready")
+def ready():
+    """Readiness: gateway authenticated and caches warmed; 503 until then"""
+    status = warmup.get_warmer(warmup_api_url(), gateway_authenticated).status()
+    return json_response(status, 200 if status["ready"] else 503)
+
+@app.route("/api/snapshot")
+def api_snapshot():
+    """
+    Last stored raw snapshot of the selected account without asking the gateway.
+
+    ?sections=summary,positions decodes only the listed sections.
+    """
+    try:
+        BASE_API_URL = get_base_api_url(request)
+        account, error = get_default_account(BASE_API_URL)
+        if error:
+            return json_response({"error": f"Failed to get accounts: {error}"}, 500)
+
+        reader = account_snapshot_file(account["id"]).read()
+        if reader is None:
+            return json_response({"error": "No snapshot stored yet"}, 404)
+
+        names = [name for name in request.args.get('sections', '').split(',') if name] or reader.sections()
+        result = {"account": account["id"], "timestamp": reader.timestamp}
+        for name in names:
+            result[name] = reader.get(name)
+        return json_response(result)
+    except Exception as e:
+        logger.exception("Error in API snapshot route")
+        return json_response({"error": f"Error reading snapshot: {str(e)}"}, 500)
+
+@app.route("/api/admission")
+def api_admission():
+    """In-flight requests, queue depth and shed counts per route class for this worker"""
+    return json_response(admission.get_controller().stats())
+
+@app.route("/api/gateways")
+def api_gateways():
+    """Health, session state and load of each pooled gateway as seen by this worker"""
+    pool = get_gateway_pool()
+    if pool is None:
+        return json_response({"pooled": False, "instances": [{"url": get_base_api_url(request)}]})
+    return json_response(dict(pool.stats(), pooled=True))
 
 @app.route("/real-market")
 def real_market():
@@ -1179,8 +2272,8 @@ def real_market():
         
         if error:
             if error == "unauthorized":
-                return render_template("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view market data.")
-            return render_template("error.html", error=f"Failed to get market data: {error}")
+                return render_page("auth_required.html", message="Please log in to Interactive Brokers Gateway first to view market data.")
+            return render_page("error.html", error=f"Failed to get market data: {error}")
         
         logger.info(f"Market data response: {json.dumps(market_data, indent=2)}")
         
@@ -1199,11 +2292,15 @@ def real_market():
         }
         
         # Return the market data with the field descriptions
-        return render_template("real_market.html", 
-                              market_data=market_data, 
-                              field_descriptions=field_descriptions,
-                              conids=conids,
-                              fields=fields)
+        return render_page("real_market.html", 
+                          market_data=market_data, 
+                          field_descriptions=field_descriptions,
+                          conids=conids,
+                          fields=fields)
     except Exception as e:
         logger.exception("Error in real-market route")
-        return render_template("error.html", error=f"Error retrieving market data: {str(e)}")
+        return render_page("error.html", error=f"Error retrieving market data: {str(e)}")
+
+# Uygulama yüklenirken gateway oturumunu bekle ve önbellekleri ısıt
+if warmup.WARMUP_ENABLED:
+    warmup.get_warmer(warmup_api_url(), gateway_authenticated)
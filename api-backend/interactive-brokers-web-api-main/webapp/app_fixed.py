@@ -23,8 +23,23 @@ def parse_web_interface_data(url):
         logger.error(f"Error fetching {url}: {e}")
         return None
 
+def fetch_page_json(url):
+    """A webapp page's data in JSON mode, or None when the page only answers in HTML"""
+    try:
+        response = requests.get(url, headers={'Accept': 'application/json'}, timeout=10)
+        if response.status_code == 200 and 'json' in response.headers.get('Content-Type', ''):
+            return response.json()
+        return None
+    except Exception as e:
+        logger.error(f"Error fetching {url} as JSON: {e}")
+        return None
+
 def extract_positions_data():
     """Extract positions data from web interface"""
+    page = fetch_page_json("http://172.18.0.2:5056/positions")
+    if page is not None:
+        return page.get('positions') or []
+
     html_content = parse_web_interface_data("http://172.18.0.2:5056/positions")
     if not html_content:
         return []
@@ -55,6 +70,11 @@ def extract_positions_data():
 def extract_summary_data():
     """Extract account summary from web interface"""
     try:
+        page = fetch_page_json("http://172.18.0.2:5056/")
+        if page is not None:
+            cash = (page.get('snapshot') or {}).get('cash')
+            return {'TotalCashValue': float(cash)} if cash else {}
+
         # Get dashboard content for basic metrics
         dashboard_content = parse_web_interface_data("http://172.18.0.2:5056/")
         if not dashboard_content:
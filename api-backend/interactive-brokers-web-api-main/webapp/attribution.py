@@ -0,0 +1,118 @@
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from risk import align_closes
+
+try:
+    from zoneinfo import ZoneInfo
+    _exchange_tz = ZoneInfo(os.environ.get('ATTRIBUTION_TIMEZONE', 'America/New_York'))
+except Exception:
+    # No tz database installed; trading days then roll over at midnight UTC
+    _exchange_tz = timezone.utc
+
+# A report is cached for the trading day it was computed on; this only bounds how long stale keys linger
+ATTRIBUTION_CACHE_TTL = float(os.environ.get('ATTRIBUTION_CACHE_TTL', '86400'))
+
+
+def trading_day(now=None):
+    """ISO date of the current trading day in the exchange time zone; weekends map to the Friday before"""
+    day = (now or datetime.now(_exchange_tz)).astimezone(_exchange_tz).date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.isoformat()
+
+
+def holdings(positions):
+    """
+    {conid: (quantity * multiplier, sector, symbol)} for open positions.
+
+    The multiplier (options, futures) is implied by market value over
+    quantity times price, so a one-point move is valued like the gateway does.
+    """
+    result = {}
+    for p in positions:
+        conid = str(p.get('conid') or '')
+        quantity = float(p.get('position') or 0)
+        if not conid or not quantity:
+            continue
+
+        price = float(p.get('mktPrice') or p.get('marketPrice') or 0)
+        value = float(p.get('mktValue') or p.get('marketValue') or 0)
+        multiplier = abs(value / (quantity * price)) if price and value else 1.0
+        units, _, _ = result.get(conid, (0.0, None, None))
+        result[conid] = (units + quantity * multiplier, p.get('sector') or 'Unknown',
+                         p.get('contractDesc') or p.get('ticker') or p.get('description') or conid)
+    return result
+
+
+def compute(held, bars_by_conid):
+    """
+    Daily P&L attribution of the current holdings over the bars given.
+
+    All positions are stacked into one [days, positions] close matrix; the
+    per-position P&L is the close-to-close change times units, the sector
+    P&L one matrix product with a position-to-sector indicator matrix, and
+    the contribution is each P&L over the gross book value at the previous
+    close. Holdings are today's, so the report shows what the current book
+    would have made each day, not what past trades made.
+    """
+    conids, closes = align_closes({conid: bars_by_conid[conid] for conid in held if bars_by_conid.get(conid)})
+    report = {
+        "positions": [],
+        "sectors": [],
+        "missingHistory": [conid for conid in held if conid not in conids]
+    }
+    if len(closes) < 2:
+        report["error"] = "not_enough_history"
+        return report
+
+    times = np.unique(np.concatenate([[bar['t'] for bar in bars_by_conid[conid]] for conid in conids]))
+    dates = [datetime.fromtimestamp(t / 1000, _exchange_tz).date().isoformat() for t in times[1:]]
+
+    units = np.array([held[conid][0] for conid in conids])
+    sectors = sorted({held[conid][1] for conid in conids})
+    sector_index = {sector: i for i, sector in enumerate(sectors)}
+    membership = np.zeros((len(conids), len(sectors)))
+    membership[np.arange(len(conids)), [sector_index[held[conid][1]] for conid in conids]] = 1.0
+
+    # Bars before a series starts are NaN after alignment and count as no P&L
+    changes = np.nan_to_num(np.diff(closes, axis=0))
+    pnl = changes * units
+    sector_pnl = pnl @ membership
+    total_pnl = pnl.sum(axis=1)
+
+    previous_value = np.nan_to_num(closes[:-1]) @ np.abs(units)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(previous_value > 0, 1.0 / previous_value, 0.0)
+    contribution = pnl * scale[:, None]
+    sector_contribution = sector_pnl * scale[:, None]
+
+    position_totals = pnl.sum(axis=0)
+    for i in np.argsort(-np.abs(position_totals)):
+        conid = conids[i]
+        report["positions"].append({
+            "conid": conid,
+            "symbol": held[conid][2],
+            "sector": held[conid][1],
+            "units": float(units[i]),
+            "total": float(position_totals[i]),
+            "pnl": np.round(pnl[:, i], 2).tolist(),
+            "contribution": np.round(contribution[:, i], 6).tolist()
+        })
+
+    sector_totals = sector_pnl.sum(axis=0)
+    for k in np.argsort(-np.abs(sector_totals)):
+        report["sectors"].append({
+            "sector": sectors[k],
+            "total": float(sector_totals[k]),
+            "pnl": np.round(sector_pnl[:, k], 2).tolist(),
+            "contribution": np.round(sector_contribution[:, k], 6).tolist()
+        })
+
+    report["dates"] = dates
+    report["total"] = {
+        "total": float(total_pnl.sum()),
+        "pnl": np.round(total_pnl, 2).tolist(),
+        "return": np.round(total_pnl * scale, 6).tolist()
+    }
+    return report
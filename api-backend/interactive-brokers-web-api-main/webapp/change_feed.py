@@ -0,0 +1,306 @@
+import json, logging, os, queue, sqlite3, threading, time, uuid
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Feeds live next to the shared cache so every worker process reads the same epoch, sequence and events
+FEED_PATH = os.environ.get('WEBAPP_FEED_PATH', shared_cache.CACHE_PATH)
+# Batches a subscriber may fall behind; after that it is skipped until it catches up, then resumes from its cursor
+FEED_SUBSCRIBER_QUEUE = int(os.environ.get('FEED_SUBSCRIBER_QUEUE', '100'))
+# Seconds between keepalive comments on an idle event stream
+FEED_KEEPALIVE_SECONDS = 15
+
+_local = threading.local()
+
+
+def _connect():
+    """Return a per-thread, per-process connection to the feed database"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    conn = sqlite3.connect(FEED_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS feeds (
+        name TEXT PRIMARY KEY,
+        epoch TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        items TEXT,
+        state TEXT,
+        updated_at REAL,
+        polled_at REAL NOT NULL
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS feed_events (
+        feed TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (feed, seq)
+    ) WITHOUT ROWID""")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+class Subscription:
+    """Feed batches pushed to one consumer of this process; close it with ChangeFeed.unsubscribe()"""
+
+    def __init__(self, cursor, types, maxsize=FEED_SUBSCRIBER_QUEUE):
+        self.cursor = cursor
+        self.types = types
+        self.queue = queue.Queue(maxsize)
+
+    def get(self, timeout=None):
+        """Next batch shaped like changes_since(), or None when nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def event_stream(feed, subscription, seconds):
+    """
+    Server-sent events for a subscription, ending after seconds. Each
+    message carries the batch cursor as its id, so a reconnecting
+    EventSource resumes from Last-Event-ID.
+    """
+    try:
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            batch = subscription.get(timeout=min(FEED_KEEPALIVE_SECONDS, max(0.0, deadline - time.time())))
+            if batch is None:
+                yield ": keepalive\n\n"
+                continue
+            kind = "reset" if batch["reset"] else "changes"
+            yield f"id: {batch['cursor']}\nevent: {kind}\ndata: {json.dumps(batch, separators=(',', ':'))}\n\n"
+    finally:
+        feed.unsubscribe(subscription)
+
+
+class ChangeFeed:
+    """
+    A gateway list polled in the background and served as a cursor feed.
+
+    The current table (items by key), the event log and the "epoch:seq"
+    cursor are kept in a SQLite file shared by all worker processes, so a
+    client keeps its place whichever worker answers its next poll. Every
+    worker runs a poll thread while it is being read, but each interval
+    only the worker that claims it fetches and diffs; the diff runs in a
+    write transaction against the shared table, so events are recorded once.
+
+    Consumers can also subscribe(): after each poll interval every worker
+    pushes the events its own subscribers have not seen yet, whichever
+    worker recorded them.
+
+    Subclasses define key(), extract() and diff().
+    """
+
+    # Name of the full item list in a reset response
+    items_name = "items"
+    thread_name = "change-feed"
+
+    def __init__(self, name, fetch, interval, idle_seconds, buffer, invalidate=None):
+        self.name = name
+        self.fetch = fetch
+        self.invalidate = invalidate
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.buffer = buffer
+        self.last_error = None
+        self.last_read = time.time()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.forced = False
+        self.thread = None
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        # Decoded copy of the shared table, reused until another poll writes it
+        self._items = None
+        self._items_version = None
+
+        _connect().execute("INSERT OR IGNORE INTO feeds (name, epoch, seq, polled_at) VALUES (?, ?, 0, 0)",
+                           (name, uuid.uuid4().hex[:8]))
+
+    def key(self, item):
+        raise NotImplementedError
+
+    def extract(self, data, error):
+        """(items, error) from a fetch result"""
+        raise NotImplementedError
+
+    def diff(self, old, current, state):
+        """[(kind, event_fields)] turning old into current; may update the feed's state dict"""
+        raise NotImplementedError
+
+    def _row(self):
+        return _connect().execute("SELECT epoch, seq, updated_at FROM feeds WHERE name = ?", (self.name,)).fetchone()
+
+    @property
+    def ready(self):
+        return self._row()[2] is not None
+
+    def age(self):
+        updated_at = self._row()[2]
+        return None if updated_at is None else round(time.time() - updated_at, 3)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.last_read = time.time()
+            self.thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self.thread.start()
+
+    def poke(self):
+        """Poll the gateway again right away, e.g. after placing or cancelling orders"""
+        if self.invalidate is not None:
+            self.invalidate()
+        self.forced = True
+        self.wake.set()
+
+    def subscribe(self, cursor=None, types=None):
+        """
+        Return a Subscription receiving this feed's batches after cursor (a
+        reset with the full item list first when cursor is missing or
+        unknown), optionally only some event types.
+        """
+        subscription = Subscription(cursor, types)
+        with self.subscribers_lock:
+            self.subscribers.append(subscription)
+        self.start()
+        self.deliver()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.subscribers_lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def deliver(self):
+        """Queue, for each subscriber of this process, the changes past its cursor"""
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        epoch, seq, updated_at = self._row()
+        if updated_at is None:
+            return
+
+        for subscription in subscribers:
+            if subscription.cursor == f"{epoch}:{seq}" or subscription.queue.full():
+                continue
+            batch = self.changes_since(subscription.cursor, subscription.types)
+            if batch["reset"] or batch["events"]:
+                subscription.queue.put(batch)
+            subscription.cursor = batch["cursor"]
+
+    def _run(self):
+        while self.subscribers or time.time() - self.last_read < self.idle_seconds:
+            forced, self.forced = self.forced, False
+            try:
+                self.poll(force=forced)
+                self.deliver()
+            except Exception:
+                logger.exception(f"{self.thread_name} poll failed")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+        logger.info(f"{self.thread_name} idle, stopping")
+
+    def _claim(self):
+        """True if this worker should poll now; the others skip this interval"""
+        now = time.time()
+        cursor = _connect().execute("UPDATE feeds SET polled_at = ? WHERE name = ? AND polled_at <= ?",
+                                    (now, self.name, now - self.interval * 0.9))
+        return cursor.rowcount == 1
+
+    def poll(self, force=False):
+        if not force and not self._claim():
+            return None
+
+        data, error = self.fetch()
+        items, error = self.extract(data, error)
+        if error:
+            self.last_error = error
+            return None
+        return self.apply(items)
+
+    def apply(self, item_list):
+        """Diff item_list against the shared table and record the events; returns them"""
+        now = time.time()
+        current = {}
+        for item in item_list:
+            key = self.key(item)
+            if key:
+                current[key] = item
+
+        conn = _connect()
+        with self.lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq, items, state = conn.execute("SELECT seq, items, state FROM feeds WHERE name = ?", (self.name,)).fetchone()
+                state = json.loads(state) if state else {}
+                events = []
+                for kind, fields in self.diff(json.loads(items) if items else {}, current, state):
+                    seq += 1
+                    events.append(dict(fields, seq=seq, type=kind, time=now))
+
+                conn.executemany("INSERT INTO feed_events (feed, seq, type, data) VALUES (?, ?, ?, ?)",
+                                 [(self.name, event['seq'], event['type'], json.dumps(event, separators=(',', ':'))) for event in events])
+                conn.execute("DELETE FROM feed_events WHERE feed = ? AND seq <= ?", (self.name, seq - self.buffer))
+                conn.execute("UPDATE feeds SET seq = ?, items = ?, state = ?, updated_at = ? WHERE name = ?",
+                             (seq, json.dumps(current, separators=(',', ':')), json.dumps(state, separators=(',', ':')), now, self.name))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.last_error = None
+        return events
+
+    def _current(self, conn):
+        """(items list, cursor) from the shared table, decoding it only when it changed"""
+        epoch, seq, updated_at = conn.execute("SELECT epoch, seq, updated_at FROM feeds WHERE name = ?", (self.name,)).fetchone()
+        if self._items_version != (epoch, updated_at):
+            items = conn.execute("SELECT items FROM feeds WHERE name = ?", (self.name,)).fetchone()[0]
+            self._items = list(json.loads(items).values()) if items else []
+            self._items_version = (epoch, updated_at)
+        return self._items, f"{epoch}:{seq}"
+
+    def snapshot(self):
+        self.last_read = time.time()
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            return self._current(conn)
+        finally:
+            conn.execute("COMMIT")
+
+    def changes_since(self, cursor, types=None):
+        """
+        Return the feed for a client cursor, optionally only some event types.
+
+        A missing cursor, one from another feed (e.g. after the feed file was
+        removed) or one older than the event buffer yields a reset with the
+        full item list.
+        """
+        self.last_read = time.time()
+        client_epoch, _, client_seq = (cursor or '').partition(':')
+        conn = _connect()
+        # One read transaction so the events and the returned cursor match
+        conn.execute("BEGIN")
+        try:
+            epoch, seq, _ = conn.execute("SELECT epoch, seq, updated_at FROM feeds WHERE name = ?", (self.name,)).fetchone()
+            oldest = conn.execute("SELECT MIN(seq) FROM feed_events WHERE feed = ?", (self.name,)).fetchone()[0]
+            oldest = seq + 1 if oldest is None else oldest
+
+            if client_epoch != epoch or not client_seq.isdigit() or int(client_seq) + 1 < oldest or int(client_seq) > seq:
+                items, cursor = self._current(conn)
+                return {"reset": True, "cursor": cursor, self.items_name: items, "events": []}
+
+            query = "SELECT data FROM feed_events WHERE feed = ? AND seq > ? AND seq <= ?"
+            params = [self.name, int(client_seq), seq]
+            if types:
+                query += f" AND type IN ({','.join('?' * len(types))})"
+                params += sorted(types)
+            events = [json.loads(data) for data, in conn.execute(query + " ORDER BY seq", params)]
+            return {"reset": False, "cursor": f"{epoch}:{seq}", "events": events}
+        finally:
+            conn.execute("COMMIT")
@@ -0,0 +1,98 @@
+import logging, os, threading, time
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_CACHE_TTL = float(os.environ.get('CONTRACT_CACHE_TTL', '86400'))
+# conids per /trsrv/secdef call
+SECDEF_BATCH_SIZE = int(os.environ.get('SECDEF_BATCH_SIZE', '100'))
+
+# In-process copy in front of the shared cache: conid -> (contract, expires_at)
+_local = {}
+_local_lock = threading.Lock()
+
+_prefetching = set()
+_prefetching_lock = threading.Lock()
+
+
+def _key(conid):
+    return f"secdef:{conid}"
+
+
+def resolve(conids, fetch_secdef):
+    """
+    Return {conid: secdef} for conids, fetching all misses in batched calls.
+
+    fetch_secdef(list_of_conids) must return (response, error) for a
+    /trsrv/secdef POST. Conids are returned as strings.
+    """
+    wanted = list(dict.fromkeys(str(conid) for conid in conids if conid))
+    found = {}
+    now = time.time()
+
+    with _local_lock:
+        for conid in wanted:
+            entry = _local.get(conid)
+            if entry is not None and entry[1] > now:
+                found[conid] = entry[0]
+
+    misses = [conid for conid in wanted if conid not in found]
+    if misses:
+        shared = shared_cache.get_many(_key(conid) for conid in misses)
+        for conid in misses:
+            contract = shared.get(_key(conid))
+            if contract is not None:
+                found[conid] = contract
+        _remember({conid: found[conid] for conid in misses if conid in found})
+
+    misses = [conid for conid in wanted if conid not in found]
+    for i in range(0, len(misses), SECDEF_BATCH_SIZE):
+        batch = misses[i:i + SECDEF_BATCH_SIZE]
+        contract_data, error = fetch_secdef([int(conid) if conid.isdigit() else conid for conid in batch])
+
+        if error or not isinstance(contract_data, dict):
+            logger.warning(f"Bulk secdef lookup failed for {len(batch)} conids: {error}")
+            continue
+
+        fetched = {str(contract['conid']): contract for contract in contract_data.get('secdef', []) if 'conid' in contract}
+        found.update(fetched)
+        _remember(fetched)
+        shared_cache.put_many({_key(conid): contract for conid, contract in fetched.items()}, CONTRACT_CACHE_TTL)
+
+    return found
+
+
+def _remember(contracts):
+    expires_at = time.time() + CONTRACT_CACHE_TTL
+    with _local_lock:
+        for conid, contract in contracts.items():
+            _local[conid] = (contract, expires_at)
+
+
+def missing(conids):
+    """Conids not yet in the in-process cache"""
+    now = time.time()
+    with _local_lock:
+        return [str(c) for c in conids if c and not (str(c) in _local and _local[str(c)][1] > now)]
+
+
+def prefetch(conids, fetch_secdef):
+    """Resolve conids in a background thread; returns immediately"""
+    todo = missing(conids)
+    with _prefetching_lock:
+        todo = [conid for conid in todo if conid not in _prefetching]
+        _prefetching.update(todo)
+
+    if not todo:
+        return
+
+    def run():
+        try:
+            resolve(todo, fetch_secdef)
+        except Exception:
+            logger.exception("Contract prefetch failed")
+        finally:
+            with _prefetching_lock:
+                _prefetching.difference_update(todo)
+
+    threading.Thread(target=run, name="contract-prefetch", daemon=True).start()
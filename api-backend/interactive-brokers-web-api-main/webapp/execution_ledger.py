@@ -0,0 +1,442 @@
+import json, logging, math, os, sqlite3, threading, time
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+LEDGER_STORE_PATH = os.environ.get('LEDGER_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ledger.sqlite3'))
+# Seconds between /iserver/account/trades pulls of one account (across all workers)
+LEDGER_REFRESH_SECONDS = float(os.environ.get('LEDGER_REFRESH_SECONDS', '60'))
+# Seconds before a failed pull is tried again
+LEDGER_RETRY_SECONDS = float(os.environ.get('LEDGER_RETRY_SECONDS', '10'))
+# The gateway only serves the last 7 days of executions
+LEDGER_MAX_DAYS = 7
+
+_local = threading.local()
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(LEDGER_STORE_PATH), exist_ok=True)
+    conn = sqlite3.connect(LEDGER_STORE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS executions (
+        execution_id TEXT PRIMARY KEY,
+        account_id TEXT NOT NULL,
+        conid TEXT NOT NULL,
+        symbol TEXT,
+        side TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        price REAL NOT NULL,
+        multiplier REAL NOT NULL,
+        commission REAL NOT NULL,
+        trade_time INTEGER NOT NULL,
+        realized_pnl REAL,
+        data TEXT NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS executions_by_time ON executions (account_id, trade_time, execution_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS executions_by_conid ON executions (account_id, conid, trade_time, execution_id)")
+    # Open FIFO lots; quantity is signed (negative for short lots)
+    conn.execute("""CREATE TABLE IF NOT EXISTS lots (
+        account_id TEXT NOT NULL,
+        conid TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        opened_at INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        price REAL NOT NULL,
+        multiplier REAL NOT NULL,
+        PRIMARY KEY (account_id, conid, seq)
+    ) WITHOUT ROWID""")
+    # Running totals per conid and the last execution applied to its lots
+    conn.execute("""CREATE TABLE IF NOT EXISTS realized (
+        account_id TEXT NOT NULL,
+        conid TEXT NOT NULL,
+        symbol TEXT,
+        realized_pnl REAL NOT NULL,
+        commissions REAL NOT NULL,
+        executions INTEGER NOT NULL,
+        last_time INTEGER NOT NULL,
+        last_execution TEXT NOT NULL,
+        next_seq INTEGER NOT NULL,
+        PRIMARY KEY (account_id, conid)
+    ) WITHOUT ROWID""")
+    # Positions held before the first pull, booked as one lot per conid ahead of every execution
+    conn.execute("""CREATE TABLE IF NOT EXISTS opening_lots (
+        account_id TEXT NOT NULL,
+        conid TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        price REAL NOT NULL,
+        multiplier REAL NOT NULL,
+        PRIMARY KEY (account_id, conid)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE TABLE IF NOT EXISTS ledger_refresh (account_id TEXT PRIMARY KEY, refreshed_at REAL NOT NULL, ingested_at REAL)")
+    # Accounts whose opening lots were seeded; realized P&L of the others misses positions bought before the first pull
+    conn.execute("CREATE TABLE IF NOT EXISTS ledger_seeded (account_id TEXT PRIMARY KEY, seeded_at REAL NOT NULL)")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_execution(row, default_account):
+    """Store tuple for one /iserver/account/trades row, or None if it cannot be booked"""
+    execution_id = row.get('execution_id')
+    conid = row.get('conid') or row.get('conidex')
+    size = _number(row.get('size'))
+    side = str(row.get('side') or '').upper()[:1]
+    if not execution_id or not conid or not size or side not in ('B', 'S'):
+        return None
+
+    if row.get('trade_time_r'):
+        trade_time = int(row['trade_time_r'])
+    else:
+        try:
+            parsed = datetime.strptime(str(row.get('trade_time')), "%Y%m%d-%H:%M:%S").replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+        trade_time = int(parsed.timestamp() * 1000)
+
+    price = _number(row.get('price'))
+    net_amount = abs(_number(row.get('net_amount')))
+    # Options and futures: net amount is size * price * multiplier
+    multiplier = round(net_amount / (size * price), 6) if price and net_amount else 1.0
+    quantity = size if side == 'B' else -size
+    return (str(execution_id), str(row.get('account') or row.get('accountCode') or default_account), str(conid),
+            row.get('symbol'), side, quantity, price, multiplier or 1.0, abs(_number(row.get('commission'))),
+            trade_time, json.dumps(row, separators=(',', ':')))
+
+
+def claim_refresh(account_id, min_interval=LEDGER_REFRESH_SECONDS):
+    """True if the caller should pull executions for account_id now; the update doubles as a cross-process lock"""
+    conn = _connect()
+    now = time.time()
+    cursor = conn.execute("UPDATE ledger_refresh SET refreshed_at = ? WHERE account_id = ? AND refreshed_at < ?",
+                          (now, account_id, now - min_interval))
+    if cursor.rowcount == 1:
+        return True
+    cursor = conn.execute("INSERT OR IGNORE INTO ledger_refresh (account_id, refreshed_at) VALUES (?, ?)", (account_id, now))
+    return cursor.rowcount == 1
+
+
+def release_refresh(account_id, min_interval=LEDGER_REFRESH_SECONDS, retry_after=LEDGER_RETRY_SECONDS):
+    """Give up a claim after a failed pull so the next claim succeeds after retry_after seconds"""
+    _connect().execute("UPDATE ledger_refresh SET refreshed_at = ? WHERE account_id = ?",
+                       (time.time() - min_interval + retry_after, account_id))
+
+
+def ingested(account_id):
+    """True once executions of account_id have been pulled at least once"""
+    row = _connect().execute("SELECT ingested_at FROM ledger_refresh WHERE account_id = ?", (account_id,)).fetchone()
+    return bool(row and row[0] is not None)
+
+
+def days_to_fetch(account_id):
+    """Days of executions to request: enough to cover the time since the last successful pull"""
+    row = _connect().execute("SELECT ingested_at FROM ledger_refresh WHERE account_id = ?", (account_id,)).fetchone()
+    if not row or row[0] is None:
+        return LEDGER_MAX_DAYS
+    return max(1, min(LEDGER_MAX_DAYS, math.ceil((time.time() - row[0]) / 86400) + 1))
+
+
+def opening_lots(positions, rows, account_id):
+    """
+    Store tuples (account, conid, quantity, price, multiplier) for the part of
+    each held position that predates rows: the current position net of the
+    executions about to be booked, at the position's average cost.
+    """
+    net = {}
+    for row in rows:
+        if row[1] == account_id:
+            net[row[2]] = net.get(row[2], 0.0) + row[5]
+
+    lots = []
+    for position in positions:
+        conid = position.get('conid')
+        if not conid:
+            continue
+        quantity = _number(position.get('position')) - net.get(str(conid), 0.0)
+        if abs(quantity) < 1e-9:
+            continue
+        avg_cost = _number(position.get('avgCost'))
+        avg_price = _number(position.get('avgPrice')) or avg_cost
+        # avgCost includes the multiplier of options and futures, avgPrice does not
+        multiplier = round(avg_cost / avg_price, 6) if avg_price and avg_cost else 1.0
+        lots.append((account_id, str(conid), quantity, avg_price, multiplier or 1.0))
+    return lots
+
+
+def seeded(account_id):
+    """True if opening lots were seeded for account_id, so its realized P&L covers older positions"""
+    return _connect().execute("SELECT 1 FROM ledger_seeded WHERE account_id = ?", (account_id,)).fetchone() is not None
+
+
+def ingest(executions, default_account, positions=None):
+    """
+    Store new executions and book them into FIFO lots; returns the number of new executions.
+
+    Executions already stored (same execution ID) are skipped. New ones are
+    applied per conid in (time, execution ID) order on top of the stored
+    lots; if one is older than the last execution already applied to that
+    conid, its lots are rebuilt from the full stored history instead.
+
+    positions (the account's current /portfolio2 positions) seeds the
+    opening lots on an account's first ingest, so selling a position bought
+    before the ledger existed closes it instead of opening a short lot. An
+    execution from before the seed that only arrives later is already part
+    of the opening lot, so it is taken out of it again.
+    """
+    rows = [row for row in (parse_execution(item, default_account) for item in executions if isinstance(item, dict)) if row]
+    if not rows and positions is None:
+        return 0
+
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if positions is not None:
+            conn.executemany("INSERT OR REPLACE INTO opening_lots (account_id, conid, quantity, price, multiplier) VALUES (?, ?, ?, ?, ?)",
+                             opening_lots(positions, rows, default_account))
+            conn.execute("INSERT OR REPLACE INTO ledger_seeded (account_id, seeded_at) VALUES (?, ?)", (default_account, time.time()))
+
+        new = {}
+        for row in rows:
+            cursor = conn.execute("""INSERT OR IGNORE INTO executions (execution_id, account_id, conid, symbol, side, quantity,
+                price, multiplier, commission, trade_time, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", row)
+            if cursor.rowcount == 1:
+                new.setdefault((row[1], row[2]), []).append(row)
+
+        rebuild = set()
+        if positions is None:
+            seeded_at = dict(conn.execute("SELECT account_id, seeded_at FROM ledger_seeded"))
+            for added in new.values():
+                for row in added:
+                    if row[1] in seeded_at and row[9] < seeded_at[row[1]] * 1000:
+                        conn.execute("""INSERT INTO opening_lots (account_id, conid, quantity, price, multiplier) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT (account_id, conid) DO UPDATE SET quantity = opening_lots.quantity + excluded.quantity""",
+                                     (row[1], row[2], -row[5], row[6], row[7]))
+                        rebuild.add((row[1], row[2]))
+
+        for (account_id, conid), added in new.items():
+            _book(conn, account_id, conid, added, (account_id, conid) in rebuild)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return sum(len(added) for added in new.values())
+
+
+def _opening(conn, account_id, conid):
+    """(lots, next_seq) a conid starts from: its seeded opening lot, if any"""
+    row = conn.execute("SELECT quantity, price, multiplier FROM opening_lots WHERE account_id = ? AND conid = ?",
+                       (account_id, conid)).fetchone()
+    if row is None or abs(row[0]) < 1e-9:
+        return deque(), 0
+    return deque([[0, 0, *row]]), 1
+
+
+def _book(conn, account_id, conid, added, rebuild=False):
+    added.sort(key=lambda row: (row[9], row[0]))
+    state = conn.execute("""SELECT realized_pnl, commissions, executions, last_time, last_execution, next_seq
+        FROM realized WHERE account_id = ? AND conid = ?""", (account_id, conid)).fetchone()
+
+    if state is None:
+        realized_pnl, commissions, count = 0.0, 0.0, 0
+        lots, next_seq = _opening(conn, account_id, conid)
+        replay = added
+    elif not rebuild and (added[0][9], added[0][0]) > (state[3], state[4]):
+        realized_pnl, commissions, count, _, _, next_seq = state
+        lots = deque(list(row) for row in conn.execute(
+            "SELECT seq, opened_at, quantity, price, multiplier FROM lots WHERE account_id = ? AND conid = ? ORDER BY seq",
+            (account_id, conid)))
+        replay = added
+    else:
+        # An execution arrived out of order or changed the opening lot: rebuild this conid from its full history
+        logger.info(f"Rebuilding FIFO lots for {account_id}/{conid} after an out-of-order execution")
+        realized_pnl, commissions, count = 0.0, 0.0, 0
+        lots, next_seq = _opening(conn, account_id, conid)
+        replay = conn.execute("""SELECT execution_id, account_id, conid, symbol, side, quantity, price, multiplier, commission,
+            trade_time FROM executions WHERE account_id = ? AND conid = ? ORDER BY trade_time, execution_id""",
+                              (account_id, conid)).fetchall()
+
+    updates = []
+    for row in replay:
+        execution_id, quantity, price, multiplier, commission, trade_time = row[0], row[5], row[6], row[7], row[8], row[9]
+        pnl = 0.0
+        # Close opposite-signed lots first in, first out
+        while quantity and lots and (lots[0][2] > 0) != (quantity > 0):
+            lot = lots[0]
+            closed = min(abs(quantity), abs(lot[2]))
+            direction = 1 if lot[2] > 0 else -1
+            pnl += closed * (price - lot[3]) * lot[4] * direction
+            lot[2] -= closed * direction
+            quantity += closed * direction
+            if abs(lot[2]) < 1e-9:
+                lots.popleft()
+        if abs(quantity) > 1e-9:
+            lots.append([next_seq, trade_time, quantity, price, multiplier])
+            next_seq += 1
+
+        realized_pnl += pnl
+        commissions += commission
+        count += 1
+        updates.append((pnl, execution_id))
+
+    last = replay[-1]
+    conn.executemany("UPDATE executions SET realized_pnl = ? WHERE execution_id = ?", updates)
+    conn.execute("DELETE FROM lots WHERE account_id = ? AND conid = ?", (account_id, conid))
+    conn.executemany("INSERT INTO lots (account_id, conid, seq, opened_at, quantity, price, multiplier) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(account_id, conid, *lot) for lot in lots])
+    conn.execute("""INSERT OR REPLACE INTO realized (account_id, conid, symbol, realized_pnl, commissions, executions,
+        last_time, last_execution, next_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                 (account_id, conid, last[3], realized_pnl, commissions, count, last[9], last[0], next_seq))
+
+
+def refresh(account_id, fetch, fetch_positions=None, min_interval=LEDGER_REFRESH_SECONDS):
+    """
+    Pull and ingest executions if no worker did so in the last min_interval
+    seconds. fetch(days) returns (executions, error) for /iserver/account/trades;
+    fetch_positions() returns (positions, error) and is called before the
+    first pull of an account to seed its opening lots.
+    """
+    if not claim_refresh(account_id, min_interval):
+        return 0
+
+    positions = None
+    if fetch_positions is not None and not ingested(account_id):
+        positions, error = fetch_positions()
+        if error:
+            logger.warning(f"Execution ledger could not read positions for {account_id}: {error}")
+            release_refresh(account_id, min_interval)
+            return 0
+        positions = positions if isinstance(positions, list) else []
+
+    executions, error = fetch(days_to_fetch(account_id))
+    if error:
+        logger.warning(f"Execution ledger refresh failed for {account_id}: {error}")
+        release_refresh(account_id, min_interval)
+        return 0
+
+    count = ingest(executions if isinstance(executions, list) else [], account_id, positions)
+    _connect().execute("UPDATE ledger_refresh SET ingested_at = ? WHERE account_id = ?", (time.time(), account_id))
+    if count:
+        logger.info(f"Execution ledger stored {count} new executions for {account_id}")
+    return count
+
+
+def start_worker(key, account_id, fetch, fetch_positions=None):
+    """Keep pulling executions for account_id in the background so no day falls out of the gateway's window"""
+    with _workers_lock:
+        thread = _workers.get(key)
+        if thread is not None and thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    refresh(account_id, fetch, fetch_positions)
+                except Exception:
+                    logger.exception("Execution ledger refresh failed")
+                # Until the first pull succeeds, come back as soon as a retry is allowed
+                time.sleep(LEDGER_REFRESH_SECONDS if ingested(account_id) else LEDGER_RETRY_SECONDS)
+
+        thread = _workers[key] = threading.Thread(target=run, name="execution-ledger", daemon=True)
+        thread.start()
+
+
+def _execution(row):
+    execution_id, conid, symbol, side, quantity, price, multiplier, commission, trade_time, realized_pnl = row
+    return {
+        "executionId": execution_id,
+        "conid": conid,
+        "symbol": symbol,
+        "side": side,
+        "quantity": quantity,
+        "price": price,
+        "multiplier": multiplier,
+        "commission": commission,
+        "time": trade_time,
+        "realizedPnl": realized_pnl
+    }
+
+
+def trades(account_id, conid=None, side=None, start=None, end=None, before=None, limit=100):
+    """
+    Executions newest first from the local store. start/end are epoch
+    milliseconds; before is the nextCursor of the previous page.
+    Returns (executions, next_cursor).
+    """
+    query = """SELECT execution_id, conid, symbol, side, quantity, price, multiplier, commission, trade_time, realized_pnl
+        FROM executions WHERE account_id = ?"""
+    params = [account_id]
+    if conid:
+        query += " AND conid = ?"
+        params.append(str(conid))
+    if side:
+        query += " AND side = ?"
+        params.append(side.upper()[:1])
+    if start:
+        query += " AND trade_time >= ?"
+        params.append(int(start))
+    if end:
+        query += " AND trade_time <= ?"
+        params.append(int(end))
+    if before:
+        before_time, _, before_id = before.partition(':')
+        if not before_time.isdigit():
+            raise ValueError("invalid cursor")
+        query += " AND (trade_time, execution_id) < (?, ?)"
+        params.extend([int(before_time), before_id])
+
+    rows = _connect().execute(query + " ORDER BY trade_time DESC, execution_id DESC LIMIT ?", params + [limit + 1]).fetchall()
+    next_cursor = f"{rows[limit - 1][8]}:{rows[limit - 1][0]}" if len(rows) > limit else None
+    return [_execution(row) for row in rows[:limit]], next_cursor
+
+
+def realized(account_id, conid=None):
+    """
+    Realized P&L, commissions and open FIFO lots per conid. complete is False
+    when the account's opening positions were never seeded, so sales of
+    positions bought before the ledger's first pull booked no P&L.
+    """
+    conn = _connect()
+    complete = seeded(account_id)
+    query = "SELECT conid, symbol, realized_pnl, commissions, executions, last_time FROM realized WHERE account_id = ?"
+    params = [account_id]
+    if conid:
+        query += " AND conid = ?"
+        params.append(str(conid))
+
+    lots = {}
+    for lot_conid, opened_at, quantity, price, multiplier in conn.execute(
+            "SELECT conid, opened_at, quantity, price, multiplier FROM lots WHERE account_id = ? ORDER BY conid, seq", (account_id,)):
+        lots.setdefault(lot_conid, []).append({"openedAt": opened_at, "quantity": quantity, "price": price, "multiplier": multiplier})
+
+    result = []
+    for row_conid, symbol, realized_pnl, commissions, count, last_time in conn.execute(query + " ORDER BY conid", params):
+        open_lots = lots.get(row_conid, [])
+        quantity = sum(lot["quantity"] for lot in open_lots)
+        result.append({
+            "conid": row_conid,
+            "symbol": symbol,
+            "realizedPnl": realized_pnl,
+            "commissions": commissions,
+            "netRealizedPnl": realized_pnl - commissions,
+            "executions": count,
+            "lastTrade": last_time,
+            "openQuantity": quantity,
+            "averageCost": sum(lot["quantity"] * lot["price"] for lot in open_lots) / quantity if quantity else None,
+            "lots": open_lots,
+            "complete": complete
+        })
+    return result
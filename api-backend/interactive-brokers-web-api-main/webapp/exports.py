@@ -0,0 +1,142 @@
+import csv, io, os
+
+# pyarrow is optional; without it only CSV exports are offered
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Bytes buffered before a CSV chunk is sent
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', '65536'))
+# Rows per Parquet row group; each group is written and sent as soon as it is full
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_ROW_GROUP_SIZE', '10000'))
+
+# dataset -> [(column, type)]; types are 'str', 'float' or 'int'
+SCHEMAS = {
+    "positions": [
+        ("acctId", "str"), ("conid", "int"), ("contractDesc", "str"), ("assetClass", "str"), ("currency", "str"),
+        ("position", "float"), ("mktPrice", "float"), ("mktValue", "float"), ("avgCost", "float"),
+        ("avgPrice", "float"), ("unrealizedPnl", "float"), ("realizedPnl", "float")
+    ],
+    "ledger": [
+        ("currency", "str"), ("cashbalance", "float"), ("settledcash", "float"), ("netliquidationvalue", "float"),
+        ("stockmarketvalue", "float"), ("unrealizedpnl", "float"), ("realizedpnl", "float"),
+        ("dividends", "float"), ("interest", "float"), ("exchangerate", "float")
+    ],
+    "orders": [
+        ("orderId", "int"), ("acct", "str"), ("conid", "int"), ("ticker", "str"), ("side", "str"),
+        ("orderType", "str"), ("totalSize", "float"), ("filledQuantity", "float"), ("remainingQuantity", "float"),
+        ("price", "float"), ("avgPrice", "float"), ("status", "str"), ("lastExecutionTime_r", "int")
+    ],
+    "nav": [
+        ("date", "str"), ("nav", "float"), ("daily_return", "float")
+    ]
+}
+
+FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name != "parquet" or pyarrow is not None]
+
+
+def _convert(value, kind):
+    if value is None or value == '':
+        return None
+    try:
+        if kind == 'float':
+            return float(value)
+        if kind == 'int':
+            return int(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def _values(row, schema):
+    if isinstance(row, dict):
+        return [_convert(row.get(column), kind) for column, kind in schema]
+    return [_convert(value, kind) for value, (_, kind) in zip(row, schema)]
+
+
+def stream_csv(rows, schema):
+    """Yield CSV bytes in chunks of about EXPORT_CHUNK_BYTES; rows are dicts or tuples in schema order"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column for column, _ in schema])
+
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in _values(row, schema)])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """Write-only file object that hands Parquet output to the generator as it is produced"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def stream_parquet(rows, schema):
+    """Yield a Parquet file one row group at a time"""
+    types = {'str': pyarrow.string(), 'float': pyarrow.float64(), 'int': pyarrow.int64()}
+    arrow_schema = pyarrow.schema([(column, types[kind]) for column, kind in schema])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, arrow_schema)
+
+    def write_group(group):
+        columns = list(zip(*group)) if group else [[] for _ in schema]
+        writer.write_table(pyarrow.table([pyarrow.array(values, type=field.type)
+                                          for values, field in zip(columns, arrow_schema)], schema=arrow_schema))
+
+    try:
+        group = []
+        for row in rows:
+            group.append(_values(row, schema))
+            if len(group) >= EXPORT_ROW_GROUP_SIZE:
+                write_group(group)
+                group = []
+                yield sink.drain()
+        if group:
+            write_group(group)
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream(rows, dataset, fmt):
+    schema = SCHEMAS[dataset]
+    if fmt == "parquet":
+        return stream_parquet(rows, schema)
+    return stream_csv(rows, schema)
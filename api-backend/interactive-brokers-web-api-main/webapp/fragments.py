@@ -0,0 +1,56 @@
+import hashlib, logging, os, tempfile, threading
+from collections import OrderedDict
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ibkr-webapp-templates'))
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '128'))
+
+_fragments = OrderedDict()
+_lock = threading.Lock()
+_jinja_env = None
+
+
+def data_key(value):
+    """Hash of the JSON form of value, used to key rendered fragments"""
+    return hashlib.blake2b(dumps(value), digest_size=16).hexdigest()
+
+
+def cached_fragment(template_name, **context):
+    """
+    Render template_name with context, reusing the last rendering for identical data.
+
+    Called from page templates, e.g. {{ cached_fragment("fragments/orders_table.html", orders=orders) }},
+    so unchanged tables skip the per-row Jinja work entirely.
+    """
+    key = (template_name, data_key(context))
+    with _lock:
+        html = _fragments.get(key)
+        if html is not None:
+            _fragments.move_to_end(key)
+            return html
+
+    html = Markup(_jinja_env.get_template(template_name).render(context))
+
+    with _lock:
+        _fragments[key] = html
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return html
+
+
+def init_app(app):
+    """Enable the bytecode cache, precompile every template and expose cached_fragment"""
+    global _jinja_env
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    _jinja_env = app.jinja_env
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+
+    templates = app.jinja_env.list_templates()
+    for name in templates:
+        app.jinja_env.get_template(name)
+    logger.info(f"Precompiled {len(templates)} templates into {TEMPLATE_CACHE_DIR}")
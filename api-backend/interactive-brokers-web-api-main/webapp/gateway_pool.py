@@ -0,0 +1,242 @@
+import logging, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated gateway base URLs (https://gw1:5055/v1/api,https://gw2:5055/v1/api).
+# Empty keeps the single gateway derived from the request host.
+GATEWAY_POOL = [url.strip().rstrip('/') for url in os.environ.get('GATEWAY_POOL', '').split(',') if url.strip()]
+GATEWAY_HEALTH_SECONDS = float(os.environ.get('GATEWAY_HEALTH_SECONDS', '10'))
+GATEWAY_HEALTH_TIMEOUT = float(os.environ.get('GATEWAY_HEALTH_TIMEOUT', '5'))
+# Consecutive transport errors that take an instance out of rotation until its next good health check
+GATEWAY_MAX_FAILURES = int(os.environ.get('GATEWAY_MAX_FAILURES', '3'))
+# Instance whose brokerage session receives order traffic; default is the first authenticated, non-competing one
+GATEWAY_ORDER_INSTANCE = os.environ.get('GATEWAY_ORDER_INSTANCE', '').strip().rstrip('/')
+
+# Requests that need the brokerage session's own state: orders and reply prompts, market data
+# snapshot subscriptions (the first snapshot on an instance only subscribes), trades and PnL.
+# Other /iserver reads such as price history, scanners and contract lookups are load-balanced.
+SESSION_PATH = re.compile(r'^/iserver/(account/orders|account/[^/]+/orders?(/|$)|reply/|account/trades'
+                          r'|account/pnl/|marketdata/(snapshot|unsubscribe))')
+# Errors where the gateway did answer; anything else from safe_api_request is a transport failure
+ANSWERED_ERRORS = ('unauthorized', 'json_decode_error', 'empty_response')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class Instance:
+    def __init__(self, base):
+        self.base = base
+        self.outstanding = 0
+        # None until the first health check
+        self.healthy = None
+        self.authenticated = False
+        self.competing = False
+        self.failures = 0
+        self.latency = 0.0
+        self.served = 0
+        self.last_error = None
+        self.checked_at = None
+
+    @property
+    def gateway_url(self):
+        """Gateway root for the login page"""
+        return re.sub(r'/v1/api$', '', self.base)
+
+    def stats(self):
+        return {
+            "url": self.base,
+            "healthy": self.healthy,
+            "authenticated": self.authenticated,
+            "competing": self.competing,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "latencyMs": round(self.latency * 1000, 1),
+            "failures": self.failures,
+            "lastError": self.last_error,
+            "checkedAt": self.checked_at
+        }
+
+
+class GatewayPool:
+    """
+    Routes gateway requests across several Client Portal gateway instances.
+
+    Request URLs are built from the first instance's base URL, so cache keys
+    stay the same whichever instance serves them; request() rewrites the
+    base to the chosen instance. Portfolio, performance, price history and
+    other reads go to the healthy, authenticated instance with the fewest requests
+    in flight (counted per worker process); orders, reply prompts, market
+    data snapshots, trades and PnL always go to the one instance that owns
+    the brokerage session, because their state only exists there.
+    """
+
+    def __init__(self, urls, check, interval=GATEWAY_HEALTH_SECONDS, order_instance=GATEWAY_ORDER_INSTANCE):
+        self.instances = [Instance(url) for url in urls]
+        self.base = self.instances[0].base
+        self.order_instance = self._match(order_instance)
+        self.check = check
+        self.interval = interval
+        self.owner = None
+        self.lock = threading.Lock()
+        self.check_lock = threading.Lock()
+        self.thread = None
+
+    def _match(self, url):
+        """The instance a GATEWAY_ORDER_INSTANCE value names, given as its base or gateway root URL"""
+        if not url:
+            return None
+        url = url.rstrip('/')
+        for instance in self.instances:
+            if url in (instance.base, instance.gateway_url):
+                return instance
+        logger.error(f"GATEWAY_ORDER_INSTANCE {url} is not in GATEWAY_POOL; picking the order instance automatically")
+        return None
+
+    def owns(self, url):
+        return url.startswith(self.base + '/')
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="gateway-health", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check_all()
+            except Exception:
+                logger.exception("Gateway health check failed")
+            time.sleep(self.interval)
+
+    def check_all(self):
+        """Ask every instance for its auth status in parallel and re-pick the order instance"""
+        with self.check_lock:
+            with ThreadPoolExecutor(max_workers=len(self.instances)) as executor:
+                results = list(executor.map(lambda instance: self.check(instance.base), self.instances))
+
+            now = time.time()
+            with self.lock:
+                for instance, (status, error) in zip(self.instances, results):
+                    was_healthy = instance.healthy
+                    instance.checked_at = now
+                    instance.last_error = error
+                    if error is None or error in ANSWERED_ERRORS:
+                        instance.healthy = True
+                        instance.failures = 0
+                        status = status if isinstance(status, dict) else {}
+                        instance.authenticated = bool(status.get('authenticated'))
+                        instance.competing = bool(status.get('competing'))
+                    else:
+                        instance.healthy = False
+                        instance.authenticated = False
+                    if was_healthy is not None and was_healthy != instance.healthy:
+                        logger.warning(f"Gateway {instance.base} is {'healthy' if instance.healthy else 'unreachable'}")
+                self._pick_owner()
+
+    def _pick_owner(self):
+        """Keep the current order instance while its session is good, otherwise take the first good one"""
+        if self.order_instance is not None:
+            owner = self.order_instance
+        elif self.owner is not None and self.owner.authenticated and not self.owner.competing:
+            owner = self.owner
+        else:
+            sessions = [instance for instance in self.instances if instance.healthy and instance.authenticated]
+            owner = next((instance for instance in sessions if not instance.competing), sessions[0] if sessions else None)
+
+        if owner is not self.owner:
+            logger.warning(f"Order traffic now goes to {owner.base if owner else 'no gateway (no brokerage session)'}")
+        self.owner = owner
+
+    def acquire(self, path, exclude=()):
+        """Return the instance for a request path, counted as outstanding until release()"""
+        if all(instance.checked_at is None for instance in self.instances):
+            self.check_all()
+            self.start()
+
+        with self.lock:
+            if SESSION_PATH.match(path):
+                candidates = [self.owner] if self.owner is not None and self.owner not in exclude else []
+            else:
+                available = [instance for instance in self.instances if instance not in exclude]
+                healthy = [instance for instance in available if instance.healthy]
+                sessions = [instance for instance in healthy if instance.authenticated]
+                # With no usable instance, still send the request so the caller sees the gateway's own error
+                candidates = sessions or healthy or available
+
+            if not candidates:
+                return None
+            instance = min(candidates, key=lambda instance: (instance.outstanding, instance.latency))
+            instance.outstanding += 1
+            return instance
+
+    def release(self, instance, error, elapsed):
+        with self.lock:
+            instance.outstanding -= 1
+            instance.served += 1
+            if error is None or error in ANSWERED_ERRORS:
+                instance.failures = 0
+                instance.latency = elapsed if not instance.latency else instance.latency * 0.8 + elapsed * 0.2
+                if error == 'unauthorized' and instance.authenticated:
+                    instance.authenticated = False
+                    self._pick_owner()
+                return
+
+            instance.failures += 1
+            instance.last_error = error
+            if instance.failures >= GATEWAY_MAX_FAILURES and instance.healthy:
+                logger.warning(f"Gateway {instance.base} failed {instance.failures} requests in a row, taking it out of rotation")
+                instance.healthy = False
+                instance.authenticated = False
+                self._pick_owner()
+
+    def request(self, url, method, send):
+        """
+        Send a request built on self.base through the pool; send(target_url)
+        returns (data, error) like safe_api_request. A GET that fails in
+        transport is retried once on another instance.
+        """
+        path = url[len(self.base):]
+        tried = []
+        while True:
+            instance = self.acquire(path, tried)
+            if instance is None:
+                return (None, "no_brokerage_session") if not tried else result
+
+            started = time.time()
+            result = (None, "request_failed")
+            try:
+                result = send(instance.base + path)
+            finally:
+                self.release(instance, result[1], time.time() - started)
+
+            tried.append(instance)
+            error = result[1]
+            if error is None or error in ANSWERED_ERRORS or method.lower() != 'get' or len(tried) > 1:
+                return result
+            logger.warning(f"Retrying {path} on another gateway after: {error}")
+
+    def login_url(self):
+        """Gateway root a user should log in to: the first instance without a session"""
+        with self.lock:
+            instance = next((instance for instance in self.instances if not instance.authenticated), self.owner or self.instances[0])
+            return instance.gateway_url
+
+    def stats(self):
+        with self.lock:
+            return {
+                "orderInstance": self.owner.base if self.owner else None,
+                "instances": [instance.stats() for instance in self.instances]
+            }
+
+
+def get_pool(check):
+    """The configured pool, or None when GATEWAY_POOL is empty; check(base) returns (auth_status, error)"""
+    global _pool
+    if not GATEWAY_POOL:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = GatewayPool(GATEWAY_POOL, check)
+        return _pool
@@ -0,0 +1,18 @@
+# Production serving settings for `gunicorn -c gunicorn.conf.py app:app`
+# Every value can be overridden from the environment (see start.sh / Dockerfile)
+import multiprocessing, os
+
+bind = os.environ.get('WEBAPP_BIND', '0.0.0.0:5056')
+
+# Worker processes share gateway responses through shared_cache (SQLite WAL)
+workers = int(os.environ.get('WEBAPP_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEBAPP_THREADS', '4'))
+
+timeout = int(os.environ.get('WEBAPP_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('WEBAPP_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('WEBAPP_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEBAPP_LOG_LEVEL', 'info')
@@ -0,0 +1,95 @@
+# Position fields that are additive across accounts
+POSITION_SUM_FIELDS = ('position', 'marketValue', 'mktValue', 'unrealizedPnl', 'realizedPnl')
+
+# Ledger fields that describe a rate rather than an amount
+LEDGER_KEEP_FIELDS = ('exchangerate', 'currency', 'acctcode', 'key', 'timestamp', 'severity')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_summaries(summaries):
+    """Sum the amount of every summary field across accounts"""
+    merged = {}
+    for summary in summaries:
+        for key, value in (summary or {}).items():
+            if not isinstance(value, dict) or _number(value.get('amount')) is None:
+                continue
+
+            field = merged.get(key)
+            if field is None:
+                merged[key] = {"amount": _number(value['amount']), "currency": value.get('currency')}
+            else:
+                field["amount"] += _number(value['amount'])
+                if field["currency"] != value.get('currency'):
+                    field["currency"] = None
+    return merged
+
+
+def merge_positions(positions_by_account):
+    """Combine positions held in several accounts into one row per conid"""
+    merged = {}
+    for account_id, positions in positions_by_account.items():
+        for position in positions or []:
+            conid = position.get('conid')
+            row = merged.get(conid)
+            if row is None:
+                row = merged[conid] = dict(position, accounts=[])
+                for field in POSITION_SUM_FIELDS:
+                    if field in row:
+                        row[field] = 0.0
+                row['_cost'] = 0.0
+
+            for field in POSITION_SUM_FIELDS:
+                amount = _number(position.get(field))
+                if amount is not None:
+                    row[field] = row.get(field, 0.0) + amount
+
+            row['_cost'] += (_number(position.get('avgCost')) or 0.0) * (_number(position.get('position')) or 0.0)
+            row['accounts'].append(account_id)
+
+    rows = []
+    for row in merged.values():
+        cost = row.pop('_cost')
+        quantity = _number(row.get('position')) or 0.0
+        if 'avgCost' in row:
+            row['avgCost'] = cost / quantity if quantity else 0.0
+        rows.append(row)
+    return rows
+
+
+def merge_ledgers(ledgers):
+    """Sum ledger amounts per currency across accounts"""
+    merged = {}
+    for ledger in ledgers:
+        for currency, data in (ledger or {}).items():
+            if not isinstance(data, dict):
+                continue
+            target = merged.setdefault(currency, {})
+            for key, value in data.items():
+                amount = _number(value)
+                if key in LEDGER_KEEP_FIELDS or amount is None:
+                    target.setdefault(key, value)
+                else:
+                    target[key] = target.get(key, 0.0) + amount
+    return merged
+
+
+def merge_allocations(allocations):
+    """Sum long/short allocation buckets (assetClass, sector, group) across accounts"""
+    merged = {}
+    for allocation in allocations:
+        for category, sides in (allocation or {}).items():
+            if not isinstance(sides, dict):
+                continue
+            for side, buckets in sides.items():
+                if not isinstance(buckets, dict):
+                    continue
+                target = merged.setdefault(category, {}).setdefault(side, {})
+                for name, value in buckets.items():
+                    target[name] = target.get(name, 0.0) + (_number(value) or 0.0)
+    return merged
@@ -0,0 +1,198 @@
+from itertools import chain
+from operator import itemgetter
+import numpy as np
+
+FIELDS = ('t', 'o', 'h', 'l', 'c', 'v')
+_bar_values = itemgetter(*FIELDS)
+
+# Indicators run when the caller does not ask for specific ones
+DEFAULT_INDICATORS = ["sma:20", "sma:50", "ema:20", "rsi:14", "macd:12:26:9", "bbands:20:2", "atr:14", "vwap"]
+
+
+def align_bars(bars_by_conid):
+    """
+    Stack /iserver/marketdata/history bars into [n_series, n_bars] arrays.
+
+    Series are right-aligned on their most recent bar; shorter histories are
+    padded with NaN on the left so every indicator can run on the whole
+    matrix at once.
+    """
+    conids = list(bars_by_conid)
+    length = max((len(bars) for bars in bars_by_conid.values()), default=0)
+    stacked = np.full((len(FIELDS), len(conids), length), np.nan)
+
+    for row, conid in enumerate(conids):
+        bars = bars_by_conid[conid]
+        if not bars:
+            continue
+        try:
+            values = np.fromiter(chain.from_iterable(map(_bar_values, bars)), dtype=float,
+                                 count=len(bars) * len(FIELDS)).reshape(len(bars), len(FIELDS))
+        except KeyError:
+            # Some bars lack a field (e.g. no volume); take the slower per-field path
+            values = np.array([[bar.get(name, np.nan) for name in FIELDS] for bar in bars], dtype=float)
+        stacked[:, row, length - len(bars):] = values.T
+
+    return conids, dict(zip(FIELDS, stacked))
+
+
+def _valid_count(x):
+    return np.cumsum(~np.isnan(x), axis=1)
+
+
+def sma(x, n):
+    filled = np.nan_to_num(x)
+    csum = np.cumsum(filled, axis=1)
+    csum[:, n:] = csum[:, n:] - csum[:, :-n]
+    out = csum / n
+    out[_valid_count(x) < n] = np.nan
+    return out
+
+
+def rolling_std(x, n):
+    mean = sma(x, n)
+    mean_sq = sma(x * x, n)
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+
+
+def ema(x, n=None, alpha=None):
+    """Exponential moving average along time; one vector step per bar across all series"""
+    alpha = alpha if alpha is not None else 2.0 / (n + 1)
+    out = np.full_like(x, np.nan)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        column = x[:, t]
+        prev = np.where(np.isnan(prev), column, prev + alpha * (column - prev))
+        out[:, t] = prev
+    if n:
+        out[_valid_count(x) < n] = np.nan
+    return out
+
+
+def rsi(close, n=14):
+    delta = np.diff(close, axis=1, prepend=np.nan)
+    gains = np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0))
+    losses = np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0))
+    # Wilder smoothing
+    avg_gain = ema(gains, alpha=1.0 / n)
+    avg_loss = ema(losses, alpha=1.0 / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    out[_valid_count(delta) < n] = np.nan
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(close, n=20, width=2.0):
+    middle = sma(close, n)
+    spread = rolling_std(close, n) * width
+    return middle + spread, middle, middle - spread
+
+
+def atr(high, low, close, n=14):
+    prev_close = np.roll(close, 1, axis=1)
+    prev_close[:, 0] = np.nan
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    out = ema(true_range, alpha=1.0 / n)
+    out[_valid_count(true_range) < n] = np.nan
+    return out
+
+
+def vwap(high, low, close, volume):
+    """VWAP anchored at the first bar of the window"""
+    typical = (high + low + close) / 3
+    volume = np.nan_to_num(volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.cumsum(np.nan_to_num(typical) * volume, axis=1) / np.cumsum(volume, axis=1)
+    out[np.isnan(close)] = np.nan
+    return out
+
+
+def _params(spec, defaults):
+    """Parse the numbers after the name; windows must be whole numbers >= 1 and widths finite and > 0"""
+    parts = spec.split(':')[1:]
+    if len(parts) > len(defaults):
+        raise ValueError(f"Too many parameters in indicator: {spec}")
+    try:
+        values = [type(default)(part) for part, default in zip(parts, defaults)]
+    except ValueError:
+        raise ValueError(f"Invalid indicator parameters: {spec}") from None
+    for value in values:
+        if not np.isfinite(value) or (value < 1 if isinstance(value, int) else value <= 0):
+            raise ValueError(f"Invalid indicator parameters: {spec}")
+    return values + list(defaults[len(parts):])
+
+
+def compute(bars_by_conid, specs=None):
+    """
+    Compute indicators for every series in one pass.
+
+    specs are strings like "sma:20", "macd:12:26:9" or "bbands:20:2".
+    Returns (conids, fields, columns) where columns maps an output name
+    (e.g. "sma_20", "macd_signal") to an [n_series, n_bars] array.
+    """
+    conids, fields = align_bars(bars_by_conid)
+    c, h, l, v = fields['c'], fields['h'], fields['l'], fields['v']
+    columns = {}
+
+    for spec in specs or DEFAULT_INDICATORS:
+        name = spec.split(':')[0].lower()
+        if name == 'sma':
+            n, = _params(spec, [20])
+            columns[f"sma_{n}"] = sma(c, n)
+        elif name == 'ema':
+            n, = _params(spec, [20])
+            columns[f"ema_{n}"] = ema(c, n)
+        elif name == 'rsi':
+            n, = _params(spec, [14])
+            columns[f"rsi_{n}"] = rsi(c, n)
+        elif name == 'macd':
+            fast, slow, signal = _params(spec, [12, 26, 9])
+            columns["macd"], columns["macd_signal"], columns["macd_hist"] = macd(c, fast, slow, signal)
+        elif name == 'bbands':
+            n, width = _params(spec, [20, 2.0])
+            columns["bb_upper"], columns["bb_middle"], columns["bb_lower"] = bollinger(c, n, width)
+        elif name == 'atr':
+            n, = _params(spec, [14])
+            columns[f"atr_{n}"] = atr(h, l, c, n)
+        elif name == 'vwap':
+            columns["vwap"] = vwap(h, l, c, v)
+        else:
+            raise ValueError(f"Unknown indicator: {spec}")
+
+    return conids, fields, columns
+
+
+def to_json_rows(values):
+    """Array row to a JSON-safe list (NaN -> None)"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def columnar(conids, fields, columns):
+    """{conid: {"t": [...], "c": [...], <indicator>: [...]}} without the left padding"""
+    result = {}
+    for row, conid in enumerate(conids):
+        start = int(np.argmax(~np.isnan(fields['c'][row]))) if fields['c'].shape[1] else 0
+        series = {"t": to_json_rows(fields['t'][row, start:]), "c": to_json_rows(fields['c'][row, start:])}
+        for name, values in columns.items():
+            series[name] = to_json_rows(values[row, start:])
+        result[conid] = series
+    return result
+
+
+def latest(conids, fields, columns):
+    """{conid: {"c": last close, <indicator>: last value}} for screening"""
+    if not conids or fields['c'].shape[1] == 0:
+        return {conid: {} for conid in conids}
+    result = {conid: {"c": None} for conid in conids}
+    last = {"c": fields['c'][:, -1]}
+    last.update({name: values[:, -1] for name, values in columns.items()})
+    for name, values in last.items():
+        for conid, value in zip(conids, to_json_rows(values)):
+            result[conid][name] = value
+    return result
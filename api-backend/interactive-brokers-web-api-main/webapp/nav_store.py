@@ -0,0 +1,165 @@
+import os, sqlite3, threading, time, logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+NAV_STORE_PATH = os.environ.get('NAV_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'nav.sqlite3'))
+
+# Minimum seconds between /pa/performance refreshes of one account
+NAV_REFRESH_SECONDS = float(os.environ.get('NAV_REFRESH_SECONDS', '900'))
+# Seconds before a failed refresh is tried again
+NAV_RETRY_SECONDS = float(os.environ.get('NAV_RETRY_SECONDS', '30'))
+
+# Days covered by each /performance?period= value; 'all' is the whole store
+PERIOD_DAYS = {
+    '1d': 1,
+    '1w': 7,
+    '1m': 30,
+    '3m': 90,
+    '6m': 180,
+    '1y': 365,
+    'all': None
+}
+
+# Smallest /pa/performance period that covers a gap of N days
+GAP_PERIODS = [(1, '1D'), (7, '1W'), (30, '1M'), (90, '3M'), (180, '6M'), (365, '1Y')]
+# Longest /pa/performance period, fetched on the first fill (and for gaps over a year) so 'all' reaches back that far
+BACKFILL_PERIOD = os.environ.get('NAV_BACKFILL_PERIOD', '5Y')
+
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(NAV_STORE_PATH), exist_ok=True)
+    conn = sqlite3.connect(NAV_STORE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS nav_history (
+        account_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        nav REAL NOT NULL,
+        daily_return REAL,
+        PRIMARY KEY (account_id, date)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE TABLE IF NOT EXISTS nav_refresh (account_id TEXT PRIMARY KEY, refreshed_at REAL NOT NULL)")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def normalize_date(value):
+    """Accept YYYYMMDD or YYYY-MM-DD and return the YYYYMMDD form the gateway uses"""
+    return str(value).replace('-', '')[:8] if value else None
+
+
+def last_date(account_id):
+    row = _connect().execute("SELECT MAX(date) FROM nav_history WHERE account_id = ?", (account_id,)).fetchone()
+    return row[0] if row else None
+
+
+def claim_refresh(account_id, min_interval=NAV_REFRESH_SECONDS):
+    """
+    Return True if the caller should refresh account_id from the gateway now.
+
+    The timestamp update doubles as a cross-process lock: only the worker
+    whose UPDATE/INSERT succeeds performs the fetch. If the fetch fails the
+    caller must call release_refresh(), or the account waits a full interval.
+    """
+    conn = _connect()
+    now = time.time()
+    cursor = conn.execute("UPDATE nav_refresh SET refreshed_at = ? WHERE account_id = ? AND refreshed_at < ?",
+                          (now, account_id, now - min_interval))
+    if cursor.rowcount == 1:
+        return True
+    cursor = conn.execute("INSERT OR IGNORE INTO nav_refresh (account_id, refreshed_at) VALUES (?, ?)", (account_id, now))
+    return cursor.rowcount == 1
+
+
+def release_refresh(account_id, min_interval=NAV_REFRESH_SECONDS, retry_after=NAV_RETRY_SECONDS):
+    """Give up a claim after a failed refresh so the next claim succeeds after retry_after seconds"""
+    _connect().execute("UPDATE nav_refresh SET refreshed_at = ? WHERE account_id = ?",
+                       (time.time() - min_interval + retry_after, account_id))
+
+
+def gap_period(last):
+    """Gateway period needed to cover the days missing since last (None: backfill)"""
+    if last is None:
+        return BACKFILL_PERIOD
+
+    missing_days = (datetime.now() - datetime.strptime(last, "%Y%m%d")).days
+    for days, period in GAP_PERIODS:
+        if missing_days < days:
+            return period
+    return BACKFILL_PERIOD
+
+
+def append(account_id, dates, navs, cumulative_returns=None):
+    """
+    Upsert a /pa/performance window into the store.
+
+    Cumulative returns in the window are turned into daily returns so that
+    windows fetched at different times chain correctly; the first day of a
+    window has no predecessor there and keeps any daily return already stored.
+    """
+    rows = []
+    previous = None
+    for i, (date, nav) in enumerate(zip(dates, navs)):
+        daily_return = None
+        if cumulative_returns and i < len(cumulative_returns):
+            current = 1 + float(cumulative_returns[i])
+            if previous is not None and previous != 0:
+                daily_return = current / previous - 1
+            previous = current
+        rows.append((account_id, normalize_date(date), float(nav), daily_return))
+
+    conn = _connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany("""INSERT INTO nav_history (account_id, date, nav, daily_return) VALUES (?, ?, ?, ?)
+            ON CONFLICT (account_id, date) DO UPDATE SET
+                nav = excluded.nav,
+                daily_return = COALESCE(excluded.daily_return, nav_history.daily_return)""", rows)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def iter_series(account_id, start=None, end=None, batch_size=1000):
+    """Yield (date, nav, daily_return) rows between start and end inclusive without loading them all"""
+    query = "SELECT date, nav, daily_return FROM nav_history WHERE account_id = ?"
+    params = [account_id]
+    if start:
+        query += " AND date >= ?"
+        params.append(normalize_date(start))
+    if end:
+        query += " AND date <= ?"
+        params.append(normalize_date(end))
+
+    cursor = _connect().execute(query + " ORDER BY date", params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def series(account_id, start=None, end=None):
+    """Return [(date, nav, daily_return)] for account_id between start and end inclusive"""
+    return list(iter_series(account_id, start, end))
+
+
+def period_start(period):
+    """First date (YYYYMMDD) of a named period, or None for the whole store"""
+    days = PERIOD_DAYS.get(period, PERIOD_DAYS['1m'])
+    if days is None:
+        return None
+    return (datetime.now() - timedelta(days=days - 1)).strftime("%Y%m%d")
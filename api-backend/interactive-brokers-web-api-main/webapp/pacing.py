@@ -0,0 +1,76 @@
+import logging, os, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# IBKR Client Portal allows roughly 10 requests per second per session
+GATEWAY_RATE_LIMIT = float(os.environ.get('GATEWAY_RATE_LIMIT', '10'))
+GATEWAY_MAX_CONCURRENCY = int(os.environ.get('GATEWAY_MAX_CONCURRENCY', '8'))
+_workers = max(1, int(os.environ.get('WEBAPP_WORKERS', '1')))
+
+
+class RateLimiter:
+    """Token bucket shared by all threads of this process"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Token bucket in the shared SQLite cache, so the limit holds across all
+    gunicorn workers rather than per process. If the cache file cannot be
+    used, each process falls back to its share of the rate.
+    """
+
+    def __init__(self, name, rate, burst=None, workers=_workers):
+        self.name = name
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.fallback = RateLimiter(rate / workers, self.capacity / workers)
+
+    def acquire(self):
+        while True:
+            try:
+                wait = shared_cache.take_token(self.name, self.rate, self.capacity)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared rate limiter unavailable, pacing this process alone: {e}")
+                self.fallback.acquire()
+                return
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+gateway_limiter = SharedRateLimiter("gateway", GATEWAY_RATE_LIMIT)
+
+
+def paced_map(fn, items, max_workers=GATEWAY_MAX_CONCURRENCY):
+    """Run fn over items concurrently under the gateway pacing limit, keeping input order"""
+    items = list(items)
+    if not items:
+        return []
+
+    def run(item):
+        gateway_limiter.acquire()
+        return fn(item)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(run, items))
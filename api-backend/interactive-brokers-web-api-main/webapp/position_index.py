@@ -0,0 +1,206 @@
+import base64, json, logging, os, threading, time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Seconds an account's indexed positions are reused before they are rebuilt from the gateway cache
+POSITION_INDEX_TTL = float(os.environ.get('POSITION_INDEX_TTL', os.environ.get('GATEWAY_CACHE_TTL', '10')))
+POSITION_PAGE_LIMIT = int(os.environ.get('POSITION_PAGE_LIMIT', '50'))
+POSITION_PAGE_MAX = int(os.environ.get('POSITION_PAGE_MAX', '1000'))
+
+# Query string filter -> position field, matched case-insensitively; several values are comma-separated
+FACETS = {
+    'sector': 'sector',
+    'assetClass': 'assetClass',
+    'currency': 'currency',
+}
+PNL_FIELD = 'unrealizedPnl'
+# Fields matched by ?q=
+SEARCH_FIELDS = ('contractDesc', 'ticker', 'description', 'name', 'conid')
+SEARCH_CACHE_SIZE = 32
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _conid(position):
+    return str(position.get('conid', ''))
+
+
+class Column:
+    """
+    One sort column: rows with a value in ascending (value, conid) order, then
+    rows without one. Descending order walks the valued rows backwards, so a
+    single sort serves both directions.
+    """
+
+    def __init__(self, rows, name):
+        values = [row.get(name) for row in rows]
+        numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values if v not in (None, ''))
+        present, missing = [], []
+        for i, (row, value) in enumerate(zip(rows, values)):
+            if value in (None, ''):
+                missing.append((_conid(row), i))
+            else:
+                present.append(((value if numeric else str(value).lower()), _conid(row), i))
+        present.sort()
+        missing.sort()
+        self.numeric = numeric
+        self.keys = [(value, conid) for value, conid, _ in present]
+        self.rows = [i for _, _, i in present]
+        self.missing_keys = [conid for conid, _ in missing]
+        self.missing_rows = [i for _, i in missing]
+
+    def after(self, cursor, descending):
+        """Row indices following cursor ([missing, value, conid] or None) in the requested direction"""
+        if cursor is None:
+            yield from reversed(self.rows) if descending else self.rows
+            yield from self.missing_rows
+            return
+
+        missing, value, conid = cursor
+        if missing:
+            yield from islice(self.missing_rows, bisect_right(self.missing_keys, conid), None)
+            return
+
+        key = (value, conid)
+        if descending:
+            for i in range(bisect_left(self.keys, key) - 1, -1, -1):
+                yield self.rows[i]
+        else:
+            yield from islice(self.rows, bisect_right(self.keys, key), None)
+        yield from self.missing_rows
+
+
+class PositionIndex:
+    """
+    In-memory copy of one account's positions for server-side paging.
+
+    Facet filters (sector, asset class, currency, P&L sign) are precomputed
+    row sets; sort columns are sorted on first use and kept, and text
+    searches are cached, so repeated polls of a page only walk that page.
+    Cursors are keysets (sort value, conid), so paging keeps its place when
+    the index is rebuilt with new prices.
+    """
+
+    def __init__(self, positions):
+        self.positions = positions
+        self.built_at = time.time()
+        self.columns = {}
+        self.searches = OrderedDict()
+        self.haystacks = None
+        self.lock = threading.Lock()
+
+        self.facets = {param: {} for param in FACETS}
+        self.pnl = {'positive': set(), 'negative': set(), 'zero': set()}
+        for i, position in enumerate(positions):
+            for param, field in FACETS.items():
+                value = str(position.get(field) or '').lower()
+                self.facets[param].setdefault(value, set()).add(i)
+            try:
+                pnl = float(position.get(PNL_FIELD) or 0)
+            except (TypeError, ValueError):
+                pnl = 0.0
+            self.pnl['positive' if pnl > 0 else 'negative' if pnl < 0 else 'zero'].add(i)
+
+    def column(self, name):
+        with self.lock:
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = Column(self.positions, name)
+            return column
+
+    def search(self, text):
+        text = text.lower()
+        with self.lock:
+            found = self.searches.get(text)
+            if found is not None:
+                self.searches.move_to_end(text)
+                return found
+            if self.haystacks is None:
+                self.haystacks = ['\n'.join(str(position.get(field) or '') for field in SEARCH_FIELDS).lower()
+                                  for position in self.positions]
+            found = self.searches[text] = {i for i, haystack in enumerate(self.haystacks) if text in haystack}
+            while len(self.searches) > SEARCH_CACHE_SIZE:
+                self.searches.popitem(last=False)
+            return found
+
+    def matching(self, filters, text):
+        """Row set for the filters ({param: [values]}) and search text, or None for every row"""
+        sets = []
+        for param, values in filters.items():
+            index = self.pnl if param == 'pnl' else self.facets[param]
+            sets.append(set().union(*(index.get(value.lower(), ()) for value in values)))
+        if text:
+            sets.append(self.search(text))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def page(self, sort=None, descending=False, filters=None, text=None, cursor=None, limit=POSITION_PAGE_LIMIT):
+        """Return (rows, total, next_cursor) for one page"""
+        sort = sort or 'conid'
+        column = self.column(sort)
+        rows = self.matching(filters or {}, text)
+
+        cursor = decode_cursor(cursor, sort, descending)
+        if cursor is not None and not cursor[0] and isinstance(cursor[1], (int, float)) != column.numeric:
+            raise ValueError("cursor no longer matches the data; start again without a cursor")
+
+        ordered = column.after(cursor, descending)
+        if rows is not None:
+            ordered = (i for i in ordered if i in rows)
+        page = list(islice(ordered, limit + 1))
+
+        total = len(self.positions) if rows is None else len(rows)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(self.positions[page[-1]], column, sort, descending)
+        return [self.positions[i] for i in page], total, next_cursor
+
+
+def encode_cursor(position, column, sort, descending):
+    value = position.get(sort)
+    missing = value in (None, '')
+    if not missing and not column.numeric:
+        value = str(value).lower()
+    token = json.dumps([sort, int(descending), int(missing), None if missing else value, _conid(position)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, descending):
+    """[missing, value, conid] from a cursor token; ValueError if it is malformed or from another sort"""
+    if not cursor:
+        return None
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        cursor_sort, cursor_descending, missing, value, conid = token
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort or bool(cursor_descending) != descending:
+        raise ValueError("cursor belongs to a different sort; start again without a cursor")
+    return [missing, value, conid]
+
+
+def get_index(key, fetch):
+    """
+    Indexed positions for key (gateway and account), rebuilt from fetch() once
+    POSITION_INDEX_TTL has passed. fetch returns (positions_list, error).
+    """
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None and time.time() - index.built_at < POSITION_INDEX_TTL:
+        return index, None
+
+    positions, error = fetch()
+    if error:
+        return None, error
+
+    index = PositionIndex(positions)
+    with _indexes_lock:
+        _indexes[key] = index
+    return index, None
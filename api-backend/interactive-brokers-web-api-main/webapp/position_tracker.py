@@ -0,0 +1,105 @@
+import logging, os, threading
+import change_feed
+
+logger = logging.getLogger(__name__)
+
+POSITION_POLL_SECONDS = float(os.environ.get('POSITION_POLL_SECONDS', '10'))
+# Stop polling when nobody has read the tracker for this long; it restarts on the next read
+POSITION_TRACKER_IDLE_SECONDS = float(os.environ.get('POSITION_TRACKER_IDLE_SECONDS', '300'))
+POSITION_EVENT_BUFFER = int(os.environ.get('POSITION_EVENT_BUFFER', '20000'))
+# A price_moved event fires when the price is this many percent away from the last reported price
+POSITION_PRICE_MOVE_PCT = float(os.environ.get('POSITION_PRICE_MOVE_PCT', '1'))
+# An event stream closes after this long and the client reconnects from its last cursor
+POSITION_STREAM_SECONDS = float(os.environ.get('POSITION_STREAM_SECONDS', '300'))
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _price(position):
+    return _number(position.get('mktPrice', position.get('marketPrice')))
+
+
+class PositionTracker(change_feed.ChangeFeed):
+    """
+    Polls an account's positions in the background and keeps them indexed by conid.
+
+    Each poll is diffed against the previous one in a single pass and the
+    opened, closed, quantity_changed and price_moved events are appended to
+    the shared event log, read with a cursor like the order feed or pushed
+    to subscribers.
+    """
+
+    items_name = "positions"
+    thread_name = "position-tracker"
+
+    def __init__(self, name, fetch, interval=POSITION_POLL_SECONDS, move_pct=POSITION_PRICE_MOVE_PCT):
+        super().__init__(name, fetch, interval, POSITION_TRACKER_IDLE_SECONDS, POSITION_EVENT_BUFFER)
+        self.move_pct = move_pct
+
+    def key(self, position):
+        return str(position['conid']) if position.get('conid') else None
+
+    def extract(self, positions, error):
+        return (None, error) if error else (positions, None)
+
+    def diff(self, old, current, state):
+        """
+        Events turning old into current; one pass over each side. state
+        keeps, per conid, the price at the last price_moved event (or when
+        the position was first seen).
+        """
+        reference_prices = state.setdefault('reference_prices', {})
+        changes = []
+        for conid, position in current.items():
+            previous = old.get(conid)
+            quantity = _number(position.get('position'))
+
+            if previous is None:
+                if quantity:
+                    changes.append(('opened', position, {"quantity": quantity}))
+                continue
+
+            old_quantity = _number(previous.get('position'))
+            if quantity == 0 and old_quantity != 0:
+                changes.append(('closed', position, {"previousQuantity": old_quantity}))
+            elif quantity != old_quantity:
+                kind = 'opened' if old_quantity == 0 else 'quantity_changed'
+                changes.append((kind, position, {"quantity": quantity, "previousQuantity": old_quantity}))
+
+            reference = reference_prices.get(conid)
+            price = _price(position)
+            if quantity and reference and price and abs(price / reference - 1) * 100 >= self.move_pct:
+                changes.append(('price_moved', position, {"price": price, "previousPrice": reference,
+                                                          "changePct": round((price / reference - 1) * 100, 4)}))
+
+        for conid, previous in old.items():
+            if conid not in current and _number(previous.get('position')):
+                changes.append(('closed', previous, {"previousQuantity": _number(previous.get('position'))}))
+
+        for kind, position, _ in changes:
+            if kind in ('opened', 'price_moved'):
+                reference_prices[str(position['conid'])] = _price(position)
+        for conid, position in current.items():
+            reference_prices.setdefault(conid, _price(position))
+        for conid in [conid for conid in reference_prices if conid not in current]:
+            del reference_prices[conid]
+
+        return [(kind, dict(details, conid=str(position['conid']), position=position)) for kind, position, details in changes]
+
+
+def get_tracker(key, fetch):
+    """Return the running tracker for key (one per gateway and account), starting it if needed"""
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = _trackers[key] = PositionTracker(f"positions:{key}", fetch)
+        tracker.start()
+        return tracker
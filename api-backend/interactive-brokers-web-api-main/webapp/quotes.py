@@ -0,0 +1,127 @@
+import logging, os, re, threading, time
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Quotes are live data; keep them just long enough to share between concurrent page loads
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', '2'))
+# conids per /iserver/marketdata/snapshot call
+QUOTE_BATCH_SIZE = int(os.environ.get('QUOTE_BATCH_SIZE', '500'))
+
+# Snapshot field ids -> quote keys
+QUOTE_FIELDS = {
+    '31': 'last',
+    '84': 'bid',
+    '86': 'ask',
+    '82': 'change',
+    '83': 'changePct'
+}
+
+# In-process copy in front of the shared cache: conid -> (quote, expires_at)
+_local = {}
+_local_lock = threading.Lock()
+
+# Called with {conid: quote} for quotes new to this process (fetched or read from the shared cache)
+_listeners = []
+
+# The gateway prefixes prices with C (previous close) or H (halted)
+_PRICE_PREFIX = re.compile(r'^[A-Za-z]+')
+
+
+def _key(conid):
+    return f"quote:{conid}"
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _notify(quotes):
+    for fn in _listeners:
+        try:
+            fn(quotes)
+        except Exception:
+            logger.exception("Quote listener failed")
+
+
+def parse_price(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(_PRICE_PREFIX.sub('', str(value)).replace(',', '').rstrip('%'))
+    except ValueError:
+        return None
+
+
+def parse_snapshot_row(row):
+    """Quote dict for one snapshot row, or None while the gateway has no data yet"""
+    quote = {name: parse_price(row.get(field)) for field, name in QUOTE_FIELDS.items()}
+    if all(value is None for value in quote.values()):
+        # First request for a conid only subscribes it; the fields come on the next one
+        return None
+    quote['updated'] = row.get('_updated')
+    return quote
+
+
+def get_quotes(conids, fetch_snapshot):
+    """
+    Return {conid: quote} for conids, fetching all misses in batched snapshot calls.
+
+    fetch_snapshot(list_of_conids, fields) must return (response, error) for
+    /iserver/marketdata/snapshot. Conids without data yet are left out.
+    """
+    wanted = list(dict.fromkeys(str(conid) for conid in conids if conid))
+    found = {}
+    now = time.time()
+
+    with _local_lock:
+        for conid in wanted:
+            entry = _local.get(conid)
+            if entry is not None and entry[1] > now:
+                found[conid] = entry[0]
+
+    fresh = {}
+    misses = [conid for conid in wanted if conid not in found]
+    if misses:
+        shared = shared_cache.get_many(_key(conid) for conid in misses)
+        for conid in misses:
+            quote = shared.get(_key(conid))
+            if quote is not None:
+                fresh[conid] = found[conid] = quote
+        _remember(fresh)
+
+    misses = [conid for conid in wanted if conid not in found]
+    for i in range(0, len(misses), QUOTE_BATCH_SIZE):
+        batch = misses[i:i + QUOTE_BATCH_SIZE]
+        snapshot, error = fetch_snapshot(batch, list(QUOTE_FIELDS))
+
+        if error or not isinstance(snapshot, list):
+            logger.warning(f"Quote snapshot failed for {len(batch)} conids: {error}")
+            continue
+
+        fetched = {}
+        for row in snapshot:
+            quote = parse_snapshot_row(row) if isinstance(row, dict) and 'conid' in row else None
+            if quote is not None:
+                fetched[str(row['conid'])] = quote
+        found.update(fetched)
+        fresh.update(fetched)
+        _remember(fetched)
+        shared_cache.put_many({_key(conid): quote for conid, quote in fetched.items()}, QUOTE_CACHE_TTL)
+
+    if fresh and _listeners:
+        _notify(fresh)
+    return found
+
+
+def _remember(quotes):
+    expires_at = time.time() + QUOTE_CACHE_TTL
+    with _local_lock:
+        for conid, quote in quotes.items():
+            _local[conid] = (quote, expires_at)
+        # Drop expired entries so watching many lists over time does not grow the dict
+        if len(_local) > 10000:
+            now = time.time()
+            for conid in [conid for conid, entry in _local.items() if entry[1] <= now]:
+                del _local[conid]
@@ -0,0 +1,262 @@
+import os
+import numpy as np
+
+# Target kinds, most specific first: a conid target overrides its sector's, a sector target its asset class's
+TARGET_KINDS = ('conid', 'sector', 'assetClass')
+# What happens to holdings no target names: keep them as they are, or sell them out
+UNLISTED = ('hold', 'close')
+ORDER_TYPES = ('MKT', 'LMT')
+REBALANCE_MIN_TRADE_VALUE = float(os.environ.get('REBALANCE_MIN_TRADE_VALUE', '0'))
+REBALANCE_CASH_BUFFER = float(os.environ.get('REBALANCE_CASH_BUFFER', '0'))
+# Quantities this close to a lot boundary count as on it, so float noise does not drop a lot
+_LOT_EPSILON = 1e-9
+
+
+def validate(payload):
+    """Return (options, error) for a rebalance request body"""
+    if not isinstance(payload, dict):
+        return None, "request body must be an object"
+
+    targets = payload.get('targets')
+    if not isinstance(targets, dict) or not targets:
+        return None, f"targets must map one of {', '.join(TARGET_KINDS)} to {{name: weight}}"
+
+    options = {"targets": {}}
+    total = 0.0
+    for kind, weights in targets.items():
+        if kind not in TARGET_KINDS:
+            return None, f"unknown target kind {kind}; use {', '.join(TARGET_KINDS)}"
+        if not isinstance(weights, dict):
+            return None, f"targets.{kind} must map names to weights"
+        try:
+            parsed = {str(name): float(weight) for name, weight in weights.items()}
+        except (TypeError, ValueError):
+            return None, f"targets.{kind} weights must be numbers"
+        if any(not 0 <= weight <= 1 for weight in parsed.values()):
+            return None, "weights must be between 0 and 1 of net liquidation value"
+        options["targets"][kind] = parsed
+        total += sum(parsed.values())
+    if total > 1 + 1e-9:
+        return None, f"target weights add up to {total:.4f}, more than the whole account"
+
+    try:
+        options["cashBuffer"] = float(payload.get('cashBuffer', REBALANCE_CASH_BUFFER))
+        options["minTradeValue"] = float(payload.get('minTradeValue', REBALANCE_MIN_TRADE_VALUE))
+        lot_size = payload.get('lotSize', 1)
+        if isinstance(lot_size, dict):
+            options["lotSizes"] = {str(conid): float(size) for conid, size in lot_size.items()}
+            options["lotSize"] = 1.0
+        else:
+            options["lotSizes"] = {}
+            options["lotSize"] = float(lot_size)
+    except (TypeError, ValueError):
+        return None, "cashBuffer, minTradeValue and lotSize must be numbers"
+
+    if not 0 <= options["cashBuffer"] < 1:
+        return None, "cashBuffer must be a fraction of net liquidation value below 1"
+    if options["minTradeValue"] < 0:
+        return None, "minTradeValue cannot be negative"
+    if options["lotSize"] <= 0 or any(size <= 0 for size in options["lotSizes"].values()):
+        return None, "lot sizes must be positive"
+
+    options["unlisted"] = payload.get('unlisted', 'hold')
+    if options["unlisted"] not in UNLISTED:
+        return None, f"unlisted must be one of {', '.join(UNLISTED)}"
+    options["orderType"] = str(payload.get('orderType', 'MKT')).upper()
+    if options["orderType"] not in ORDER_TYPES:
+        return None, f"orderType must be one of {', '.join(ORDER_TYPES)}"
+    options["tif"] = payload.get('tif', 'DAY')
+    return options, None
+
+
+def instruments(positions, targets, contracts):
+    """
+    Rows to plan over: every open position plus conids targeted but not held.
+
+    Returns a list of dicts with conid, symbol, sector, assetClass, quantity,
+    multiplier and the position's own price. The multiplier is implied by
+    market value over quantity times price, as in attribution.holdings.
+    """
+    rows = {}
+    for p in positions:
+        conid = str(p.get('conid') or '')
+        quantity = float(p.get('position') or 0)
+        if not conid or not quantity:
+            continue
+        price = float(p.get('mktPrice') or p.get('marketPrice') or 0)
+        value = float(p.get('mktValue') or p.get('marketValue') or 0)
+        row = rows.setdefault(conid, {
+            "conid": conid,
+            "symbol": p.get('contractDesc') or p.get('ticker') or p.get('description') or conid,
+            "sector": p.get('sector') or 'Unknown',
+            "assetClass": p.get('assetClass') or p.get('secType') or 'Unknown',
+            "quantity": 0.0,
+            "multiplier": abs(value / (quantity * price)) if price and value else 1.0,
+            "price": price
+        })
+        row["quantity"] += quantity
+
+    for conid in targets.get('conid', {}):
+        if conid not in rows:
+            contract = contracts.get(conid) or {}
+            rows[conid] = {
+                "conid": conid,
+                "symbol": contract.get('ticker') or contract.get('symbol') or conid,
+                "sector": contract.get('sector') or 'Unknown',
+                "assetClass": contract.get('assetClass') or contract.get('secType') or 'Unknown',
+                "quantity": 0.0,
+                "multiplier": 1.0,
+                "price": 0.0
+            }
+    return list(rows.values())
+
+
+def quote_prices(quote):
+    """(reference, buy, sell) prices from a quote: last (or the mid), and the side of the book each order crosses"""
+    quote = quote or {}
+    bid, ask, last = quote.get('bid'), quote.get('ask'), quote.get('last')
+    reference = last if last else (bid + ask) / 2 if bid and ask else None
+    return reference, ask or reference, bid or reference
+
+
+def _spread(weights, kind_values, targets, values):
+    """
+    Give rows without a weight yet the group weight of their sector or asset
+    class, split pro rata to current value (equally when the group has no
+    net value). Returns the names of targets that matched no free row.
+    """
+    names, codes = np.unique(kind_values, return_inverse=True)
+    group_target = np.array([targets.get(name, np.nan) for name in names])
+    free = np.isnan(weights) & ~np.isnan(group_target[codes])
+
+    counts = np.bincount(codes[free], minlength=len(names))
+    totals = np.bincount(codes[free], weights=values[free], minlength=len(names))
+    by_value = totals[codes] > 0
+    share = np.where(by_value, values / np.where(by_value, totals[codes], 1.0),
+                     1.0 / np.maximum(counts[codes], 1))
+    weights[free] = group_target[codes][free] * share[free]
+
+    matched = set(names[counts > 0])
+    return [name for name in targets if name not in matched]
+
+
+def plan(rows, cash, quotes_by_conid, options):
+    """
+    Orders that move the account to the target weights, as a preview.
+
+    Everything is computed on [positions] arrays: each row's target weight is
+    taken from its most specific target, turned into a target value of the
+    net liquidation value, and the difference to the current value into a
+    quantity rounded toward zero to whole lots (a row targeted at zero is
+    closed in full). Trades below minTradeValue are dropped, and if the buys
+    need more cash than the account has after sells while keeping
+    cashBuffer, all buys are scaled down together.
+    """
+    n = len(rows)
+    conids = np.array([row["conid"] for row in rows], dtype=object)
+    quantity = np.array([row["quantity"] for row in rows], dtype=float)
+    multiplier = np.array([row["multiplier"] for row in rows], dtype=float)
+    lots = np.array([options["lotSizes"].get(row["conid"], options["lotSize"]) for row in rows], dtype=float)
+
+    quoted = [quote_prices(quotes_by_conid.get(row["conid"])) for row in rows]
+    price = np.array([q[0] or row["price"] or np.nan for q, row in zip(quoted, rows)], dtype=float)
+    priced = np.isfinite(price) & (price > 0)
+    unit_value = np.where(priced, price * multiplier, 0.0)
+    value = quantity * unit_value
+
+    nav = float(value.sum() + cash)
+    targets = options["targets"]
+    weights = np.full(n, np.nan)
+    unmatched = []
+
+    conid_targets = targets.get('conid', {})
+    if conid_targets:
+        weights[:] = [conid_targets.get(conid, np.nan) for conid in conids]
+    for kind in TARGET_KINDS[1:]:
+        if targets.get(kind):
+            kind_values = np.array([str(row[kind]) for row in rows], dtype=object)
+            unmatched += [{"kind": kind, "name": name} for name in _spread(weights, kind_values, targets[kind], value)]
+
+    unlisted = np.isnan(weights)
+    if options["unlisted"] == 'close':
+        weights[unlisted] = 0.0
+    else:
+        weights[unlisted] = value[unlisted] / nav if nav else 0.0
+
+    # Rows without a price can be neither valued nor sized
+    tradable = priced & (nav > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = np.where(tradable, (weights * nav - value) / unit_value, 0.0)
+        trade = np.fix(raw / lots + np.sign(raw) * _LOT_EPSILON) * lots
+    closing = tradable & (weights == 0)
+    trade[closing] = -quantity[closing]
+    if options["unlisted"] == 'hold':
+        trade[unlisted] = 0.0
+
+    def drop_small(trade):
+        trade[np.abs(trade * unit_value) < options["minTradeValue"]] = 0.0
+        return trade
+
+    trade = drop_small(trade)
+    flow = trade * unit_value
+    buys = flow[flow > 0].sum()
+    available = cash - flow[flow < 0].sum() - options["cashBuffer"] * nav
+    scale = 1.0
+    if buys > 0 and buys > available:
+        scale = max(available, 0.0) / buys
+        buying = trade > 0
+        trade[buying] = np.fix(trade[buying] * scale / lots[buying] + _LOT_EPSILON) * lots[buying]
+        trade = drop_small(trade)
+        flow = trade * unit_value
+
+    final_value = value + flow
+    cash_after = float(cash - flow.sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_weight = np.where(nav > 0, value / nav, 0.0)
+        final_weight = np.where(nav > 0, final_value / nav, 0.0)
+
+    orders = []
+    preview = []
+    # Sells first, so their proceeds are there when the buys arrive
+    for i in sorted(np.flatnonzero(trade), key=lambda i: (trade[i] > 0, -abs(flow[i]))):
+        side = "BUY" if trade[i] > 0 else "SELL"
+        size = abs(float(trade[i]))
+        order = {
+            "conid": int(conids[i]) if conids[i].isdigit() else conids[i],
+            "side": side,
+            "quantity": int(size) if size.is_integer() else size,
+            "orderType": options["orderType"],
+            "tif": options["tif"]
+        }
+        if options["orderType"] == 'LMT':
+            limit = quoted[i][1 if side == "BUY" else 2] or price[i]
+            order["price"] = round(float(limit), 4)
+        orders.append(order)
+
+    for i in np.argsort(-np.abs(flow), kind='stable'):
+        row = rows[i]
+        preview.append({
+            "conid": row["conid"],
+            "symbol": row["symbol"],
+            "sector": row["sector"],
+            "assetClass": row["assetClass"],
+            "price": float(price[i]) if priced[i] else None,
+            "quantity": float(quantity[i]),
+            "trade": float(trade[i]),
+            "tradeValue": round(float(flow[i]), 2),
+            "weight": round(float(current_weight[i]), 6),
+            "targetWeight": round(float(weights[i]), 6),
+            "finalWeight": round(float(final_weight[i]), 6)
+        })
+
+    return {
+        "nav": round(nav, 2),
+        "cash": round(float(cash), 2),
+        "cashAfter": round(cash_after, 2),
+        "cashBuffer": options["cashBuffer"],
+        "buyScale": round(float(scale), 6),
+        "orders": orders,
+        "positions": preview,
+        "unpriced": [row["conid"] for row, ok in zip(rows, priced) if not ok],
+        "unmatched": unmatched
+    }
@@ -0,0 +1,131 @@
+import gzip, hashlib, json, threading
+from collections import OrderedDict
+from flask import Response, after_this_request, render_template, request
+
+# orjson and brotli are optional; fall back to the stdlib encoder and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth the compression overhead
+MIN_COMPRESS_SIZE = 512
+
+ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+# Status of a page's JSON form, for templates that show a failure; the HTML pages are always 200
+PAGE_STATUS = {
+    'error.html': 500,
+    'auth_required.html': 401
+}
+
+# Pollers get the same body over and over, so keep recent compressed variants
+_compressed = OrderedDict()
+_compressed_lock = threading.Lock()
+_COMPRESSED_MAX_ENTRIES = 64
+
+
+def dumps(value):
+    """Serialize value to compact JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g. integers wider than 64 bits, let the stdlib encoder handle it
+            pass
+    # Template contexts can hold dates and other values without a JSON form; send their text
+    return json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def wants_json():
+    """True when the client prefers application/json over HTML in its Accept header"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
+def _vary_accept(response):
+    response.vary.add('Accept')
+    return response
+
+
+def render_page(template_name, **context):
+    """
+    render_template for page routes, with content negotiation.
+
+    Clients that send Accept: application/json get the template context
+    itself as a JSON response, so scrapers and integrations get the page's
+    data without Jinja rendering, HTML transfer or parsing. Error and login
+    pages answer with PAGE_STATUS codes in that form.
+    """
+    if wants_json():
+        return _vary_accept(json_response(context, PAGE_STATUS.get(template_name, 200)))
+    after_this_request(_vary_accept)
+    return render_template(template_name, **context)
+
+
+def negotiate_encoding():
+    """Content encoding json_response picks for this request: 'br', 'gzip' or None"""
+    accept = request.accept_encodings
+    if brotli is not None and accept['br'] > 0:
+        return 'br'
+    if accept['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def _compress(body, etag, encoding):
+    key = (etag, encoding)
+    with _compressed_lock:
+        if key in _compressed:
+            _compressed.move_to_end(key)
+            return _compressed[key]
+
+    if encoding == 'br':
+        data = brotli.compress(body, quality=5)
+    else:
+        data = gzip.compress(body, compresslevel=6)
+
+    with _compressed_lock:
+        _compressed[key] = data
+        while len(_compressed) > _COMPRESSED_MAX_ENTRIES:
+            _compressed.popitem(last=False)
+    return data
+
+
+def json_response(payload, status=200):
+    """
+    Build a JSON response with a strong ETag and negotiated compression.
+
+    The ETag is a hash of the serialized payload, so a client that sends it
+    back in If-None-Match gets an empty 304 until the upstream data changes.
+    Compressed variants carry their own ETag suffix as required for strong
+    validators.
+    """
+    body = dumps(payload)
+
+    if status != 200:
+        return Response(body, status=status, mimetype='application/json')
+
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    encoding = negotiate_encoding() if len(body) >= MIN_COMPRESS_SIZE else None
+    tag = etag + ENCODING_SUFFIXES.get(encoding, '')
+
+    if_none_match = request.if_none_match
+    if if_none_match and (if_none_match.star_tag or
+                          any(if_none_match.contains(etag + suffix) for suffix in ('', '-gz', '-br'))):
+        response = Response(status=304)
+    else:
+        if encoding:
+            body = _compress(body, etag, encoding)
+        response = Response(body, status=200, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,190 @@
+import hashlib, os, threading
+from collections import OrderedDict
+from operator import itemgetter
+from statistics import NormalDist
+import numpy as np
+
+# Default benchmark for beta (SPY)
+RISK_BENCHMARK_CONID = os.environ.get('RISK_BENCHMARK_CONID', '756733')
+RISK_CONFIDENCE = float(os.environ.get('RISK_CONFIDENCE', '0.95'))
+# Computed reports kept per (account, inputs) fingerprint
+RISK_CACHE_SIZE = int(os.environ.get('RISK_CACHE_SIZE', '32'))
+
+# Bars per year used to annualize volatility
+PERIODS_PER_YEAR = {
+    '1d': 252,
+    '1w': 52,
+    '1m': 12,
+    '1h': 252 * 6.5,
+    '30min': 252 * 13,
+    '5min': 252 * 78
+}
+
+_time_close = itemgetter('t', 'c')
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+
+
+def fingerprint(*parts):
+    """
+    Key for a risk report: exposures and the last bar of every series.
+
+    Bars only change when a new bar closes, so the report is reused until a
+    position changes or fresh history arrives.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+
+def cached_report(key, compute):
+    """Return the report stored under key, computing and storing it on a miss"""
+    with _reports_lock:
+        if key in _reports:
+            _reports.move_to_end(key)
+            return _reports[key]
+
+    report = compute()
+    with _reports_lock:
+        _reports[key] = report
+        while len(_reports) > RISK_CACHE_SIZE:
+            _reports.popitem(last=False)
+    return report
+
+
+def align_closes(bars_by_conid):
+    """
+    Stack closes on the union of bar timestamps: returns (conids, [n_bars, n_series]).
+
+    Missing bars (holidays on one exchange, late listings) are forward filled
+    so a gap counts as a flat day instead of dropping the date for everyone.
+    """
+    conids = [conid for conid, bars in bars_by_conid.items() if bars]
+    series = []
+    for conid in conids:
+        bars = bars_by_conid[conid]
+        pairs = np.fromiter((value for bar in bars for value in _time_close(bar)), dtype=float, count=2 * len(bars))
+        series.append(pairs.reshape(-1, 2))
+
+    if not series:
+        return [], np.empty((0, 0))
+
+    times = np.unique(np.concatenate([pairs[:, 0] for pairs in series]))
+    closes = np.full((len(times), len(conids)), np.nan)
+    for column, pairs in enumerate(series):
+        closes[np.searchsorted(times, pairs[:, 0]), column] = pairs[:, 1]
+
+    # Vectorized forward fill along time
+    index = np.where(np.isnan(closes), 0, np.arange(len(times))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    closes = closes[index, np.arange(len(conids))]
+    return conids, closes
+
+
+def simple_returns(closes):
+    """Bar-over-bar returns; bars before a series starts count as zero return"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = closes[1:] / closes[:-1] - 1
+    returns[~np.isfinite(returns)] = 0.0
+    return returns
+
+
+def _tail(pnl, confidence):
+    """Historical (VaR, CVaR) of a P&L series as positive loss amounts"""
+    if len(pnl) == 0:
+        return None, None
+    var = -np.quantile(pnl, 1 - confidence)
+    tail = pnl[pnl <= -var]
+    return float(var), float(-tail.mean()) if len(tail) else float(var)
+
+
+def compute(exposures, bars_by_conid, benchmark_conid=None, confidence=RISK_CONFIDENCE, bar='1d'):
+    """
+    Risk report for a book of {conid: market value}.
+
+    Everything is in account currency per bar: VaR/CVaR are one-bar losses
+    at the given confidence, volatility is also shown annualized. Marginal
+    contributions are d(sigma)/d(exposure) and sum (times exposure) to the
+    portfolio sigma.
+    """
+    benchmark_conid = str(benchmark_conid) if benchmark_conid else None
+    held = [conid for conid in exposures if bars_by_conid.get(conid)]
+    series = {conid: bars_by_conid[conid] for conid in held}
+    if benchmark_conid and bars_by_conid.get(benchmark_conid):
+        series[benchmark_conid] = bars_by_conid[benchmark_conid]
+
+    conids, closes = align_closes(series)
+    columns = {conid: i for i, conid in enumerate(conids)}
+    returns = simple_returns(closes)
+    asset_returns = returns[:, [columns[conid] for conid in held]]
+    values = np.array([float(exposures[conid]) for conid in held])
+    gross = float(np.abs(values).sum())
+    net = float(values.sum())
+
+    report = {
+        "confidence": confidence,
+        "bar": bar,
+        "observations": int(len(returns)),
+        "positions": len(held),
+        "missingHistory": [conid for conid in exposures if conid not in columns],
+        "grossExposure": gross,
+        "netExposure": net
+    }
+    if len(returns) < 2 or not held:
+        report["error"] = "not_enough_history"
+        return report
+
+    covariance = np.atleast_2d(np.cov(asset_returns, rowvar=False))
+    variance = float(values @ covariance @ values)
+    sigma = variance ** 0.5
+    pnl = asset_returns @ values
+    mean = float(pnl.mean())
+
+    z = NormalDist().inv_cdf(confidence)
+    historical_var, historical_cvar = _tail(pnl, confidence)
+    report["volatility"] = {
+        "perBar": sigma,
+        "annualized": sigma * PERIODS_PER_YEAR.get(bar, 252) ** 0.5,
+        "perBarPct": sigma / gross if gross else None
+    }
+    report["var"] = {
+        "historical": historical_var,
+        "parametric": z * sigma - mean
+    }
+    report["cvar"] = {
+        "historical": historical_cvar,
+        "parametric": sigma * NormalDist().pdf(z) / (1 - confidence) - mean
+    }
+
+    marginal = covariance @ values / sigma if sigma else np.zeros(len(held))
+    component = marginal * values
+
+    betas = None
+    if benchmark_conid in columns:
+        benchmark = returns[:, columns[benchmark_conid]]
+        benchmark_variance = float(benchmark.var(ddof=1))
+        if benchmark_variance:
+            centered = asset_returns - asset_returns.mean(axis=0)
+            betas = centered.T @ (benchmark - benchmark.mean()) / (len(benchmark) - 1) / benchmark_variance
+            report["beta"] = {
+                "benchmark": benchmark_conid,
+                "portfolio": float(values @ betas / net) if net else None,
+                "dollar": float(values @ betas)
+            }
+
+    contributions = []
+    for i, conid in enumerate(held):
+        contributions.append({
+            "conid": conid,
+            "exposure": float(values[i]),
+            "volatility": float(covariance[i, i] ** 0.5),
+            "marginal": float(marginal[i]),
+            "component": float(component[i]),
+            "pctOfRisk": float(component[i] / sigma) if sigma else None,
+            "beta": float(betas[i]) if betas is not None else None
+        })
+    contributions.sort(key=lambda row: -abs(row["component"]))
+    report["contributions"] = contributions
+    return report
@@ -0,0 +1,218 @@
+import json, os, sqlite3, tempfile, threading, time, logging
+
+logger = logging.getLogger(__name__)
+
+# orjson decodes cached gateway payloads several times faster when it is installed
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+# Tüm worker process'leri aynı SQLite dosyasını paylaşır (WAL modu)
+CACHE_PATH = os.environ.get('WEBAPP_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'ibkr-webapp-cache.sqlite3'))
+
+# How long a worker waits for another worker's in-flight fetch before fetching itself; by
+# default longer than a gateway request may take, so a slow fetch is not started twice
+LEASE_SECONDS = float(os.environ.get('WEBAPP_CACHE_LEASE_SECONDS', float(os.environ.get('GATEWAY_REQUEST_TIMEOUT', '30')) + 5))
+LEASE_POLL_SECONDS = 0.05
+
+_local = threading.local()
+_writes = 0
+
+
+def _connect():
+    """Return a per-thread, per-process connection to the cache database"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def get(key):
+    """Return the cached value for key, or None if it is missing or expired"""
+    try:
+        row = _connect().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache read failed for {key}: {e}")
+        return None
+
+    if row is None or row[1] < time.time():
+        return None
+    return _loads(row[0])
+
+
+def get_many(keys):
+    """Return {key: value} for the keys that are cached and not expired"""
+    found = {}
+    now = time.time()
+    keys = list(keys)
+    try:
+        conn = _connect()
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, value, expires_at in rows:
+                if expires_at >= now:
+                    found[key] = _loads(value)
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache bulk read failed: {e}")
+    return found
+
+
+def put(key, value, ttl):
+    """Store a JSON-serializable value under key for ttl seconds"""
+    global _writes
+    try:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, separators=(',', ':')), time.time() + ttl)
+        )
+        _writes += 1
+        if _writes % 500 == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache write failed for {key}: {e}")
+
+
+def put_many(items, ttl):
+    """Store {key: value} in one transaction"""
+    expires_at = time.time() + ttl
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(value, separators=(',', ':')), expires_at) for key, value in items.items()]
+        )
+        conn.execute("COMMIT")
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache bulk write failed: {e}")
+        if conn is not None and conn.in_transaction:
+            conn.execute("ROLLBACK")
+
+
+def delete(key):
+    try:
+        _connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache delete failed for {key}: {e}")
+
+
+def _acquire_lease(key):
+    conn = _connect()
+    now = time.time()
+    conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+    cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + LEASE_SECONDS))
+    return cursor.rowcount == 1
+
+
+def _release_lease(key):
+    _connect().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+
+def take_token(name, rate, capacity):
+    """
+    Take one token from the token bucket name, shared by every worker
+    process. Returns 0 when a token was taken, otherwise the seconds until
+    the next one is due.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+        tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        if not wait:
+            tokens -= 1
+        conn.execute("INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?)", (name, tokens, now))
+        conn.execute("COMMIT")
+        return wait
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def hold_lease(key, seconds, held_until=None):
+    """
+    Take or renew the lease on key for long-running work that one worker
+    does for all of them, e.g. a background job.
+
+    held_until is the expiry this worker got from its previous call; the
+    lease is renewed only while that expiry is still the stored one, so a
+    worker that lost the lease never extends another's. Returns the new
+    expiry, or None while another worker holds the lease.
+    """
+    now = time.time()
+    expires_at = now + seconds
+    try:
+        conn = _connect()
+        if held_until is not None and held_until > now:
+            cursor = conn.execute("UPDATE leases SET expires_at = ? WHERE key = ? AND expires_at = ?",
+                                  (expires_at, key, held_until))
+            if cursor.rowcount == 1:
+                return expires_at
+        conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, expires_at))
+        return expires_at if cursor.rowcount == 1 else None
+    except sqlite3.Error as e:
+        # Without the shared file every worker does the work itself, as it would without the cache
+        logger.warning(f"Shared cache lease failed for {key}: {e}")
+        return expires_at
+
+
+def get_or_fetch(key, ttl, fetch):
+    """
+    Return (data, error) for key, calling fetch() at most once across workers.
+
+    fetch must return a (data, error) tuple like safe_api_request; only
+    successful results are cached. While one worker holds the lease for a
+    key, the others wait for its result instead of hitting the gateway too.
+    """
+    value = get(key)
+    if value is not None:
+        return value, None
+
+    try:
+        leased = _acquire_lease(key)
+        deadline = time.time() + LEASE_SECONDS
+        while not leased and time.time() < deadline:
+            time.sleep(LEASE_POLL_SECONDS)
+            value = get(key)
+            if value is not None:
+                return value, None
+            # The holder failed or finished without caching; take over the fetch
+            leased = _acquire_lease(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Shared cache lease failed for {key}: {e}")
+        return fetch()
+
+    if not leased:
+        logger.warning(f"Timed out waiting for shared cache key {key}, fetching directly")
+        return fetch()
+
+    try:
+        data, error = fetch()
+        if error is None and data is not None:
+            put(key, data, ttl)
+        return data, error
+    finally:
+        try:
+            _release_lease(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lease release failed for {key}: {e}")
@@ -0,0 +1,624 @@
+"""
+Compact binary snapshot files for cached account data.
+
+A snapshot is a dict of sections (e.g. summary, positions, allocation).
+Lists of records and dicts of records are stored column by column: numbers
+as packed float64/int64 arrays, strings as ids into a string dictionary
+shared by the whole file, columns holding a single value once. Dicts of
+mixed values are stored field by field the same way and anything else as
+JSON. Large sections are additionally zlib-compressed.
+
+Files are append-only: the first record holds a full snapshot and every
+later write appends only what changed (rows upserted or removed, matched on
+a key such as conid) plus the strings not seen before. Once the deltas
+outgrow the full record COMPACT_RATIO times the file is rewritten as a
+single full record. Readers only parse record headers and section
+directories up front and decode a section when it is asked for.
+
+Only the standard library is used so scripts outside the webapp (e.g.
+web_scraper.py) can share the format.
+"""
+import array, json, os, struct, sys, time, zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b'IBSNAP\x01\n'
+
+# Record kinds
+FULL, DELTA = 1, 2
+# Node kinds
+DOC, TABLE, KEYED, NESTED = 0, 1, 2, 3
+# Node modes in a directory; COMPRESSED is or-ed onto REPLACE/PATCH
+REPLACE, PATCH, REMOVE, COMPRESSED = 0, 1, 2, 0x80
+# Column kinds
+FLOAT, INT, BOOL, STRING, JSON = ord('d'), ord('q'), ord('b'), ord('s'), ord('j')
+# Column layouts; ABSENT is or-ed on when some rows do not have the field at all
+PLAIN, WITH_NULLS, CONSTANT, ABSENT = 0, 1, 2, 0x10
+
+RECORD_HEADER = struct.Struct('<BdII')      # kind, timestamp, payload length, crc32
+ENTRY = struct.Struct('<IBBII')             # name id, node kind, mode, offset, length
+COLUMN_HEADER = struct.Struct('<IBBI')      # name id, column kind, layout, body length
+U16, U32 = struct.Struct('<H'), struct.Struct('<I')
+
+NO_NAME = 0xFFFFFFFF
+
+# Rewrite the file as one full record once it is this many times the size of its full record
+COMPACT_RATIO = 4
+# Sections at least this large are zlib-compressed when that makes them smaller
+COMPRESS_MIN_BYTES = 256
+
+# Fields tried, in order, to match rows of a list between two snapshots
+KEY_FIELDS = ('conid', 'acctId', 'orderId', 'symbol', 'name', 'id')
+
+_ARRAY_TYPES = {FLOAT: 'd', INT: 'q', STRING: 'I', JSON: 'I'}
+_INT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _to_le(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _dump_json(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+
+class StringTable:
+    """String dictionary; ids are positions in the file-wide list"""
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self.ids = {s: i for i, s in enumerate(self.strings)}
+        self.mark = len(self.strings)
+
+    def intern(self, s):
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return string_id
+
+    def encode_new(self):
+        """Strings added since the table was created, as a length-prefixed block"""
+        new = [s.encode() for s in self.strings[self.mark:]]
+        return U32.pack(len(new)) + b''.join(U32.pack(len(s)) + s for s in new)
+
+
+# Columns
+
+def _column_kind(values):
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add(BOOL)
+        elif isinstance(value, int):
+            kinds.add(INT if _INT_RANGE[0] <= value <= _INT_RANGE[1] else JSON)
+        elif isinstance(value, float):
+            kinds.add(FLOAT)
+        elif isinstance(value, str):
+            kinds.add(STRING)
+        else:
+            kinds.add(JSON)
+
+    if not kinds:
+        return BOOL
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {INT, FLOAT}:
+        return FLOAT
+    return JSON
+
+
+def _pack_values(values, kind, strings):
+    if kind == BOOL:
+        return bytes(1 if value else 0 for value in values)
+    if kind == FLOAT:
+        return _to_le(array.array('d', (0.0 if value is None else float(value) for value in values)))
+    if kind == INT:
+        return _to_le(array.array('q', (0 if value is None else value for value in values)))
+    if kind == STRING:
+        return _to_le(array.array('I', (0 if value is None else strings.intern(value) for value in values)))
+    return _to_le(array.array('I', (0 if value is None else strings.intern(_dump_json(value)) for value in values)))
+
+
+def _unpack_values(data, kind, count, strings, nulls=None):
+    """Values of a packed column; slots set in the nulls bitmap come back as None without being decoded"""
+    if kind == BOOL:
+        values = [bool(b) for b in data[:count]]
+    else:
+        values = _from_le(_ARRAY_TYPES[kind], data).tolist()
+        if kind in (STRING, JSON):
+            # Null slots hold a placeholder id that need not be a valid string or JSON document
+            decode = strings.__getitem__ if kind == STRING else lambda i: json.loads(strings[i])
+            return [None if nulls is not None and _bit(nulls, i) else decode(value) for i, value in enumerate(values)]
+    if nulls is not None:
+        for i in range(count):
+            if _bit(nulls, i):
+                values[i] = None
+    return values
+
+
+def _bitmap(flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+def _bit(bits, i):
+    return bits[i >> 3] & (1 << (i & 7))
+
+
+def _encode_column(name_id, values, strings, absent=None):
+    kind = _column_kind(values)
+    first = values[0] if values else None
+    if values and first is not None and all(value == first and type(value) is type(first) for value in values):
+        layout, body = CONSTANT, _pack_values([first], kind, strings)
+    elif None in values:
+        layout, body = WITH_NULLS, _bitmap([value is None for value in values]) + _pack_values(values, kind, strings)
+    else:
+        layout, body = PLAIN, _pack_values(values, kind, strings)
+    if absent is not None:
+        layout, body = layout | ABSENT, absent + body
+    return COLUMN_HEADER.pack(name_id, kind, layout, len(body)) + body
+
+
+def _decode_column(kind, layout, body, count, strings):
+    """Column values; for an ABSENT layout the caller strips the absent bitmap first"""
+    if layout == CONSTANT:
+        return _unpack_values(body, kind, 1, strings) * count
+    if layout == PLAIN:
+        return _unpack_values(body, kind, count, strings)
+
+    null_bytes = (count + 7) // 8
+    return _unpack_values(body[null_bytes:], kind, count, strings, body[:null_bytes])
+
+
+# Nodes
+
+def _node_kind(value):
+    if isinstance(value, list) and value and all(isinstance(row, dict) for row in value):
+        return TABLE
+    if isinstance(value, dict) and value:
+        return KEYED if all(isinstance(row, dict) for row in value.values()) else NESTED
+    return DOC
+
+
+def _encode_table(rows, strings, keys=None):
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+
+    columns = []
+    if keys is not None:
+        # The key column of a keyed table has no name
+        columns.append(_encode_column(NO_NAME, keys, strings))
+    for name in names:
+        absent = [name not in row for row in rows]
+        columns.append(_encode_column(strings.intern(name), [row.get(name) for row in rows], strings,
+                                      _bitmap(absent) if any(absent) else None))
+    return U32.pack(len(rows)) + U16.pack(len(columns)) + b''.join(columns)
+
+
+def _encode_directory(entries, strings, compress=False):
+    """entries: [(name, mode, kind, body)] -> directory followed by the bodies"""
+    headers = []
+    bodies = []
+    offset = 0
+    for name, mode, kind, body in entries:
+        if compress and mode != REMOVE and len(body) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(body, 6)
+            if len(packed) < len(body):
+                body, mode = packed, mode | COMPRESSED
+        headers.append(ENTRY.pack(strings.intern(name), kind, mode, offset, len(body)))
+        bodies.append(body)
+        offset += len(body)
+    return U16.pack(len(headers)) + b''.join(headers) + b''.join(bodies)
+
+
+def _decode_directory(data, strings):
+    """{name: (kind, mode, body)} for a directory; compressed bodies are inflated on access"""
+    count = U16.unpack_from(data, 0)[0]
+    start = 2 + count * ENTRY.size
+    directory = {}
+    for i in range(count):
+        name_id, kind, mode, offset, length = ENTRY.unpack_from(data, 2 + i * ENTRY.size)
+        directory[strings[name_id]] = (kind, mode, data[start + offset:start + offset + length])
+    return directory
+
+
+def _body(mode, body):
+    return zlib.decompress(body) if mode & COMPRESSED else body
+
+
+def encode_node(value, strings):
+    """(kind, body) for a value"""
+    kind = _node_kind(value)
+    if kind == TABLE:
+        return kind, _encode_table(value, strings)
+    if kind == KEYED:
+        return kind, _encode_table(list(value.values()), strings, keys=list(value))
+    if kind == NESTED:
+        return kind, _encode_directory([(name, REPLACE) + encode_node(child, strings) for name, child in value.items()], strings)
+    return kind, _dump_json(value).encode()
+
+
+def _row_key(old, new):
+    """First KEY_FIELDS field present and unique in both lists of rows, or None"""
+    for field in KEY_FIELDS:
+        for rows in (old, new):
+            keys = [row.get(field) for row in rows]
+            if None in keys or len(set(map(_dump_json, keys))) != len(keys):
+                break
+        else:
+            return field
+    return None
+
+
+def encode_delta(old, new, strings):
+    """(mode, kind, body) turning old into new, or None when nothing changed"""
+    if old == new:
+        return None
+    kind = _node_kind(new)
+    if kind != _node_kind(old) or kind == DOC:
+        return (REPLACE,) + encode_node(new, strings)
+
+    if kind == NESTED:
+        entries = []
+        for name, child in new.items():
+            change = encode_delta(old[name], child, strings) if name in old else (REPLACE,) + encode_node(child, strings)
+            if change is not None:
+                entries.append((name,) + change)
+        entries.extend((name, REMOVE, DOC, b'') for name in old if name not in new)
+        return PATCH, kind, _encode_directory(entries, strings)
+
+    if kind == KEYED:
+        field = None
+        old_keys, new_keys = list(old), list(new)
+        upserts = [key for key in new_keys if old.get(key) != new[key]]
+        rows = [new[key] for key in upserts]
+    else:
+        field = _row_key(old, new)
+        if field is None:
+            return (REPLACE,) + encode_node(new, strings)
+        old_keys = [row[field] for row in old]
+        new_keys = [row[field] for row in new]
+        old_rows = {_dump_json(row[field]): row for row in old}
+        rows = [row for row in new if old_rows.get(_dump_json(row[field])) != row]
+        upserts = [row[field] for row in rows]
+
+    new_set = set(map(_dump_json, new_keys))
+    removed = [key for key in old_keys if _dump_json(key) not in new_set]
+    # Changed rows stay in place and new ones go last; ship the full order only when that is wrong
+    kept = [_dump_json(key) for key in old_keys if _dump_json(key) in new_set]
+    kept_set = set(kept)
+    expected = kept + [_dump_json(key) for key in upserts if _dump_json(key) not in kept_set]
+    order = new_keys if expected != [_dump_json(key) for key in new_keys] else []
+
+    body = b''.join([
+        U32.pack(NO_NAME if field is None else strings.intern(field)),
+        _encode_keys(removed, strings),
+        _encode_keys(order, strings),
+        _encode_table(rows, strings, keys=upserts if kind == KEYED else None)
+    ])
+    return PATCH, kind, body
+
+
+def _encode_keys(keys, strings):
+    return U32.pack(len(keys)) + _to_le(array.array('I', (strings.intern(_dump_json(key)) for key in keys)))
+
+
+def _decode_keys(data, offset, strings):
+    count = U32.unpack_from(data, offset)[0]
+    offset += 4
+    ids = _from_le('I', data[offset:offset + 4 * count])
+    return [json.loads(strings[i]) for i in ids], offset + 4 * count
+
+
+class Table:
+    """Columnar view of a table node; columns are decoded on first access"""
+
+    def __init__(self, data, strings, keyed=False):
+        self.strings = strings
+        self.keyed = keyed
+        self.n_rows = U32.unpack_from(data, 0)[0]
+        n_columns = U16.unpack_from(data, 4)[0]
+        self.keys = None
+        self._columns = {}
+        self._absent = {}
+        self._decoded = {}
+        offset = 6
+        for _ in range(n_columns):
+            name_id, kind, layout, length = COLUMN_HEADER.unpack_from(data, offset)
+            offset += COLUMN_HEADER.size
+            body = data[offset:offset + length]
+            offset += length
+            if layout & ABSENT:
+                absent_bytes = (self.n_rows + 7) // 8
+                absent, body, layout = body[:absent_bytes], body[absent_bytes:], layout & ~ABSENT
+            else:
+                absent = None
+            if name_id == NO_NAME:
+                self.keys = _decode_column(kind, layout, body, self.n_rows, strings)
+            else:
+                self._columns[strings[name_id]] = (kind, layout, body)
+                if absent is not None:
+                    self._absent[strings[name_id]] = absent
+
+    @property
+    def names(self):
+        return list(self._columns)
+
+    def column(self, name):
+        """Values of one field, None for rows without it"""
+        if name not in self._decoded:
+            self._decoded[name] = _decode_column(*self._columns[name], self.n_rows, self.strings)
+        return self._decoded[name]
+
+    def rows(self):
+        columns = [(name, self.column(name), self._absent.get(name)) for name in self._columns]
+        return [{name: values[i] for name, values, absent in columns if absent is None or not _bit(absent, i)}
+                for i in range(self.n_rows)]
+
+    def value(self):
+        rows = self.rows()
+        return dict(zip(self.keys, rows)) if self.keyed else rows
+
+
+def decode_node(kind, body, strings):
+    if kind in (TABLE, KEYED):
+        return Table(body, strings, keyed=(kind == KEYED)).value()
+    if kind == NESTED:
+        return {name: decode_node(child_kind, _body(mode, child), strings)
+                for name, (child_kind, mode, child) in _decode_directory(body, strings).items()}
+    return json.loads(str(body, 'utf-8'))
+
+
+def apply_node(mode, kind, old, body, strings):
+    """Value after applying one directory entry to old"""
+    if mode & ~COMPRESSED == REPLACE:
+        return decode_node(kind, _body(mode, body), strings)
+    body = _body(mode, body)
+
+    if kind == NESTED:
+        result = dict(old or {})
+        for name, (child_kind, child_mode, child) in _decode_directory(body, strings).items():
+            if child_mode == REMOVE:
+                result.pop(name, None)
+            else:
+                result[name] = apply_node(child_mode, child_kind, result.get(name), child, strings)
+        return result
+
+    field_id = U32.unpack_from(body, 0)[0]
+    removed, offset = _decode_keys(body, 4, strings)
+    order, offset = _decode_keys(body, offset, strings)
+    table = Table(body[offset:], strings, keyed=(kind == KEYED))
+
+    if kind == KEYED:
+        removed = set(removed)
+        result = {key: row for key, row in (old or {}).items() if key not in removed}
+        result.update(table.value())
+        if order:
+            result = {key: result[key] for key in order}
+        return result
+
+    field = strings[field_id]
+    removed = set(map(_dump_json, removed))
+    upserts = {_dump_json(row.get(field)): row for row in table.rows()}
+    result = []
+    for row in old or []:
+        key = _dump_json(row.get(field))
+        if key not in removed:
+            result.append(upserts.pop(key, row))
+    result.extend(upserts.values())
+    if order:
+        by_key = {_dump_json(row.get(field)): row for row in result}
+        result = [by_key[_dump_json(key)] for key in order]
+    return result
+
+
+# Records
+
+def _record(kind, payload, timestamp):
+    return RECORD_HEADER.pack(kind, timestamp, len(payload), zlib.crc32(payload)) + payload
+
+
+class SnapshotReader:
+    """
+    Lazy reader over the bytes of a snapshot file.
+
+    Only record headers, the string dictionary and section directories are
+    parsed up front; a section is decoded (and its deltas replayed) when
+    get() or table() asks for it.
+    """
+
+    def __init__(self, data):
+        data = memoryview(data)
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a snapshot file")
+
+        self.records = []
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, timestamp, length, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + length]
+            # A torn final write (crash mid-append) is ignored
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            if kind == FULL:
+                self.records = []
+            self.records.append((kind, timestamp, payload))
+            offset = start + length
+        # Bytes up to the end of the last valid record
+        self.size = offset
+
+        self.strings = []
+        self.directories = []
+        for _, _, payload in self.records:
+            count = U32.unpack_from(payload, 0)[0]
+            position = 4
+            for _ in range(count):
+                length = U32.unpack_from(payload, position)[0]
+                self.strings.append(str(payload[position + 4:position + 4 + length], 'utf-8'))
+                position += 4 + length
+            self.directories.append(_decode_directory(payload[position:], self.strings))
+
+        self._values = {}
+
+    @property
+    def timestamp(self):
+        return self.records[-1][1] if self.records else None
+
+    @property
+    def full_size(self):
+        """Bytes of the full record the current state starts from"""
+        return RECORD_HEADER.size + len(self.records[0][2]) if self.records else 0
+
+    def _latest(self, name):
+        for directory in reversed(self.directories):
+            if name in directory:
+                return directory[name]
+        return None
+
+    def sections(self):
+        names = {}
+        for directory in self.directories:
+            names.update(dict.fromkeys(directory))
+        return [name for name in names if self._latest(name)[1] != REMOVE]
+
+    def table(self, name):
+        """Columnar Table for a section whose latest write replaced it whole, else None"""
+        latest = self._latest(name)
+        if latest is None:
+            return None
+        kind, mode, body = latest
+        if kind in (TABLE, KEYED) and mode & ~COMPRESSED == REPLACE:
+            return Table(_body(mode, body), self.strings, keyed=(kind == KEYED))
+        return None
+
+    def get(self, name, default=None):
+        if name in self._values:
+            return self._values[name]
+
+        value, found = None, False
+        for directory in self.directories:
+            if name in directory:
+                kind, mode, body = directory[name]
+                found = mode != REMOVE
+                value = apply_node(mode, kind, value, body, self.strings) if found else None
+
+        if not found:
+            return default
+        self._values[name] = value
+        return value
+
+    def to_dict(self):
+        return {name: self.get(name) for name in self.sections()}
+
+
+def dumps(snapshot, timestamp=None):
+    """Encode a snapshot as the bytes of a one-record snapshot file"""
+    strings = StringTable()
+    sections = _encode_directory([(name, REPLACE) + encode_node(value, strings) for name, value in snapshot.items()],
+                                 strings, compress=True)
+    payload = strings.encode_new() + sections
+    return MAGIC + _record(FULL, payload, time.time() if timestamp is None else timestamp)
+
+
+def loads(data):
+    return SnapshotReader(data).to_dict()
+
+
+class SnapshotFile:
+    """
+    Append-only snapshot file at path.
+
+    write() appends the difference to the previous write (or starts a new
+    file with a full record); read() returns a lazy SnapshotReader. Writers
+    in several processes serialize on an exclusive lock of path + ".lock",
+    which survives the file being replaced by a compaction.
+    """
+
+    def __init__(self, path, compact_ratio=COMPACT_RATIO):
+        self.path = path
+        self.compact_ratio = compact_ratio
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return SnapshotReader(data) if data else None
+
+    def write(self, snapshot, timestamp=None):
+        """Store snapshot; returns the number of bytes written"""
+        timestamp = time.time() if timestamp is None else timestamp
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with open(f"{self.path}.lock", 'ab') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._write_locked(snapshot, timestamp)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_locked(self, snapshot, timestamp):
+        try:
+            reader = self.read()
+        except ValueError:
+            reader = None
+
+        if reader is None or not reader.records or reader.size > self.compact_ratio * reader.full_size:
+            return self._rewrite(snapshot, timestamp)
+
+        strings = StringTable(reader.strings)
+        previous = reader.to_dict()
+        sections = []
+        for name, value in snapshot.items():
+            change = encode_delta(previous[name], value, strings) if name in previous \
+                else (REPLACE,) + encode_node(value, strings)
+            if change is not None:
+                sections.append((name,) + change)
+        sections.extend((name, REMOVE, DOC, b'') for name in previous if name not in snapshot)
+        if not sections:
+            # Nothing changed; the modification time (always the last write's timestamp) still tells readers it was current
+            os.utime(self.path, (timestamp, timestamp))
+            return 0
+
+        directory = _encode_directory(sections, strings, compress=True)
+        record = _record(DELTA, strings.encode_new() + directory, timestamp)
+        with open(self.path, 'r+b') as f:
+            # Anything past the last valid record is a torn write; overwrite it
+            f.seek(reader.size)
+            f.write(record)
+            f.truncate()
+        os.utime(self.path, (timestamp, timestamp))
+        return len(record)
+
+    def _rewrite(self, snapshot, timestamp):
+        data = dumps(snapshot, timestamp)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.utime(tmp, (timestamp, timestamp))
+        os.replace(tmp, self.path)
+        return len(data)
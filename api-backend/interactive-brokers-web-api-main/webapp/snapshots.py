@@ -0,0 +1,82 @@
+import logging, os, threading, time
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', '15'))
+# Stop refreshing an account nobody has looked at for this long; it restarts on the next read
+SNAPSHOT_IDLE_SECONDS = float(os.environ.get('SNAPSHOT_IDLE_SECONDS', '600'))
+
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+class SnapshotRefresher:
+    """
+    Rebuilds a snapshot in the background every interval seconds.
+
+    build() returns (snapshot, error). A new snapshot replaces the old one in
+    a single assignment, so readers always see a complete snapshot; when a
+    rebuild fails the previous snapshot is kept and simply gets older.
+    """
+
+    def __init__(self, build, interval=DASHBOARD_REFRESH_SECONDS):
+        self.build = build
+        self.interval = interval
+        # (snapshot, built_at), swapped as one reference
+        self.state = None
+        self.last_error = None
+        self.last_read = time.time()
+        self.refresh_lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.last_read = time.time()
+            self.thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while time.time() - self.last_read < SNAPSHOT_IDLE_SECONDS:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+        logger.info("Snapshot refresher idle, stopping")
+
+    def refresh(self):
+        with self.refresh_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        snapshot, error = self.build()
+        if error:
+            self.last_error = error
+            logger.warning(f"Snapshot rebuild failed: {error}")
+            return
+        self.state = (snapshot, time.time())
+        self.last_error = None
+
+    def get(self):
+        """Return (snapshot, age_seconds, error); builds synchronously on first use"""
+        self.last_read = time.time()
+        if self.state is None:
+            with self.refresh_lock:
+                # Concurrent first readers wait for one build instead of each starting one
+                if self.state is None:
+                    self._rebuild()
+        state = self.state
+        if state is None:
+            return None, None, self.last_error
+        snapshot, built_at = state
+        return snapshot, round(time.time() - built_at, 3), None
+
+
+def get_refresher(key, build, interval=DASHBOARD_REFRESH_SECONDS):
+    """Return the running refresher for key, starting it if needed"""
+    with _refreshers_lock:
+        refresher = _refreshers.get(key)
+        if refresher is None:
+            refresher = _refreshers[key] = SnapshotRefresher(build, interval)
+        refresher.start()
+        return refresher
@@ -0,0 +1,24 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def extract_cash_value(summary):
+    """Dig the cash balance out of the different summary formats the gateway returns"""
+    if not isinstance(summary, dict):
+        logger.error(f"Unexpected summary format: {type(summary)}")
+        return 0
+
+    # Check for nested cash values in the response
+    if 'settledcash' in summary and isinstance(summary['settledcash'], dict) and 'amount' in summary['settledcash']:
+        return float(summary['settledcash']['amount'])
+    elif 'settledcash-s' in summary and isinstance(summary['settledcash-s'], dict) and 'amount' in summary['settledcash-s']:
+        return float(summary['settledcash-s']['amount'])
+    # Check traditional format
+    elif 'totalcashvalue' in summary and isinstance(summary['totalcashvalue'], dict) and 'amount' in summary['totalcashvalue']:
+        return float(summary['totalcashvalue']['amount'])
+    elif 'totalCashValue' in summary:
+        return summary['totalCashValue']
+
+    logger.warning("Could not find cash value in summary response")
+    return summary.get('AvailableFunds', 0)
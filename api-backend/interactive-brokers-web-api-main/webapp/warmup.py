@@ -0,0 +1,159 @@
+import logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1') == '1'
+WARMUP_POLL_SECONDS = float(os.environ.get('WARMUP_POLL_SECONDS', '5'))
+# Steps registered with refresh=True rerun this often while the webapp is ready
+WARMUP_REFRESH_SECONDS = float(os.environ.get('WARMUP_REFRESH_SECONDS', '60'))
+# The warming worker renews its lease every poll; another worker takes over once it lapses
+WARMUP_LEASE_SECONDS = WARMUP_POLL_SECONDS * 3
+
+# name -> fn(BASE_API_URL) returning an error string or None
+tasks = {}
+# Names of the steps that keep their caches hot after warm-up
+refresh_tasks = set()
+
+_warmers = {}
+_warmers_lock = threading.Lock()
+
+
+def task(name, refresh=False):
+    """
+    Register a warm-up step; all steps run in parallel once the gateway is
+    authenticated. refresh steps also rerun every WARMUP_REFRESH_SECONDS.
+    """
+    def decorator(fn):
+        tasks[name] = fn
+        if refresh:
+            refresh_tasks.add(name)
+        return fn
+    return decorator
+
+
+class Warmer:
+    """
+    Waits for the gateway session, preloads the registered caches, then keeps
+    watching the session so readiness drops (and warm-up reruns) after a logout.
+
+    Every worker runs the loop, but only the one holding the shared lease
+    talks to the gateway; it publishes its status in the shared cache, and
+    /ready in any worker answers from there.
+    """
+
+    def __init__(self, base_api_url, check_auth):
+        self.base_api_url = base_api_url
+        self.check_auth = check_auth
+        self.key = f"warmup:{base_api_url}"
+        self.state = "waiting_for_gateway"
+        self.results = {}
+        self.warmed_at = None
+        self.refreshed_at = None
+        # Expiry of this worker's lease while it is the one warming
+        self.lease = None
+        self.thread = None
+
+    @property
+    def ready(self):
+        return self.status()["ready"]
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Warm-up failed")
+            time.sleep(WARMUP_POLL_SECONDS)
+
+    def tick(self):
+        """One pass of the loop; does nothing while another worker holds the lease"""
+        held = self.lease is not None
+        self.lease = shared_cache.hold_lease(self.key, WARMUP_LEASE_SECONDS, self.lease)
+        if self.lease is None:
+            return
+        if not held:
+            # Another worker may have warmed meanwhile; start over rather than trust old local state
+            self.state = "waiting_for_gateway"
+
+        if not self.check_auth(self.base_api_url):
+            if self.state != "waiting_for_gateway":
+                logger.warning("Gateway session lost, webapp no longer ready")
+            self._set_state("waiting_for_gateway")
+        elif self.state != "ready":
+            self.warm()
+        elif time.time() - self.refreshed_at >= WARMUP_REFRESH_SECONDS:
+            self.refresh()
+        else:
+            self._publish()
+
+    def _run_tasks(self, names):
+        def run(name):
+            try:
+                return tasks[name](self.base_api_url)
+            except Exception as e:
+                logger.exception(f"Warm-up step {name} failed")
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as pool:
+            errors = list(pool.map(run, names))
+        return {name: error or "ok" for name, error in zip(names, errors)}
+
+    def warm(self):
+        self._set_state("warming")
+        started = time.time()
+
+        self.results = self._run_tasks(list(tasks))
+        if any(result != "ok" for result in self.results.values()):
+            logger.warning(f"Warm-up incomplete, retrying: {self.results}")
+            self._set_state("waiting_for_gateway")
+            return
+
+        self.warmed_at = self.refreshed_at = time.time()
+        self._set_state("ready")
+        logger.info(f"Warm-up finished in {self.warmed_at - started:.2f}s: {self.results}")
+
+    def refresh(self):
+        """Rerun the refresh steps; a failure leaves the webapp ready and is retried next interval"""
+        self.refreshed_at = time.time()
+        results = self._run_tasks(sorted(refresh_tasks))
+        if any(result != "ok" for result in results.values()):
+            logger.warning(f"Warm-up refresh incomplete: {results}")
+        self.results.update(results)
+        self._publish()
+
+    def _set_state(self, state):
+        self.state = state
+        self._publish()
+
+    def _publish(self):
+        shared_cache.put(self.key, {
+            "ready": self.state == "ready",
+            "state": self.state,
+            "steps": self.results,
+            "warmedAt": self.warmed_at,
+            "refreshedAt": self.refreshed_at
+        }, WARMUP_LEASE_SECONDS)
+
+    def status(self):
+        status = shared_cache.get(self.key)
+        if status is None:
+            return {"ready": False, "state": "waiting_for_gateway", "steps": {}, "warmedAt": None, "refreshedAt": None}
+        return status
+
+
+def get_warmer(base_api_url, check_auth):
+    """Return the warmer for a gateway, starting it if needed"""
+    with _warmers_lock:
+        warmer = _warmers.get(base_api_url)
+        if warmer is None:
+            warmer = _warmers[base_api_url] = Warmer(base_api_url, check_auth)
+        if WARMUP_ENABLED:
+            warmer.start()
+        return warmer
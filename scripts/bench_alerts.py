@@ -0,0 +1,137 @@
+"""
+Cost per price tick of the alert engine with many registered alerts.
+
+Registers ALERTS alerts (a mix of above, below and move_pct) spread over
+CONIDS conids, then feeds random-walk ticks through the index and through
+the engine (index plus the SQLite claim of triggered alerts). A last case
+puts every alert on one conid and moves its price far enough to cross a
+large share of them in a single tick, the worst case for the index. The
+sync case runs two engines on one store, like two worker processes, and
+times how long one takes to catch up after the other claims alerts.
+
+    python scripts/bench_alerts.py [alerts] [conids] [ticks]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api-backend', 'interactive-brokers-web-api-main', 'webapp')
+sys.path.insert(0, WEBAPP_DIR)
+import alerts
+
+ALERTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+CONIDS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+TICKS = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+
+
+def definitions(prices, rng):
+    conids = list(prices)
+    for _ in range(ALERTS):
+        conid = rng.choice(conids)
+        price = prices[conid]
+        kind = rng.choice(alerts.KINDS)
+        if kind == 'above':
+            yield {"conid": conid, "kind": kind, "level": price * rng.uniform(1.001, 1.2)}
+        elif kind == 'below':
+            yield {"conid": conid, "kind": kind, "level": price * rng.uniform(0.8, 0.999)}
+        else:
+            yield {"conid": conid, "kind": kind, "pct": rng.uniform(0.5, 15), "reference": price}
+
+
+def ticks(prices, rng, count):
+    conids = list(prices)
+    for _ in range(count):
+        conid = rng.choice(conids)
+        prices[conid] *= 1 + rng.gauss(0, 0.002)
+        yield conid, prices[conid]
+
+
+def bench_index(rng):
+    prices = {str(conid): rng.uniform(5, 500) for conid in range(CONIDS)}
+    index = alerts.AlertIndex()
+    start = time.perf_counter()
+    for alert_id, alert in enumerate(definitions(prices, rng)):
+        index.add(alert_id, alert['conid'], *alerts.thresholds(alert['kind'], alert.get('level'), alert.get('pct'), alert.get('reference')))
+    build = time.perf_counter() - start
+
+    triggered = 0
+    start = time.perf_counter()
+    for conid, price in ticks(prices, rng, TICKS):
+        triggered += len(index.evaluate(conid, price))
+    elapsed = time.perf_counter() - start
+    print(f"index:  {ALERTS} alerts on {CONIDS} conids built in {build * 1000:.0f}ms; "
+          f"{TICKS} ticks in {elapsed * 1000:.0f}ms = {elapsed / TICKS * 1e6:.2f}us/tick, {triggered} triggered")
+
+
+def bench_engine(rng):
+    prices = {str(conid): rng.uniform(5, 500) for conid in range(CONIDS)}
+    with tempfile.TemporaryDirectory() as directory:
+        engine = alerts.AlertEngine(os.path.join(directory, 'alerts.sqlite3'))
+        start = time.perf_counter()
+        engine.create(list(definitions(prices, rng)))
+        create = time.perf_counter() - start
+
+        # One snapshot response covers every conid, like the alert poller's batched request
+        batches = max(1, TICKS // CONIDS)
+        triggered = 0
+        start = time.perf_counter()
+        for _ in range(batches):
+            batch = dict(ticks(prices, rng, CONIDS))
+            triggered += len(engine.evaluate(batch))
+        elapsed = time.perf_counter() - start
+        count = batches * CONIDS
+        print(f"engine: {ALERTS} alerts stored in {create * 1000:.0f}ms; "
+              f"{count} ticks in {elapsed * 1000:.0f}ms = {elapsed / count * 1e6:.2f}us/tick, {triggered} triggered")
+
+
+def bench_gap(rng):
+    prices = {"0": 100.0}
+    index = alerts.AlertIndex()
+    for alert_id, alert in enumerate(definitions(prices, rng)):
+        index.add(alert_id, alert['conid'], *alerts.thresholds(alert['kind'], alert.get('level'), alert.get('pct'), alert.get('reference')))
+
+    for move in (1.05, 0.7):
+        start = time.perf_counter()
+        triggered = len(index.evaluate("0", 100.0 * move))
+        elapsed = time.perf_counter() - start
+        print(f"gap:    {move - 1:+.0%} move on one conid crossed {triggered} alerts in {elapsed * 1000:.1f}ms, {len(index)} left")
+
+
+def bench_sync(rng):
+    prices = {str(conid): rng.uniform(5, 500) for conid in range(CONIDS)}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'alerts.sqlite3')
+        worker_a = alerts.AlertEngine(path)
+        worker_b = alerts.AlertEngine(path)
+        worker_a.create(list(definitions(prices, rng)))
+
+        start = time.perf_counter()
+        worker_b.sync()
+        print(f"sync:   first load of {len(worker_b.index)} alerts in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+        # Worker A claims the alerts of one tick batch at a time; B catches up before its next tick
+        elapsed, rounds, claimed = 0.0, 50, 0
+        for _ in range(rounds):
+            claimed += len(worker_a.evaluate(dict(ticks(prices, rng, CONIDS))))
+            start = time.perf_counter()
+            worker_b.sync()
+            elapsed += time.perf_counter() - start
+        print(f"sync:   {rounds} catch-ups after {claimed} claims by another worker in {elapsed * 1000:.0f}ms = "
+              f"{elapsed / rounds * 1000:.2f}ms each, {len(worker_b.index)} left")
+
+        # A big move on every conid claims a large share at once
+        start_count = len(worker_b.index)
+        worker_a.evaluate({conid: price * 1.1 for conid, price in prices.items()})
+        start = time.perf_counter()
+        worker_b.sync()
+        print(f"sync:   catch-up after a +10% move on every conid ({start_count - len(worker_b.index)} claims) "
+              f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    bench_index(random.Random(1))
+    bench_engine(random.Random(1))
+    bench_gap(random.Random(1))
+    bench_sync(random.Random(1))
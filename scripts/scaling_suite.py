@@ -0,0 +1,295 @@
+"""
+Scaling and memory suite for the webapp's portfolio transforms.
+
+Generates synthetic accounts with 10, 1k, 10k and 100k positions (and as
+many allocation categories and summary fields), serves them through a fake
+gateway, and measures each page and its template render:
+
+- wall time of a warm request (best of --repeat runs)
+- peak and retained memory of one request under tracemalloc
+- net allocated blocks left behind by one request
+
+Page routes are also measured in JSON mode (Accept: application/json).
+
+Results are compared with scripts/scaling_budgets.json and the script exits
+with status 1 when any budget is exceeded, so a quadratic path shows up as a
+failed run long before a large client account hits it.
+
+    python scripts/scaling_suite.py                  # check against the budgets
+    python scripts/scaling_suite.py --sizes 10,1000  # smaller run
+    python scripts/scaling_suite.py --record         # write new budgets from this machine
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api-backend', 'interactive-brokers-web-api-main', 'webapp')
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scaling_budgets.json')
+SIZES = [10, 1000, 10000, 100000]
+# Recorded budgets leave this much headroom over the measured values
+TIME_HEADROOM = 3.0
+MEMORY_HEADROOM = 1.5
+# Small budgets are dominated by noise; never record less than these
+MIN_SECONDS = 0.05
+MIN_MB = 1.0
+
+# Isolated caches and no background gateway traffic for the app under test
+os.environ['WEBAPP_CACHE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='scaling-suite-'), 'cache.sqlite3')
+os.environ['WARMUP_ENABLED'] = '0'
+os.environ.pop('GATEWAY_POOL', None)
+sys.path.insert(0, WEBAPP_DIR)
+
+import flask
+import app as webapp
+import app_fixed
+import shared_cache
+
+BASE_API_URL = "https://localhost:5055/v1/api"
+SECTORS = ["Technology", "Financial", "Energy", "Healthcare", "Industrials", "Utilities", "Consumer", "Materials"]
+ASSET_CLASSES = ["STK", "OPT", "FUT", "BOND", "CASH", "FUND"]
+
+
+def make_positions(n, rng):
+    positions = []
+    for i in range(n):
+        quantity = rng.choice([-1, 1]) * rng.randint(1, 5000)
+        price = round(rng.uniform(1, 900), 2)
+        cost = round(price * rng.uniform(0.6, 1.4), 4)
+        positions.append({
+            "acctId": f"S{n}",
+            "conid": 100000 + i,
+            "contractDesc": f"SYM{i}",
+            "description": f"SYM{i}",
+            "name": f"Synthetic Instrument {i}",
+            "position": quantity,
+            "mktPrice": price,
+            "marketPrice": price,
+            "mktValue": round(quantity * price, 2),
+            "marketValue": round(quantity * price, 2),
+            "avgCost": cost,
+            "avgPrice": cost,
+            "unrealizedPnl": round(quantity * (price - cost), 2),
+            "realizedPnl": 0.0,
+            "currency": "USD",
+            "assetClass": ASSET_CLASSES[i % len(ASSET_CLASSES)],
+            "secType": ASSET_CLASSES[i % len(ASSET_CLASSES)],
+            "sector": SECTORS[i % len(SECTORS)],
+            "group": f"Group {i}",
+            "listingExchange": "NASDAQ",
+        })
+    return positions
+
+
+def make_allocation(n, rng):
+    """Allocation with n categories per breakdown, each held both long and short"""
+    def breakdown(prefix):
+        names = [f"{prefix} {i}" for i in range(n)]
+        return {"long": {name: round(rng.uniform(1, 1e6), 2) for name in names},
+                "short": {name: -round(rng.uniform(1, 1e5), 2) for name in reversed(names)}}
+
+    return {"assetClass": breakdown("Class"), "sector": breakdown("Sector"), "group": breakdown("Group")}
+
+
+def make_summary(n, rng):
+    """Summary with n fields spread over the account, cash, -s and -c categories"""
+    suffixes = ["", "-s", "-c", "cash", "value"]
+    summary = {}
+    for i in range(n):
+        summary[f"field{i}{suffixes[i % len(suffixes)]}"] = {"amount": round(rng.uniform(0, 1e6), 2), "currency": "USD",
+                                                             "isNull": False, "timestamp": 1700000000000, "value": None}
+    return summary
+
+
+class FakeGateway:
+    def __init__(self):
+        self.data = {}
+
+    def load(self, n):
+        rng = random.Random(n)
+        account = f"S{n}"
+        self.data = {
+            "/portfolio/accounts": [{"id": account, "accountId": account, "currency": "USD", "type": "INDIVIDUAL"}],
+            f"/portfolio2/{account}/positions": make_positions(n, rng),
+            f"/portfolio/{account}/allocation": make_allocation(n, rng),
+            f"/portfolio/{account}/summary": make_summary(n, rng),
+        }
+        # The accounts list is cached under the same URL for every size
+        shared_cache.delete(f"api:{BASE_API_URL}/portfolio/accounts")
+
+    def request(self, url, method='get', **kwargs):
+        path = url[len(BASE_API_URL):].split('?')[0]
+        if path in self.data:
+            return self.data[path], None
+        return None, "empty_response"
+
+
+def measure(fn, repeat):
+    """Best wall time over repeat runs, then peak/retained memory and net blocks of one traced run"""
+    fn()  # warm caches and compiled templates
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    return {
+        "seconds": round(min(timings), 4),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "retained_mb": round(retained / 2 ** 20, 2),
+        "blocks": sys.getallocatedblocks() - blocks,
+    }
+
+
+def page(client, path, headers=None):
+    def fn():
+        response = client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return response
+    return fn
+
+
+def render(path, template_name, context):
+    """Re-render one page template with the context the route passed to it"""
+    def fn():
+        with webapp.app.test_request_context(path):
+            return flask.render_template(template_name, **context)
+    return fn
+
+
+def capture_template(client, path):
+    rendered = []
+
+    def record(sender, template, context, **extra):
+        rendered.append((template.name, {k: v for k, v in context.items() if k not in ('g', 'request', 'session', 'config')}))
+
+    with flask.template_rendered.connected_to(record, webapp.app):
+        page(client, path)()
+    return rendered[-1]
+
+
+def cases(size):
+    client = webapp.app.test_client()
+    fixed_client = app_fixed.app.test_client()
+    for name, path in (("positions", "/positions"), ("portfolio_allocation", "/allocation"),
+                       ("api_allocation", "/api/allocation"), ("account_summary", "/summary")):
+        yield name, page(client, path)
+        if not path.startswith("/api/"):
+            template_name, context = capture_template(client, path)
+            yield f"{name}:render {template_name}", render(path, template_name, context)
+            # The same page in JSON mode skips the template entirely
+            yield f"{name}:json", page(client, path, {"Accept": "application/json"})
+    yield "app_fixed.get_allocation", page(fixed_client, "/api/allocation")
+
+
+def run(sizes, repeat=3, only=None, verbose=False):
+    """Measure every case at each size against a fake gateway; {case: {size: result}}"""
+    # The routes log whole payloads at INFO; keep the cost of building the messages but not the output
+    logging.disable(logging.WARNING)
+    gateway = FakeGateway()
+    webapp.safe_api_request = gateway.request
+    app_fixed.extract_positions_data = lambda: gateway.data[f"/portfolio2/{gateway.data['/portfolio/accounts'][0]['id']}/positions"]
+
+    results = {}
+    for size in sizes:
+        gateway.load(size)
+        for name, fn in cases(size):
+            if only and only not in name:
+                continue
+            result = measure(fn, repeat)
+            results.setdefault(name, {})[size] = result
+            if verbose:
+                print(f"{name:45} {size:>7}  {result['seconds'] * 1000:9.1f}ms  peak {result['peak_mb']:8.2f}MB  "
+                      f"retained {result['retained_mb']:7.2f}MB  blocks {result['blocks']:+8d}", flush=True)
+    return results
+
+
+def load_budgets():
+    if not os.path.exists(BUDGETS_PATH):
+        return {}
+    with open(BUDGETS_PATH) as f:
+        return json.load(f)
+
+
+def check(results, budgets):
+    failures = []
+    for name, by_size in results.items():
+        for size, result in by_size.items():
+            budget = budgets.get(name, {}).get(str(size))
+            if budget is None:
+                continue
+            for metric in ("seconds", "peak_mb"):
+                if result[metric] > budget[metric]:
+                    failures.append(f"{name} @ {size}: {metric} {result[metric]} > budget {budget[metric]}")
+    return failures
+
+
+def record(results, budgets):
+    for name, by_size in results.items():
+        for size, result in by_size.items():
+            budgets.setdefault(name, {})[str(size)] = {
+                "seconds": round(max(result["seconds"] * TIME_HEADROOM, MIN_SECONDS), 3),
+                "peak_mb": round(max(result["peak_mb"] * MEMORY_HEADROOM, MIN_MB), 1),
+            }
+    with open(BUDGETS_PATH, 'w') as f:
+        json.dump(budgets, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def growth(by_size):
+    """Time exponent between the two largest sizes: ~1 linear, ~2 quadratic"""
+    sizes = sorted(by_size)
+    if len(sizes) < 2:
+        return ""
+    small, large = sizes[-2], sizes[-1]
+    if by_size[small]["seconds"] <= 0:
+        return ""
+    import math
+    exponent = math.log(max(by_size[large]["seconds"], 1e-6) / by_size[small]["seconds"]) / math.log(large / small)
+    return f"  growth n^{exponent:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--record", action="store_true", help="write budgets from this run instead of checking them")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(",")], args.repeat, args.only, verbose=True)
+
+    print()
+    for name, by_size in results.items():
+        print(f"{name:45} {growth(by_size)}")
+
+    budgets = load_budgets()
+    if args.record:
+        record(results, budgets)
+        print(f"\nBudgets written to {BUDGETS_PATH}")
+        return 0
+
+    failures = check(results, budgets)
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    print(f"\n{len(failures)} budget(s) exceeded" if failures else "\nAll within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,67 @@
 import requests
 import re
 import json
+import os
+import sys
+import time
+
+# The webapp stores each account's raw data as compact binary snapshots; read them directly when available
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api-backend', 'interactive-brokers-web-api-main', 'webapp')
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(WEBAPP_DIR, 'data', 'snapshots'))
+# A snapshot older than this is from a webapp that stopped refreshing; ask the live webapp instead
+SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', '120'))
+sys.path.insert(0, WEBAPP_DIR)
+import snapshot_file
+# Same cash rule as the dashboard, so every path reports the same cash and net liquidation
+from summary_values import extract_cash_value
+
+def summarize(cash_value, positions_data):
+    # Calculate summary
+    total_market_value = sum(float(pos.get('marketValue', 0)) for pos in positions_data)
+    total_unrealized_pnl = sum(float(pos.get('unrealizedPnl', 0)) for pos in positions_data)
+
+    return {
+        'cash': cash_value,
+        'positions': positions_data,
+        'total_market_value': total_market_value,
+        'total_unrealized_pnl': total_unrealized_pnl,
+        'net_liquidation': cash_value + total_market_value
+    }
+
+def get_snapshot_data(account_id, max_age=SNAPSHOT_MAX_AGE):
+    """Read account_id's webapp snapshot; None when there is none or it is older than max_age seconds"""
+    if not account_id:
+        return None
+    path = os.path.join(SNAPSHOT_DIR, f"{account_id}.snap")
+
+    try:
+        reader = snapshot_file.SnapshotFile(path).read()
+        # A refresh that changed nothing only touches the file
+        updated_at = max(reader.timestamp or 0, os.path.getmtime(path)) if reader is not None else None
+    except (OSError, ValueError) as e:
+        print("Snapshot read error:", str(e))
+        return None
+    if updated_at is None or time.time() - updated_at > max_age:
+        return None
+
+    # Only the two sections needed here are decoded
+    return summarize(float(extract_cash_value(reader.get('summary') or {}) or 0), reader.get('positions') or [])
+
+def get_json_data():
+    """Ask the webapp pages for their data as JSON; None when the webapp only answers in HTML"""
+    headers = {'Accept': 'application/json'}
+    try:
+        dashboard_response = requests.get('http://localhost:8080/', headers=headers, timeout=10)
+        positions_response = requests.get('http://localhost:8080/positions', headers=headers, timeout=10)
+        if 'json' not in dashboard_response.headers.get('Content-Type', '') or not positions_response.ok:
+            return None
+
+        dashboard = dashboard_response.json()
+        cash_value = float((dashboard.get('snapshot') or {}).get('cash') or 0)
+        return summarize(cash_value, positions_response.json().get('positions') or [])
+    except Exception as e:
+        print("Web JSON error:", str(e))
+        return None
 
 def get_web_data():
     try:
@@ -24,21 +85,13 @@ def get_web_data():
         else:
             positions_data = []
         
-        # Calculate summary
-        total_market_value = sum(float(pos.get('marketValue', 0)) for pos in positions_data)
-        total_unrealized_pnl = sum(float(pos.get('unrealizedPnl', 0)) for pos in positions_data)
-        
-        return {
-            'cash': cash_value,
-            'positions': positions_data,
-            'total_market_value': total_market_value,
-            'total_unrealized_pnl': total_unrealized_pnl,
-            'net_liquidation': cash_value + total_market_value
-        }
+        return summarize(cash_value, positions_data)
     except Exception as e:
         print("Web scraping error:", str(e))
         return None
 
 if __name__ == "__main__":
-    data = get_web_data()
+    # python web_scraper.py [account]; the snapshot is only used for an explicit account
+    account = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('IBKR_ACCOUNT_ID')
+    data = get_snapshot_data(account) or get_json_data() or get_web_data()
     print(json.dumps(data, indent=2))